@@ -10,8 +10,10 @@ class UserMessage:
         self.text = text
 
 class LlmChat:
-    def __init__(self, api_key: str, session_id: str = None, system_message: str = None):
+    def __init__(self, api_key: str, session_id: str = None, system_message: str = None, http_client: Optional[httpx.AsyncClient] = None):
+        """http_client: shared, already-open client to send through (a new one per message when omitted)"""
         self.api_key = api_key
+        self.http_client = http_client
         self.session_id = session_id
         self.system_message = system_message
         self.provider = "openai"  # default
@@ -69,30 +71,35 @@ class LlmChat:
 
             logger.info(f"Using LlmChat shim with URL: {url}...")
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=headers, json=body, timeout=40.0)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    # Handle OpenAI format
-                    if "choices" in data:
-                        return data['choices'][0]['message']['content']
-                    # Handle Custom format
-                    return data.get('reply') or data.get('text') or str(data)
-                elif response.status_code == 404:
-                     # Try fallback URL if 404
-                     fallback_url = "https://api.emergent.sh/v1/chat/completions"
-                     logger.warning(f"404 on {url}, retrying {fallback_url}")
-                     response = await client.post(fallback_url, headers=headers, json=body, timeout=40.0)
-                     if response.status_code == 200:
-                         data = response.json()
-                         return data['choices'][0]['message']['content']
-                
-                logger.error(f"LlmChat Error: {response.status_code} - {response.text}")
-                # Return None to trigger fallback mechanism in agent
-                return None
+            if self.http_client is not None:
+                return await self._post(self.http_client, url, headers, body)
+            async with httpx.AsyncClient(timeout=40.0) as client:
+                return await self._post(client, url, headers, body)
                 
         except Exception as e:
             logger.error(f"LlmChat Exception: {e}")
             # Return None to trigger fallback mechanism in agent
             return None
+
+    async def _post(self, client: httpx.AsyncClient, url: str, headers: Dict[str, str], body: Dict[str, Any]) -> Optional[str]:
+        response = await client.post(url, headers=headers, json=body)
+        
+        if response.status_code == 200:
+            data = response.json()
+            # Handle OpenAI format
+            if "choices" in data:
+                return data['choices'][0]['message']['content']
+            # Handle Custom format
+            return data.get('reply') or data.get('text') or str(data)
+        elif response.status_code == 404:
+             # Try fallback URL if 404
+             fallback_url = "https://api.emergent.sh/v1/chat/completions"
+             logger.warning(f"404 on {url}, retrying {fallback_url}")
+             response = await client.post(fallback_url, headers=headers, json=body)
+             if response.status_code == 200:
+                 data = response.json()
+                 return data['choices'][0]['message']['content']
+        
+        logger.error(f"LlmChat Error: {response.status_code} - {response.text}")
+        # Return None to trigger fallback mechanism in agent
+        return None
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, BackgroundTasks, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -6,7 +7,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, ValidationError
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
@@ -15,6 +16,10 @@ import jwt
 import random
 import string
 import asyncio
+import json
+import time
+import hashlib
+import hmac
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -41,6 +46,9 @@ EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY', '')
 EMAIL_PROVIDER = os.environ.get('EMAIL_PROVIDER', 'RESEND')  # RESEND or BREVO
 EMAIL_API_KEY = os.environ.get('EMAIL_API_KEY', '')
 EMAIL_SENDER = os.environ.get('EMAIL_SENDER', 'Miraii Health <noreply@miraii.app>')
+# Failover chain, e.g. EMAIL_PROVIDERS=RESEND,BREVO with EMAIL_API_KEY_RESEND / EMAIL_API_KEY_BREVO
+EMAIL_PROVIDERS = [p.strip().upper() for p in os.environ.get('EMAIL_PROVIDERS', EMAIL_PROVIDER).split(',') if p.strip()]
+EMAIL_API_KEYS = {p: os.environ.get(f'EMAIL_API_KEY_{p}', EMAIL_API_KEY) for p in EMAIL_PROVIDERS}
 
 # Firebase configuration
 FIREBASE_API_KEY = os.environ.get('FIREBASE_API_KEY', '')
@@ -50,6 +58,9 @@ FIREBASE_PROJECT_ID = os.environ.get('FIREBASE_PROJECT_ID', '')
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', '')
 GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET', '')
 
+# Operational /api/status/* endpoints: callers send it as X-Status-Key; they answer 404 when unset
+STATUS_API_KEY = os.environ.get('STATUS_API_KEY', '')
+
 # Create the main app
 app = FastAPI(title="Miraii Smart Ring API", version="2.0.0")
 
@@ -64,6 +75,74 @@ from routers.sos import router as sos_router
 api_router.include_router(elai_router)
 api_router.include_router(sos_router)
 
+# Shared services
+from services.metric_ingest import (
+    METRICS_BATCH_MAX_SAMPLES,
+    METRICS_BATCH_CHUNK_SIZE,
+    chunked,
+    write_metrics,
+    MetricWriteBuffer,
+    IngestBufferFull,
+)
+from services.metrics_store import (
+    metric_filter,
+    from_storage,
+    ensure_metrics_collection,
+)
+from services.latest_vitals import get_latest_vitals, clear_latest_vitals, as_utc
+from services.sos import load_sos_context, merge_sos_contacts, write_sos_incident
+from services.sos_dispatch import sos_dispatcher, plan_deliveries, EmailChannelAdapter
+from services.metric_rollups import (
+    ROLLUP_RESOLUTIONS,
+    pick_resolution,
+    get_rollup_series,
+)
+from services.downsample import downsample_rows
+from services.db_indexes import apply_indexes
+from services.vitals_pubsub import vitals_pubsub, format_sse
+from services.cache import user_cache, session_cache
+from services.http_clients import http_clients
+from services.email_outbox import EmailOutbox, fake_email_provider
+from services.email_providers import PERMANENT_STATUS, ProviderRouter
+from services.email_templates import (
+    render_otp_email,
+    render_password_reset_email,
+    render_daily_summary_email,
+    render_daily_summary_body,
+    render_daily_summary_recipient,
+    personalize
+)
+from services.daily_stats import daily_stats_batch, summary_sections
+from services.daily_summary_scheduler import (
+    DAILY_SUMMARY_SCHEDULER_ENABLED,
+    DailySummaryScheduler,
+    schedule_fields,
+    summary_day,
+)
+from services.rate_limit import RATE_LIMIT_PERSIST, otp_send_limiter, save_buckets, load_buckets
+from services.route_limits import RateLimitMiddleware, route_limiter, client_ip
+from services.id_tokens import (
+    IdTokenError,
+    KeySourceUnavailable,
+    verify_google_token,
+    verify_firebase_token,
+    start_key_refresh,
+    stop_key_refresh,
+)
+from services.metric_history import (
+    HISTORY_DEFAULT_LIMIT,
+    HISTORY_PAGE_MAX,
+    decode_cursor,
+    fetch_page,
+    stream_ndjson,
+)
+from services.series_format import (
+    COLUMNAR_ENCODINGS,
+    raw_columns,
+    rollup_columns,
+    encode_columnar,
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -71,78 +150,285 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Write-behind buffer coalescing single-sample metric writes into batches
+metric_buffer = MetricWriteBuffer(lambda docs, progress: write_metrics(db, docs, progress))
+
+# Durable outbox; endpoints enqueue, background workers call EmailService.send_email
+email_outbox = EmailOutbox(
+    lambda **message: EmailService.send_email(**message),
+    lambda **message: EmailService.send_batch(**message)
+)
+
+# Sends daily summaries at each user's delivery_time; deliver_daily_summaries is defined with the endpoints
+daily_summary_scheduler = DailySummaryScheduler(lambda batch: deliver_daily_summaries(batch))
+
 @app.on_event("startup")
 async def startup_db_client():
     global MOCK_MODE, db
+    # ID token signing keys don't depend on Mongo
+    start_key_refresh()
+    if MOCK_MODE:
+        return
     try:
-        if not MOCK_MODE:
-            await client.admin.command('ping')
-            logger.info(f"Connected to MongoDB at {mongo_url}")
+        await client.admin.command('ping')
+        logger.info(f"Connected to MongoDB at {mongo_url}")
     except Exception as e:
         logger.warning(f"MongoDB connection failed: {e}. Switching to MOCK MODE.")
         MOCK_MODE = True
         # Create a dummy db object if needed, or handle in endpoints
+        return
+    
+    # Mongo is reachable: a schema step failing (index conflict, collection type
+    # mismatch) must not take the app into mock mode and drop every write
+    try:
+        await ensure_metrics_collection(db)
+    except Exception as e:
+        logger.error(f"Preparing the metrics collection failed: {e}")
+    try:
+        await apply_indexes(db)
+    except Exception as e:
+        logger.error(f"Applying indexes failed: {e}")
+    route_limiter.bind(db)
+    if RATE_LIMIT_PERSIST:
+        try:
+            await load_buckets(db, otp_send_limiter)
+        except Exception as e:
+            logger.warning(f"Loading rate limit buckets failed: {e}")
+    metric_buffer.start()
+    email_outbox.start(db)
+    sos_dispatcher.start(db)
+    if DAILY_SUMMARY_SCHEDULER_ENABLED:
+        daily_summary_scheduler.start(db)
+    if vitals_pubsub.uses_change_stream:
+        vitals_pubsub.start_change_stream(db)
 
 
 # ===================== EMAIL SERVICE =====================
 
+def _usable_email_providers() -> List[str]:
+    usable = []
+    for provider in EMAIL_PROVIDERS:
+        if provider not in ('RESEND', 'BREVO', 'FAKE'):
+            logger.error(f"Unknown email provider in chain: {provider}")
+        elif provider == 'FAKE' or EMAIL_API_KEYS.get(provider):
+            usable.append(provider)
+    return usable
+
+# Circuit breakers + latency routing across the configured providers
+email_router = ProviderRouter(_usable_email_providers())
+
 class EmailService:
     """
     Generic email service abstraction supporting multiple providers.
-    Currently supports: Resend (default), Brevo/Sendinblue
+    Currently supports: Resend (default), Brevo/Sendinblue, Fake (records only)
+    
+    Endpoints queue mail through the outbox (queue_* methods); the outbox
+    workers call send_email.
     
     Configuration via environment variables:
-    - EMAIL_PROVIDER: 'RESEND' or 'BREVO'
-    - EMAIL_API_KEY: Your API key
+    - EMAIL_PROVIDER: 'RESEND', 'BREVO' or 'FAKE' (tests / local development)
+    - EMAIL_PROVIDERS: (Optional) Failover chain, e.g. 'RESEND,BREVO' (default: EMAIL_PROVIDER)
+    - EMAIL_API_KEY: Your API key (EMAIL_API_KEY_<PROVIDER> overrides it per provider)
     - EMAIL_SENDER: Verified sender email (e.g., 'Miraii Health <noreply@miraii.app>')
     """
     
     RESEND_API_URL = "https://api.resend.com/emails"
+    RESEND_BATCH_API_URL = "https://api.resend.com/emails/batch"
+    RESEND_BATCH_LIMIT = 100
     BREVO_API_URL = "https://api.brevo.com/v3/smtp/email"
     
     @staticmethod
     def is_configured() -> bool:
-        return bool(EMAIL_API_KEY)
+        return bool(email_router.providers)
     
     @staticmethod
-    async def send_email(to_email: str, subject: str, html_content: str, text_content: str = "") -> dict:
+    async def send_email(to_email: str, subject: str, html_content: str, text_content: str = "", idempotency_key: Optional[str] = None) -> dict:
         """
-        Send an email using the configured provider.
+        Send an email through the provider chain, failing over when a provider could not be reached.
+        idempotency_key: the same key on a retry lets Resend drop the duplicate
         Returns: {"success": bool, "message": str, "provider": str}
         """
-        if not EMAIL_API_KEY:
+        if not EmailService.is_configured():
             logger.warning("Email not sent - EMAIL_API_KEY not configured (demo mode)")
             return {"success": False, "message": "Email not configured", "demo_mode": True}
         
-        try:
-            async with httpx.AsyncClient() as client:
-                if EMAIL_PROVIDER.upper() == 'RESEND':
-                    return await EmailService._send_via_resend(client, to_email, subject, html_content)
-                elif EMAIL_PROVIDER.upper() == 'BREVO':
-                    return await EmailService._send_via_brevo(client, to_email, subject, html_content, text_content)
-                else:
-                    logger.error(f"Unknown email provider: {EMAIL_PROVIDER}")
-                    return {"success": False, "message": f"Unknown provider: {EMAIL_PROVIDER}"}
-        except Exception as e:
-            logger.error(f"Email send error: {str(e)}")
-            return {"success": False, "message": str(e)}
+        async def attempt(provider: str) -> dict:
+            if provider == 'FAKE':
+                return await fake_email_provider.send(to_email, subject, html_content, text_content)
+            http_client = http_clients.get("email")
+            if provider == 'RESEND':
+                return await EmailService._send_via_resend(http_client, EMAIL_API_KEYS[provider], to_email, subject, html_content, idempotency_key)
+            return await EmailService._send_via_brevo(http_client, EMAIL_API_KEYS[provider], to_email, subject, html_content, text_content)
+        
+        return await email_router.send(attempt)
     
     @staticmethod
-    async def _send_via_resend(client: httpx.AsyncClient, to_email: str, subject: str, html_content: str) -> dict:
-        """Send email via Resend API"""
+    async def send_batch(subject: str, html_content: str, recipients: List[dict], text_content: str = "", idempotency_key: Optional[str] = None) -> dict:
+        """
+        Send one shared body to several recipients in a single provider call.
+        recipients: [{"to": email, "fragment": html merged into the body's recipient slot}]
+        Returns: {"success": bool, "message": str, "provider": str,
+                  "delivered": [email], "rejected": [{"to", "error"}]}
+        success is False while any recipient is neither delivered nor rejected.
+        """
+        if not EmailService.is_configured():
+            logger.warning("Email batch not sent - EMAIL_API_KEY not configured (demo mode)")
+            return {"success": False, "message": "Email not configured", "demo_mode": True}
+        
+        messages = [
+            {"to": r["to"], "subject": subject, "html": personalize(html_content, r["fragment"]), "text": text_content}
+            for r in recipients
+        ]
+        # Filled in as each chunk / recipient settles, so a failover or timeout
+        # never resends what already went out
+        delivered: List[str] = []
+        rejected: List[dict] = []
+        
+        async def attempt(provider: str) -> dict:
+            settled = set(delivered) | {r["to"] for r in rejected}
+            pending = [m for m in messages if m["to"] not in settled]
+            if provider == 'FAKE':
+                result = await fake_email_provider.send_batch(pending)
+                delivered.extend(result.get("delivered", []))
+                rejected.extend(result.get("rejected", []))
+                return result
+            http_client = http_clients.get("email")
+            if provider == 'RESEND':
+                return await EmailService._send_batch_via_resend(http_client, EMAIL_API_KEYS[provider], pending, delivered, rejected, idempotency_key)
+            return await EmailService._send_batch_via_brevo(http_client, EMAIL_API_KEYS[provider], pending, delivered, rejected)
+        
+        result = await email_router.send(attempt)
+        return {**result, "delivered": delivered, "rejected": rejected}
+    
+    @staticmethod
+    def _resend_headers(api_key: str, idempotency_key: Optional[str]) -> dict:
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        return headers
+    
+    @staticmethod
+    def _idempotency_key(base: Optional[str], addresses: List[str]) -> Optional[str]:
+        """
+        Per-request key derived from the outbox message_id and the recipients in the request.
+        A retry that resends the same recipients reuses the key; once some of them are
+        settled the payload differs, and so does the key (Resend rejects a reused key with a new body).
+        """
+        if not base:
+            return None
+        return f"{base}:{hashlib.sha1(','.join(addresses).encode()).hexdigest()[:16]}"
+    
+    @staticmethod
+    def _brevo_sender() -> dict:
+        sender_parts = EMAIL_SENDER.split('<')
+        sender_name = sender_parts[0].strip() if len(sender_parts) > 1 else "Miraii Health"
+        sender_email = sender_parts[1].replace('>', '').strip() if len(sender_parts) > 1 else EMAIL_SENDER
+        return {"name": sender_name, "email": sender_email}
+    
+    @staticmethod
+    async def _send_batch_via_resend(client: httpx.AsyncClient, api_key: str, messages: List[dict], delivered: List[str], rejected: List[dict], idempotency_key: Optional[str] = None) -> dict:
+        """
+        Send emails via Resend's batch endpoint (up to RESEND_BATCH_LIMIT per call).
+        Appends to delivered / rejected as each chunk settles.
+        """
+        # Caregiver lists are short; more than one call per summary is the exception
+        for i in range(0, len(messages), EmailService.RESEND_BATCH_LIMIT):
+            chunk = messages[i:i + EmailService.RESEND_BATCH_LIMIT]
+            response = await client.post(
+                EmailService.RESEND_BATCH_API_URL,
+                headers=EmailService._resend_headers(api_key, EmailService._idempotency_key(idempotency_key, [m["to"] for m in chunk])),
+                json=[
+                    {"from": EMAIL_SENDER, "to": [m["to"]], "subject": m["subject"], "html": m["html"]}
+                    for m in chunk
+                ]
+            )
+            if response.status_code in [200, 201]:
+                delivered.extend(m["to"] for m in chunk)
+                continue
+            logger.error(f"Resend batch error: {response.status_code} - {response.text}")
+            if response.status_code in PERMANENT_STATUS:
+                # Resend validates the whole batch; find the bad address(es) one send at a time
+                failure = await EmailService._send_one_by_one(
+                    lambda m: EmailService._send_via_resend(
+                        client, api_key, m["to"], m["subject"], m["html"], EmailService._idempotency_key(idempotency_key, [m["to"]])
+                    ),
+                    chunk, delivered, rejected
+                )
+                if failure:
+                    return failure
+                continue
+            return {"success": False, "message": response.text, "provider": "resend", "status_code": response.status_code}
+        
+        logger.info(f"Batch of {len(messages)} emails sent via Resend")
+        return {"success": True, "message": f"{len(messages)} emails settled", "provider": "resend"}
+    
+    @staticmethod
+    async def _send_batch_via_brevo(client: httpx.AsyncClient, api_key: str, messages: List[dict], delivered: List[str], rejected: List[dict]) -> dict:
+        """Send emails via one Brevo request, one messageVersion per recipient"""
+        first = messages[0]
         response = await client.post(
-            EmailService.RESEND_API_URL,
+            EmailService.BREVO_API_URL,
             headers={
-                "Authorization": f"Bearer {EMAIL_API_KEY}",
+                "api-key": api_key,
                 "Content-Type": "application/json"
             },
+            json={
+                "sender": EmailService._brevo_sender(),
+                "subject": first["subject"],
+                "htmlContent": first["html"],
+                "textContent": first["text"] or first["subject"],
+                "messageVersions": [
+                    {"to": [{"email": m["to"]}], "htmlContent": m["html"], "subject": m["subject"]}
+                    for m in messages
+                ]
+            }
+        )
+        
+        if response.status_code in [200, 201]:
+            delivered.extend(m["to"] for m in messages)
+            logger.info(f"Batch of {len(messages)} emails sent via Brevo")
+            return {"success": True, "message": f"{len(messages)} emails sent", "provider": "brevo"}
+        logger.error(f"Brevo batch error: {response.status_code} - {response.text}")
+        if response.status_code in PERMANENT_STATUS:
+            failure = await EmailService._send_one_by_one(
+                lambda m: EmailService._send_via_brevo(client, api_key, m["to"], m["subject"], m["html"], m["text"]),
+                messages, delivered, rejected
+            )
+            return failure or {"success": True, "message": f"{len(messages)} emails settled", "provider": "brevo"}
+        return {"success": False, "message": response.text, "provider": "brevo", "status_code": response.status_code}
+    
+    @staticmethod
+    async def _send_one_by_one(send_one, messages: List[dict], delivered: List[str], rejected: List[dict]) -> Optional[dict]:
+        """
+        Fallback after a provider rejected a whole batch: send each message on its own
+        so an invalid address only fails itself.
+        Returns: None when every message settled, else the first retryable failure
+        """
+        for m in messages:
+            result = await send_one(m)
+            if result.get("success"):
+                delivered.append(m["to"])
+            elif result.get("status_code") in PERMANENT_STATUS:
+                rejected.append({"to": m["to"], "error": result.get("message")})
+            else:
+                return result
+        return None
+    
+    @staticmethod
+    async def _send_via_resend(client: httpx.AsyncClient, api_key: str, to_email: str, subject: str, html_content: str, idempotency_key: Optional[str] = None) -> dict:
+        """Send email via Resend API"""
+        response = await client.post(
+            EmailService.RESEND_API_URL,
+            headers=EmailService._resend_headers(api_key, idempotency_key),
             json={
                 "from": EMAIL_SENDER,
                 "to": [to_email],
                 "subject": subject,
                 "html": html_content
-            },
-            timeout=30.0
+            }
         )
         
         if response.status_code in [200, 201]:
@@ -151,30 +437,24 @@ class EmailService:
         else:
             error_msg = response.text
             logger.error(f"Resend error: {response.status_code} - {error_msg}")
-            return {"success": False, "message": error_msg, "provider": "resend"}
+            return {"success": False, "message": error_msg, "provider": "resend", "status_code": response.status_code}
     
     @staticmethod
-    async def _send_via_brevo(client: httpx.AsyncClient, to_email: str, subject: str, html_content: str, text_content: str) -> dict:
+    async def _send_via_brevo(client: httpx.AsyncClient, api_key: str, to_email: str, subject: str, html_content: str, text_content: str) -> dict:
         """Send email via Brevo/Sendinblue API"""
-        # Parse sender name and email
-        sender_parts = EMAIL_SENDER.split('<')
-        sender_name = sender_parts[0].strip() if len(sender_parts) > 1 else "Miraii Health"
-        sender_email = sender_parts[1].replace('>', '').strip() if len(sender_parts) > 1 else EMAIL_SENDER
-        
         response = await client.post(
             EmailService.BREVO_API_URL,
             headers={
-                "api-key": EMAIL_API_KEY,
+                "api-key": api_key,
                 "Content-Type": "application/json"
             },
             json={
-                "sender": {"name": sender_name, "email": sender_email},
+                "sender": EmailService._brevo_sender(),
                 "to": [{"email": to_email}],
                 "subject": subject,
                 "htmlContent": html_content,
                 "textContent": text_content or subject
-            },
-            timeout=30.0
+            }
         )
         
         if response.status_code in [200, 201]:
@@ -183,109 +463,19 @@ class EmailService:
         else:
             error_msg = response.text
             logger.error(f"Brevo error: {response.status_code} - {error_msg}")
-            return {"success": False, "message": error_msg, "provider": "brevo"}
+            return {"success": False, "message": error_msg, "provider": "brevo", "status_code": response.status_code}
     
     # ==================== EMAIL TEMPLATES ====================
     
     @staticmethod
     def get_otp_email_html(otp: str) -> str:
         """Generate OTP verification email HTML"""
-        return f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <style>
-                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; margin: 0; padding: 0; background: #f5f5f5; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 40px 20px; }}
-                .card {{ background: white; border-radius: 16px; padding: 40px; box-shadow: 0 2px 8px rgba(0,0,0,0.08); }}
-                .logo {{ text-align: center; margin-bottom: 30px; }}
-                .logo h1 {{ color: #6366F1; margin: 0; font-size: 28px; font-weight: 700; }}
-                .logo p {{ color: #6B7280; margin: 5px 0 0 0; font-size: 14px; }}
-                .otp-box {{ background: linear-gradient(135deg, #6366F1 0%, #8B5CF6 100%); color: white; text-align: center; padding: 30px; border-radius: 12px; margin: 30px 0; }}
-                .otp-code {{ font-size: 36px; font-weight: 700; letter-spacing: 8px; margin: 10px 0; font-family: monospace; }}
-                .message {{ color: #374151; line-height: 1.6; font-size: 15px; }}
-                .footer {{ color: #9CA3AF; font-size: 12px; text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #E5E7EB; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="card">
-                    <div class="logo">
-                        <h1>Miraii</h1>
-                        <p>Smart Ring Health Companion</p>
-                    </div>
-                    <div class="message">
-                        <p>Hello,</p>
-                        <p>Your verification code for Miraii is:</p>
-                    </div>
-                    <div class="otp-box">
-                        <p style="margin: 0; font-size: 14px; opacity: 0.9;">Your verification code</p>
-                        <p class="otp-code">{otp}</p>
-                        <p style="margin: 0; font-size: 12px; opacity: 0.8;">Valid for 10 minutes</p>
-                    </div>
-                    <div class="message">
-                        <p>If you didn't request this code, please ignore this email.</p>
-                        <p style="color: #6B7280; font-size: 13px;">For your security, never share this code with anyone.</p>
-                    </div>
-                    <div class="footer">
-                        <p>© 2025 Miraii Health. All rights reserved.</p>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        return render_otp_email(otp)
     
     @staticmethod
     def get_password_reset_email_html(reset_token: str) -> str:
         """Generate password reset email HTML"""
-        return f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <style>
-                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; margin: 0; padding: 0; background: #f5f5f5; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 40px 20px; }}
-                .card {{ background: white; border-radius: 16px; padding: 40px; box-shadow: 0 2px 8px rgba(0,0,0,0.08); }}
-                .logo {{ text-align: center; margin-bottom: 30px; }}
-                .logo h1 {{ color: #6366F1; margin: 0; font-size: 28px; font-weight: 700; }}
-                .reset-box {{ background: #F3F4F6; text-align: center; padding: 30px; border-radius: 12px; margin: 30px 0; }}
-                .token {{ background: #E5E7EB; padding: 12px 20px; border-radius: 8px; font-family: monospace; font-size: 16px; word-break: break-all; margin: 15px 0; display: inline-block; }}
-                .message {{ color: #374151; line-height: 1.6; font-size: 15px; }}
-                .footer {{ color: #9CA3AF; font-size: 12px; text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #E5E7EB; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="card">
-                    <div class="logo">
-                        <h1>Miraii</h1>
-                        <p style="color: #6B7280; margin: 5px 0 0 0; font-size: 14px;">Smart Ring Health Companion</p>
-                    </div>
-                    <div class="message">
-                        <p>Hello,</p>
-                        <p>We received a request to reset your Miraii account password.</p>
-                    </div>
-                    <div class="reset-box">
-                        <p style="margin: 0 0 15px 0; color: #374151;">Use this code in the app to reset your password:</p>
-                        <div class="token">{reset_token}</div>
-                        <p style="margin: 15px 0 0 0; font-size: 12px; color: #6B7280;">Valid for 1 hour</p>
-                    </div>
-                    <div class="message">
-                        <p>If you didn't request a password reset, you can safely ignore this email.</p>
-                    </div>
-                    <div class="footer">
-                        <p>© 2025 Miraii Health. All rights reserved.</p>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        return render_password_reset_email(reset_token)
     
     @staticmethod
     def get_daily_summary_email_html(
@@ -300,193 +490,67 @@ class EmailService:
         is_caregiver: bool = False
     ) -> str:
         """Generate daily vitals summary email HTML"""
-        
-        # Sleep section
-        sleep_html = f"""
-        <div style="background: #EEF2FF; border-radius: 12px; padding: 20px; margin-bottom: 16px;">
-            <div style="display: flex; align-items: center; margin-bottom: 12px;">
-                <span style="font-size: 24px; margin-right: 10px;">🌙</span>
-                <h3 style="margin: 0; color: #4338CA; font-size: 16px;">Sleep</h3>
-            </div>
-            <div style="display: grid; gap: 8px;">
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">Total Duration</span>
-                    <span style="font-weight: 600; color: #1F2937;">{sleep_data.get('duration', 'N/A')}</span>
-                </div>
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">Sleep Score</span>
-                    <span style="font-weight: 600; color: #1F2937;">{sleep_data.get('score', 'N/A')}/100</span>
-                </div>
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">Deep / Light / REM</span>
-                    <span style="font-weight: 600; color: #1F2937;">{sleep_data.get('stages', 'N/A')}</span>
-                </div>
-                {f'<div style="background: #FEF3C7; padding: 8px 12px; border-radius: 6px; margin-top: 8px;"><span style="color: #B45309;">⚠️ Apnea risk: {sleep_data.get("apnea_risk", "low")}</span></div>' if sleep_data.get('apnea_risk', 'low') != 'low' else ''}
-            </div>
-        </div>
-        """
-        
-        # Heart section
-        heart_html = f"""
-        <div style="background: #FEF2F2; border-radius: 12px; padding: 20px; margin-bottom: 16px;">
-            <div style="display: flex; align-items: center; margin-bottom: 12px;">
-                <span style="font-size: 24px; margin-right: 10px;">❤️</span>
-                <h3 style="margin: 0; color: #DC2626; font-size: 16px;">Heart</h3>
-            </div>
-            <div style="display: grid; gap: 8px;">
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">Average HR</span>
-                    <span style="font-weight: 600; color: #1F2937;">{heart_data.get('avg_hr', 'N/A')} BPM</span>
-                </div>
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">Resting HR</span>
-                    <span style="font-weight: 600; color: #1F2937;">{heart_data.get('rhr', 'N/A')} BPM</span>
-                </div>
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">HRV</span>
-                    <span style="font-weight: 600; color: #1F2937;">{heart_data.get('hrv', 'N/A')} ms</span>
-                </div>
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">VO2max</span>
-                    <span style="font-weight: 600; color: #1F2937;">{heart_data.get('vo2max', 'N/A')} ml/kg/min</span>
-                </div>
-                {f'<div style="background: #FEE2E2; padding: 8px 12px; border-radius: 6px; margin-top: 8px;"><span style="color: #991B1B;">⚠️ {heart_data.get("irregularity_note", "")}</span></div>' if heart_data.get('irregularity_note') else ''}
-            </div>
-        </div>
-        """
-        
-        # Activity section
-        activity_html = f"""
-        <div style="background: #ECFDF5; border-radius: 12px; padding: 20px; margin-bottom: 16px;">
-            <div style="display: flex; align-items: center; margin-bottom: 12px;">
-                <span style="font-size: 24px; margin-right: 10px;">🏃</span>
-                <h3 style="margin: 0; color: #059669; font-size: 16px;">Activity</h3>
-            </div>
-            <div style="display: grid; gap: 8px;">
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">Steps</span>
-                    <span style="font-weight: 600; color: #1F2937;">{activity_data.get('steps', 'N/A')} / {activity_data.get('goal', '8000')}</span>
-                </div>
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">Workouts</span>
-                    <span style="font-weight: 600; color: #1F2937;">{activity_data.get('workouts', '0')}</span>
-                </div>
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">Active Minutes</span>
-                    <span style="font-weight: 600; color: #1F2937;">{activity_data.get('active_minutes', 'N/A')} min</span>
-                </div>
-            </div>
-        </div>
-        """
-        
-        # Other metrics section
-        other_html = f"""
-        <div style="background: #F5F3FF; border-radius: 12px; padding: 20px; margin-bottom: 16px;">
-            <div style="display: flex; align-items: center; margin-bottom: 12px;">
-                <span style="font-size: 24px; margin-right: 10px;">📊</span>
-                <h3 style="margin: 0; color: #7C3AED; font-size: 16px;">Other Metrics</h3>
-            </div>
-            <div style="display: grid; gap: 8px;">
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">Average SpO2</span>
-                    <span style="font-weight: 600; color: #1F2937;">{other_data.get('spo2', 'N/A')}%</span>
-                </div>
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">Skin Temperature</span>
-                    <span style="font-weight: 600; color: #1F2937;">{other_data.get('skin_temp_status', 'Normal')}</span>
-                </div>
-            </div>
-        </div>
+        return render_daily_summary_email(
+            recipient_name, user_name, date_str,
+            sleep_data, heart_data, activity_data, other_data,
+            insight, is_caregiver
+        )
+    
+    @staticmethod
+    def get_daily_summary_recipients(settings: dict, user: dict) -> List[dict]:
+        """The user (if send_to_self) and every enabled caregiver, each with their greeting fragment"""
+        user_name = user.get("name") or "Friend"
+        recipients = []
+        if settings.get("send_to_self", True) and user.get("email"):
+            recipients.append({
+                "to": user["email"],
+                "fragment": render_daily_summary_recipient(user_name, user_name, is_caregiver=False)
+            })
+        for recipient in settings.get("recipients", []):
+            if recipient.get("enabled", True) and recipient.get("email"):
+                recipients.append({
+                    "to": recipient["email"],
+                    "fragment": render_daily_summary_recipient(recipient.get("name") or "there", user_name, is_caregiver=True)
+                })
+        return recipients
+    
+    # ==================== QUEUE METHODS ====================
+    
+    @staticmethod
+    async def queue_email(to_email: str, subject: str, html_content: str, text_content: str = "", kind: str = "generic") -> Optional[str]:
         """
-        
-        # Caregiver note
-        caregiver_note = f"""
-        <div style="background: #FEF3C7; border-radius: 8px; padding: 12px 16px; margin-bottom: 20px; font-size: 13px; color: #92400E;">
-            📋 You are receiving this because <strong>{user_name}</strong> has shared their Miraii daily summary with you.
-        </div>
-        """ if is_caregiver else ""
-        
-        return f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <style>
-                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; margin: 0; padding: 0; background: #f5f5f5; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .card {{ background: white; border-radius: 16px; padding: 30px; box-shadow: 0 2px 8px rgba(0,0,0,0.08); }}
-                .header {{ text-align: center; margin-bottom: 24px; padding-bottom: 20px; border-bottom: 1px solid #E5E7EB; }}
-                .header h1 {{ color: #6366F1; margin: 0 0 8px 0; font-size: 24px; }}
-                .header .date {{ color: #6B7280; font-size: 14px; }}
-                .greeting {{ color: #374151; margin-bottom: 20px; }}
-                .insight {{ background: linear-gradient(135deg, #6366F1 0%, #8B5CF6 100%); color: white; border-radius: 12px; padding: 16px 20px; margin-bottom: 24px; }}
-                .insight p {{ margin: 0; font-size: 14px; line-height: 1.5; }}
-                .footer {{ color: #9CA3AF; font-size: 12px; text-align: center; margin-top: 24px; padding-top: 20px; border-top: 1px solid #E5E7EB; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="card">
-                    <div class="header">
-                        <h1>Miraii Daily Summary</h1>
-                        <p class="date">{date_str}</p>
-                    </div>
-                    
-                    {caregiver_note}
-                    
-                    <div class="greeting">
-                        <p>Good morning, {recipient_name}! 👋</p>
-                        <p>Here's {'how ' + user_name + ' did' if is_caregiver else 'your health summary'} yesterday:</p>
-                    </div>
-                    
-                    <div class="insight">
-                        <p>💡 <strong>Insight:</strong> {insight}</p>
-                    </div>
-                    
-                    {sleep_html}
-                    {heart_html}
-                    {activity_html}
-                    {other_html}
-                    
-                    <div class="footer">
-                        <p>Tracked with Miraii Smart Ring</p>
-                        <p>© 2025 Miraii Health. All rights reserved.</p>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
+        Store an email in the outbox for background delivery.
+        Returns: message_id, or None when no provider is configured (demo mode)
         """
-    
-    # ==================== SEND METHODS ====================
+        if not EmailService.is_configured():
+            logger.warning("Email not queued - EMAIL_API_KEY not configured (demo mode)")
+            return None
+        return await email_outbox.enqueue(db, to_email, subject, html_content, text_content, kind=kind)
     
     @staticmethod
-    async def send_otp_email(to_email: str, otp: str) -> dict:
-        """Send OTP verification email"""
+    async def queue_otp_email(to_email: str, otp: str) -> Optional[str]:
+        """Queue OTP verification email"""
         html = EmailService.get_otp_email_html(otp)
-        result = await EmailService.send_email(
+        return await EmailService.queue_email(
             to_email=to_email,
             subject="Your Miraii Verification Code",
-            html_content=html
+            html_content=html,
+            kind="otp"
         )
-        if not result.get("success") and not result.get("demo_mode"):
-            logger.error(f"Failed to send OTP email to {to_email}")
-        return result
     
     @staticmethod
-    async def send_password_reset_email(to_email: str, reset_token: str) -> dict:
-        """Send password reset email"""
+    async def queue_password_reset_email(to_email: str, reset_token: str) -> Optional[str]:
+        """Queue password reset email"""
         html = EmailService.get_password_reset_email_html(reset_token)
-        result = await EmailService.send_email(
+        return await EmailService.queue_email(
             to_email=to_email,
             subject="Reset Your Miraii Password",
-            html_content=html
+            html_content=html,
+            kind="password_reset"
         )
-        return result
     
     @staticmethod
-    async def send_daily_summary_email(
+    async def queue_daily_summary_email(
         to_email: str,
         recipient_name: str,
         user_name: str,
@@ -497,8 +561,8 @@ class EmailService:
         other_data: dict,
         insight: str,
         is_caregiver: bool = False
-    ) -> dict:
-        """Send daily vitals summary email"""
+    ) -> Optional[str]:
+        """Queue daily vitals summary email"""
         html = EmailService.get_daily_summary_email_html(
             recipient_name=recipient_name,
             user_name=user_name,
@@ -510,12 +574,41 @@ class EmailService:
             insight=insight,
             is_caregiver=is_caregiver
         )
-        result = await EmailService.send_email(
+        return await EmailService.queue_email(
             to_email=to_email,
             subject=f"Miraii Daily Health Summary – {date_str}",
-            html_content=html
+            html_content=html,
+            kind="daily_summary"
+        )
+    
+    @staticmethod
+    async def queue_daily_summary_batch(
+        recipients: List[dict],
+        date_str: str,
+        sleep_data: dict,
+        heart_data: dict,
+        activity_data: dict,
+        other_data: dict,
+        insight: str
+    ) -> Optional[str]:
+        """Queue one user's daily summary for all its recipients: body rendered once, one outbox message"""
+        if not recipients:
+            return None
+        if not EmailService.is_configured():
+            logger.warning("Email not queued - EMAIL_API_KEY not configured (demo mode)")
+            return None
+        body = render_daily_summary_body(date_str, sleep_data, heart_data, activity_data, other_data, insight)
+        return await email_outbox.enqueue_batch(
+            db,
+            recipients,
+            subject=f"Miraii Daily Health Summary – {date_str}",
+            html_content=body,
+            kind="daily_summary"
         )
-        return result
+
+# SOS alerts also go out by email when a provider is configured
+if EmailService.is_configured():
+    sos_dispatcher.register(EmailChannelAdapter(EmailService.send_email))
 
 # ===================== MODELS =====================
 
@@ -610,6 +703,10 @@ class HealthMetric(BaseModel):
     recorded_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     metadata: Dict[str, Any] = {}
 
+class HealthMetricBatch(BaseModel):
+    """Buffered ring samples uploaded in a single sync"""
+    samples: List[Dict[str, Any]] = Field(..., max_length=METRICS_BATCH_MAX_SAMPLES)
+
 class Alert(BaseModel):
     alert_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -675,10 +772,14 @@ class SOSLocation(BaseModel):
 class SOSContactNotification(BaseModel):
     contact_id: str
     contact_name: str
-    contact_phone: str
-    channel: str  # "sms", "call", "push"
-    status: str  # "sent", "delivered", "failed"
-    sent_at: datetime
+    contact_phone: Optional[str] = None
+    channel: str  # "sms", "email"
+    address: Optional[str] = None  # phone / email for this channel
+    status: str  # "queued", "retrying", "interrupted", "sent", "failed"
+    sent_at: Optional[datetime] = None
+    attempts: int = 0
+    last_error: Optional[str] = None
+    updated_at: Optional[datetime] = None
 
 class SOSIncident(BaseModel):
     incident_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -767,6 +868,53 @@ def verify_jwt_token(token: str):
     except jwt.InvalidTokenError:
         return None
 
+async def load_user(user_id: str) -> Optional[dict]:
+    """Fetch a user document, served from the LRU+TTL user cache when possible"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
+        if user:
+            user_cache.set(user_id, user)
+    # Callers get their own copy so the cached document is never mutated
+    return dict(user) if user else None
+
+async def load_session_user(session_token: str) -> Optional[dict]:
+    """
+    Resolve a cookie session to its user.
+    
+    Cache hit: no database round trip. Miss: one aggregation that matches the
+    unexpired session and joins its user via $lookup; both are then cached.
+    """
+    now = datetime.now(timezone.utc)
+    session = session_cache.get(session_token)
+    
+    if session is None:
+        rows = await db.user_sessions.aggregate([
+            {"$match": {"session_token": session_token, "expires_at": {"$gt": now}}},
+            {"$limit": 1},
+            {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "user_id", "as": "user"}},
+            {"$project": {"_id": 0, "user_id": 1, "expires_at": 1, "user": {"$arrayElemAt": ["$user", 0]}}}
+        ]).to_list(1)
+        if not rows:
+            return None
+        
+        expires_at = rows[0]["expires_at"]
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        session = {"user_id": rows[0]["user_id"], "expires_at": expires_at}
+        # Never cache a session past its own expiry
+        session_cache.set(session_token, session, ttl=min(session_cache.ttl, (expires_at - now).total_seconds()))
+        
+        user = rows[0].get("user")
+        if user:
+            user.pop("_id", None)
+            user_cache.set(session["user_id"], user)
+    elif session["expires_at"] <= now:
+        session_cache.invalidate(session_token)
+        return None
+    
+    return await load_user(session["user_id"])
+
 async def get_current_user(request: Request):
     # Check Authorization header
     auth_header = request.headers.get("Authorization")
@@ -783,23 +931,16 @@ async def get_current_user(request: Request):
         token = auth_header.split(" ")[1]
         user_id = verify_jwt_token(token)
         if user_id:
-            user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
+            user = await load_user(user_id)
             if user:
                 return user
     
     # Check session token cookie
     session_token = request.cookies.get("session_token")
     if session_token:
-        session = await db.user_sessions.find_one({"session_token": session_token}, {"_id": 0})
-        if session:
-            expires_at = session.get("expires_at")
-            if expires_at:
-                if expires_at.tzinfo is None:
-                    expires_at = expires_at.replace(tzinfo=timezone.utc)
-                if expires_at > datetime.now(timezone.utc):
-                    user = await db.users.find_one({"user_id": session["user_id"]}, {"_id": 0})
-                    if user:
-                        return user
+        user = await load_session_user(session_token)
+        if user:
+            return user
     
     raise HTTPException(status_code=401, detail="Not authenticated")
 
@@ -822,13 +963,14 @@ async def send_otp(request: OTPRequest):
     otp = generate_otp()
     identifier = request.phone or request.email
     
-    # Check rate limiting (max 3 OTPs per 10 minutes)
-    recent_otps = await db.otps.count_documents({
-        "identifier": identifier,
-        "created_at": {"$gte": datetime.now(timezone.utc) - timedelta(minutes=10)}
-    })
-    if recent_otps >= 5:
-        raise HTTPException(status_code=429, detail="Too many OTP requests. Please wait before trying again.")
+    # Check rate limiting (in-memory token bucket: burst of 5, refilled over 10 minutes)
+    allowed, retry_after = otp_send_limiter.try_acquire(identifier)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many OTP requests. Please wait before trying again.",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.5)))}
+        )
     
     # Store OTP with expiry
     await db.otps.insert_one({
@@ -839,17 +981,17 @@ async def send_otp(request: OTPRequest):
         "verified": False
     })
     
-    # Send OTP via email if email provided
-    email_result = None
+    # Queue OTP email if email provided (delivered by the outbox workers)
+    message_id = None
     if request.email:
-        email_result = await EmailService.send_otp_email(request.email, otp)
+        message_id = await EmailService.queue_otp_email(request.email, otp)
     
     # Always log for debugging (remove in production)
     logger.info(f"OTP for {identifier}: {otp}")
     
     response_data = {
         "message": "OTP sent successfully",
-        "email_sent": email_result.get("success", False) if email_result else None,
+        "email_sent": message_id is not None if request.email else None,
     }
     
     return response_data
@@ -866,51 +1008,26 @@ async def verify_otp(request: OTPVerify, response: Response):
     if not is_valid_format:
         raise HTTPException(status_code=400, detail="Please enter a valid 6-digit OTP")
     
-    # Check if email provider is configured for real OTP validation
-    if EmailService.is_configured():
-        # Real OTP validation
-        otp_record = await db.otps.find_one({
-            "identifier": identifier,
-            "otp": request.otp,
-            "verified": False,
-            "expires_at": {"$gt": datetime.now(timezone.utc)}
-        })
-        
-        if not otp_record:
-            raise HTTPException(status_code=400, detail="Invalid or expired OTP")
-        
-        # Mark OTP as verified
-        await db.otps.update_one(
-            {"_id": otp_record["_id"]},
-            {"$set": {"verified": True}}
-        )
-    else:
-        # Demo mode: Validate against stored OTP even in demo mode for better testing
-        otp_record = await db.otps.find_one({
+    # Atomically consume the OTP: only one concurrent verify can flip it.
+    # Expiring it now lets the TTL index reap it instead of a delete_many.
+    now = datetime.now(timezone.utc)
+    otp_record = await db.otps.find_one_and_update(
+        {
             "identifier": identifier,
             "otp": request.otp,
             "verified": False,
-            "expires_at": {"$gt": datetime.now(timezone.utc)}
-        })
-        
-        if otp_record:
-            # Mark as verified if found
-            await db.otps.update_one(
-                {"_id": otp_record["_id"]},
-                {"$set": {"verified": True}}
-            )
-        else:
-            # In demo mode, still log but allow any 6-digit OTP
-            logger.info(f"Demo mode: Accepting OTP {request.otp} for {identifier}")
+            "expires_at": {"$gt": now}
+        },
+        {"$set": {"verified": True, "verified_at": now, "expires_at": now}},
+        projection={"_id": 1}
+    )
     
-    # Delete old OTPs for this identifier
-    await db.otps.delete_many({
-        "identifier": identifier,
-        "$or": [
-            {"verified": True},
-            {"expires_at": {"$lt": datetime.now(timezone.utc)}}
-        ]
-    })
+    if not otp_record:
+        # Check if email provider is configured for real OTP validation
+        if EmailService.is_configured():
+            raise HTTPException(status_code=400, detail="Invalid or expired OTP")
+        # In demo mode, still log but allow any 6-digit OTP
+        logger.info(f"Demo mode: Accepting OTP {request.otp} for {identifier}")
     
     # Find or create user
     query = {"phone": request.phone} if request.phone else {"email": request.email}
@@ -972,12 +1089,12 @@ async def forgot_password(request: PasswordResetRequest):
         upsert=True
     )
     
-    # Send reset email
-    email_result = await EmailService.send_password_reset_email(request.email, reset_token)
+    # Queue reset email
+    message_id = await EmailService.queue_password_reset_email(request.email, reset_token)
     
     response_data = {
         "message": "If an account exists with this email, a reset link has been sent.",
-        "email_sent": email_result.get("success", False)
+        "email_sent": message_id is not None
     }
     
     # Include token if email provider not configured (for testing)
@@ -1026,11 +1143,28 @@ async def reset_password(request: PasswordResetVerify):
 
 async def verify_firebase_id_token(id_token: str) -> dict:
     """
-    Verify Firebase ID token using Firebase Admin SDK or REST API.
+    Verify Firebase ID token offline against Google's cached signing keys,
+    falling back to the Firebase Admin SDK or REST API.
     Returns decoded token data with uid, phone_number, etc.
     """
+    if FIREBASE_PROJECT_ID:
+        try:
+            decoded = await verify_firebase_token(id_token, FIREBASE_PROJECT_ID)
+            return {
+                "uid": decoded.get("sub"),
+                "phone_number": decoded.get("phone_number"),
+                "email": decoded.get("email"),
+                "name": decoded.get("name"),
+                "picture": decoded.get("picture"),
+                "provider": "phone" if decoded.get("phone_number") else "email"
+            }
+        except IdTokenError as e:
+            raise HTTPException(status_code=401, detail=f"Invalid Firebase token: {e}")
+        except KeySourceUnavailable as e:
+            logger.warning(f"Firebase signing keys unavailable, using online verification: {e}")
+    
     try:
-        # Try using Firebase Admin SDK first (if available)
+        # Try using Firebase Admin SDK (if available)
         import firebase_admin
         from firebase_admin import auth as firebase_auth
         
@@ -1053,31 +1187,31 @@ async def verify_firebase_id_token(id_token: str) -> dict:
     if not FIREBASE_API_KEY:
         raise HTTPException(status_code=500, detail="Firebase not configured. Add FIREBASE_API_KEY to .env")
     
-    async with httpx.AsyncClient() as client:
-        # Verify token with Firebase Auth REST API
-        url = f"https://identitytoolkit.googleapis.com/v1/accounts:lookup?key={FIREBASE_API_KEY}"
-        response = await client.post(url, json={"idToken": id_token})
-        
-        if response.status_code != 200:
-            error_data = response.json()
-            raise HTTPException(
-                status_code=401, 
-                detail=f"Invalid Firebase token: {error_data.get('error', {}).get('message', 'Unknown error')}"
-            )
-        
-        data = response.json()
-        if not data.get("users"):
-            raise HTTPException(status_code=401, detail="No user found for token")
-        
-        user_data = data["users"][0]
-        return {
-            "uid": user_data.get("localId"),
-            "phone_number": user_data.get("phoneNumber"),
-            "email": user_data.get("email"),
-            "name": user_data.get("displayName"),
-            "picture": user_data.get("photoUrl"),
-            "provider": "phone" if user_data.get("phoneNumber") else "email"
-        }
+    http_client = http_clients.get("google")
+    # Verify token with Firebase Auth REST API
+    url = f"https://identitytoolkit.googleapis.com/v1/accounts:lookup?key={FIREBASE_API_KEY}"
+    response = await http_client.post(url, json={"idToken": id_token})
+    
+    if response.status_code != 200:
+        error_data = response.json()
+        raise HTTPException(
+            status_code=401, 
+            detail=f"Invalid Firebase token: {error_data.get('error', {}).get('message', 'Unknown error')}"
+        )
+    
+    data = response.json()
+    if not data.get("users"):
+        raise HTTPException(status_code=401, detail="No user found for token")
+    
+    user_data = data["users"][0]
+    return {
+        "uid": user_data.get("localId"),
+        "phone_number": user_data.get("phoneNumber"),
+        "email": user_data.get("email"),
+        "name": user_data.get("displayName"),
+        "picture": user_data.get("photoUrl"),
+        "provider": "phone" if user_data.get("phoneNumber") else "email"
+    }
 
 @api_router.post("/auth/phone/callback", response_model=FirebasePhoneResponse)
 async def firebase_phone_callback(request: FirebasePhoneAuthRequest, response: Response):
@@ -1133,6 +1267,7 @@ async def firebase_phone_callback(request: FirebasePhoneAuthRequest, response: R
                     "updated_at": datetime.now(timezone.utc)
                 }}
             )
+            user_cache.invalidate(user["user_id"])
     
     # Create Miraii JWT token
     token = create_jwt_token(user["user_id"])
@@ -1245,34 +1380,58 @@ async def test_phone_verify(request: TestPhoneVerifyRequest, response: Response)
 
 async def verify_google_id_token(id_token: str) -> dict:
     """
-    Verify Google ID token using Google's tokeninfo endpoint.
+    Verify Google ID token offline against Google's cached signing keys,
+    falling back to the tokeninfo endpoint if no keys can be loaded.
     Returns user data including email, name, picture.
     """
-    async with httpx.AsyncClient() as client:
-        # Verify with Google's tokeninfo endpoint
-        response = await client.get(
-            f"https://oauth2.googleapis.com/tokeninfo?id_token={id_token}"
-        )
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid Google ID token")
-        
-        token_data = response.json()
-        
-        # Verify audience (client ID) if configured
-        if GOOGLE_CLIENT_ID and token_data.get("aud") != GOOGLE_CLIENT_ID:
-            logger.warning(f"Google token audience mismatch: {token_data.get('aud')} != {GOOGLE_CLIENT_ID}")
+    try:
+        claims = await verify_google_token(id_token)
+    except IdTokenError:
+        raise HTTPException(status_code=401, detail="Invalid Google ID token")
+    except KeySourceUnavailable as e:
+        logger.warning(f"Google signing keys unavailable, using tokeninfo: {e}")
+        claims = None
+    
+    if claims is not None:
+        if GOOGLE_CLIENT_ID and claims.get("aud") != GOOGLE_CLIENT_ID:
+            logger.warning(f"Google token audience mismatch: {claims.get('aud')} != {GOOGLE_CLIENT_ID}")
             # Allow anyway for development, but log warning
         
         return {
-            "sub": token_data.get("sub"),  # Google user ID
-            "email": token_data.get("email"),
-            "email_verified": token_data.get("email_verified") == "true",
-            "name": token_data.get("name"),
-            "picture": token_data.get("picture"),
-            "given_name": token_data.get("given_name"),
-            "family_name": token_data.get("family_name")
+            "sub": claims.get("sub"),
+            "email": claims.get("email"),
+            "email_verified": claims.get("email_verified") is True,
+            "name": claims.get("name"),
+            "picture": claims.get("picture"),
+            "given_name": claims.get("given_name"),
+            "family_name": claims.get("family_name")
         }
+    
+    http_client = http_clients.get("google")
+    # Verify with Google's tokeninfo endpoint
+    response = await http_client.get(
+        f"https://oauth2.googleapis.com/tokeninfo?id_token={id_token}"
+    )
+    
+    if response.status_code != 200:
+        raise HTTPException(status_code=401, detail="Invalid Google ID token")
+    
+    token_data = response.json()
+    
+    # Verify audience (client ID) if configured
+    if GOOGLE_CLIENT_ID and token_data.get("aud") != GOOGLE_CLIENT_ID:
+        logger.warning(f"Google token audience mismatch: {token_data.get('aud')} != {GOOGLE_CLIENT_ID}")
+        # Allow anyway for development, but log warning
+    
+    return {
+        "sub": token_data.get("sub"),  # Google user ID
+        "email": token_data.get("email"),
+        "email_verified": token_data.get("email_verified") == "true",
+        "name": token_data.get("name"),
+        "picture": token_data.get("picture"),
+        "given_name": token_data.get("given_name"),
+        "family_name": token_data.get("family_name")
+    }
 
 @api_router.post("/auth/google", response_model=GoogleAuthResponse)
 async def google_signin(request: GoogleAuthRequest, response: Response):
@@ -1332,6 +1491,7 @@ async def google_signin(request: GoogleAuthRequest, response: Response):
                 {"user_id": user["user_id"]},
                 {"$set": updates}
             )
+            user_cache.invalidate(user["user_id"])
             # Refresh user data
             user = await db.users.find_one({"user_id": user["user_id"]}, {"_id": 0})
     
@@ -1375,19 +1535,19 @@ async def google_session(request: Request, response: Response):
     if not session_id:
         raise HTTPException(status_code=400, detail="Session ID required")
     
-    async with httpx.AsyncClient() as client:
-        try:
-            res = await client.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": session_id}
-            )
-            if res.status_code != 200:
-                raise HTTPException(status_code=401, detail="Invalid session")
-            
-            user_data = res.json()
-        except Exception as e:
-            logger.error(f"Google auth error: {e}")
-            raise HTTPException(status_code=500, detail="Authentication failed")
+    http_client = http_clients.get("emergent_auth")
+    try:
+        res = await http_client.get(
+            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
+            headers={"X-Session-ID": session_id}
+        )
+        if res.status_code != 200:
+            raise HTTPException(status_code=401, detail="Invalid session")
+        
+        user_data = res.json()
+    except Exception as e:
+        logger.error(f"Google auth error: {e}")
+        raise HTTPException(status_code=500, detail="Authentication failed")
     
     # Find or create user
     user = await db.users.find_one({"email": user_data["email"]}, {"_id": 0})
@@ -1440,6 +1600,7 @@ async def logout(request: Request, response: Response):
     session_token = request.cookies.get("session_token")
     if session_token:
         await db.user_sessions.delete_one({"session_token": session_token})
+        session_cache.invalidate(session_token)
     
     response.delete_cookie(key="session_token", path="/")
     return {"message": "Logged out successfully"}
@@ -1456,6 +1617,7 @@ async def update_profile(profile: ProfileUpdate, current_user: dict = Depends(ge
         {"user_id": current_user["user_id"]},
         {"$set": update_data}
     )
+    user_cache.invalidate(current_user["user_id"])
     
     updated_user = await db.users.find_one({"user_id": current_user["user_id"]}, {"_id": 0})
     return updated_user
@@ -1467,53 +1629,352 @@ async def complete_onboarding(current_user: dict = Depends(get_current_user)):
         {"user_id": current_user["user_id"]},
         {"$set": {"onboarding_completed": True, "updated_at": datetime.now(timezone.utc)}}
     )
+    user_cache.invalidate(current_user["user_id"])
     return {"message": "Onboarding completed"}
 
 # ===================== HEALTH METRICS ENDPOINTS =====================
 
 @api_router.get("/metrics/latest")
 async def get_latest_metrics(current_user: dict = Depends(get_current_user)):
-    """Get latest health metrics for dashboard"""
-    user_id = current_user["user_id"]
-    
-    metric_types = ["heart_rate", "spo2", "sleep", "steps", "skin_temp", "hrv", "fall_detection", "workout"]
-    latest_metrics = {}
+    """Get latest health metrics for dashboard (single latest_vitals lookup)"""
+    return await get_latest_vitals(db, current_user["user_id"])
+
+SSE_HEARTBEAT_SECONDS = 15
+
+@api_router.get("/metrics/latest/stream")
+async def stream_latest_metrics(request: Request, current_user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events feed of the dashboard vitals.
     
-    for metric_type in metric_types:
-        metric = await db.health_metrics.find_one(
-            {"user_id": user_id, "metric_type": metric_type},
-            {"_id": 0},
-            sort=[("recorded_at", -1)]
-        )
-        if metric:
-            latest_metrics[metric_type] = metric
+    Sends one 'snapshot' event with the current latest vitals, then a 'delta'
+    event ({metric_type: newest doc}) whenever one of them changes. Idle
+    connections only cost a heartbeat comment, no database queries.
+    """
+    user_id = current_user["user_id"]
     
-    return latest_metrics
+    async def events():
+        # Subscribe before the snapshot read so no change falls in between
+        queue = vitals_pubsub.subscribe(user_id)
+        try:
+            latest = await get_latest_vitals(db, user_id)
+            sent_at = {t: m.get("recorded_at") for t, m in latest.items()}
+            yield format_sse("snapshot", latest)
+            
+            while not await request.is_disconnected():
+                try:
+                    delta = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                
+                # Out-of-order syncs may publish samples older than what the client has
+                fresh = {}
+                for metric_type, metric in delta.items():
+                    previous = sent_at.get(metric_type)
+                    if previous is None or as_utc(metric["recorded_at"]) >= as_utc(previous):
+                        fresh[metric_type] = metric
+                        sent_at[metric_type] = metric["recorded_at"]
+                if fresh:
+                    yield format_sse("delta", fresh)
+        finally:
+            vitals_pubsub.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+HISTORY_MAX_POINTS_LIMIT = 5000
+# Raw readings max_points will load to downsample; larger ranges should use a rollup resolution
+HISTORY_DOWNSAMPLE_MAX_ROWS = int(os.environ.get('HISTORY_DOWNSAMPLE_MAX_ROWS', '200000'))
+HISTORY_FORMATS = ("json", "ndjson", "columnar")
+
+def columnar_response(payload: dict, encoding: str) -> Response:
+    """Serialize a columnar series payload (compact JSON or MessagePack)"""
+    try:
+        body, media_type = encode_columnar(payload, encoding)
+    except RuntimeError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    return Response(content=body, media_type=media_type)
 
 @api_router.get("/metrics/{metric_type}/history")
-async def get_metric_history(metric_type: str, days: int = 7, current_user: dict = Depends(get_current_user)):
-    """Get metric history for charts"""
+async def get_metric_history(
+    metric_type: str,
+    response: Response,
+    days: int = 7,
+    resolution: str = "raw",
+    max_points: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fmt: str = Query("json", alias="format"),
+    encoding: str = "json",
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get metric history for charts.
+    
+    resolution: 'raw' (stored readings), 'minute', 'hour', 'day' (min/max/avg/count
+    buckets) or 'auto' (coarsest bucket that still gives the chart enough points)
+    max_points: downsample the raw series server-side (LTTB) to at most this many points;
+    400 when the range holds more than HISTORY_DOWNSAMPLE_MAX_ROWS readings
+    limit / cursor: keyset pagination; returns {"items", "next_cursor"}
+    format: 'json', 'ndjson' (streams raw rows as the cursor yields them; every row
+    unless limit is given, then a final {"next_cursor"} line when more remain) or
+    'columnar' (shared header + parallel epoch-ms / value arrays)
+    encoding: 'json' or 'msgpack' (columnar only)
+    
+    Without limit/cursor the first HISTORY_DEFAULT_LIMIT rows are returned as a list
+    and an X-Next-Cursor header points at the rest.
+    
+    Bucketed series whose oldest part is not rolled up yet (and too large to bucket
+    from raw on the fly) come back with X-Partial-History: true.
+    """
     user_id = current_user["user_id"]
     since = datetime.now(timezone.utc) - timedelta(days=days)
+    header = {"user_id": user_id, "metric_type": metric_type}
+    columnar = fmt == "columnar"
+    
+    if fmt not in HISTORY_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {fmt}")
+    if encoding not in COLUMNAR_ENCODINGS or (encoding != "json" and not columnar):
+        raise HTTPException(status_code=400, detail=f"Unsupported encoding '{encoding}' for format '{fmt}'")
+    
+    if resolution != "raw":
+        if resolution == "auto":
+            resolution = pick_resolution(days)
+        elif resolution not in ROLLUP_RESOLUTIONS:
+            raise HTTPException(status_code=400, detail=f"Unknown resolution: {resolution}")
+        buckets, partial = await get_rollup_series(db, user_id, metric_type, since, resolution)
+        if partial:
+            # Oldest part of the window isn't rolled up yet; a rebuild is running
+            response.headers["X-Partial-History"] = "true"
+        if columnar:
+            return columnar_response(
+                rollup_columns(buckets, {**header, "resolution": resolution, "partial": partial}),
+                encoding
+            )
+        return buckets
     
-    metrics = await db.health_metrics.find(
-        {
-            "user_id": user_id,
-            "metric_type": metric_type,
-            "recorded_at": {"$gte": since}
-        },
-        {"_id": 0}
-    ).sort("recorded_at", 1).to_list(1000)
+    if max_points is not None:
+        if not 3 <= max_points <= HISTORY_MAX_POINTS_LIMIT:
+            raise HTTPException(status_code=400, detail=f"max_points must be between 3 and {HISTORY_MAX_POINTS_LIMIT}")
+        query = metric_filter(user_id, metric_type, since=since)
+        if await db.health_metrics.count_documents(query, limit=HISTORY_DOWNSAMPLE_MAX_ROWS + 1) > HISTORY_DOWNSAMPLE_MAX_ROWS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"More than {HISTORY_DOWNSAMPLE_MAX_ROWS} readings in range; use fewer days or resolution=hour/day"
+            )
+        # Chart series only need time and value, never the metadata dict
+        rows = await db.health_metrics.find(
+            query,
+            {"_id": 0, "recorded_at": 1, "value": 1, "unit": 1, "status": 1}
+        ).sort("recorded_at", 1).limit(HISTORY_DOWNSAMPLE_MAX_ROWS).to_list(HISTORY_DOWNSAMPLE_MAX_ROWS)
+        rows = downsample_rows(rows, max_points)
+        if columnar:
+            return columnar_response(raw_columns(rows, {**header, "resolution": "raw"}), encoding)
+        return rows
+    
+    query = metric_filter(user_id, metric_type, since=since)
+    paged = limit is not None or bool(cursor)
+    page_size = limit if limit is not None else HISTORY_DEFAULT_LIMIT
+    if not 1 <= page_size <= HISTORY_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {HISTORY_PAGE_MAX}")
     
-    return metrics
+    try:
+        if cursor:
+            # Reject malformed tokens up front rather than mid-stream
+            decode_cursor(cursor)
+        if fmt == "ndjson":
+            return StreamingResponse(
+                stream_ndjson(db.health_metrics, query, cursor, limit),
+                media_type="application/x-ndjson"
+            )
+        items, next_cursor = await fetch_page(db.health_metrics, query, page_size, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if columnar:
+        payload = raw_columns(items, {**header, "resolution": "raw", "next_cursor": next_cursor})
+        return columnar_response(payload, encoding)
+    if paged:
+        return {"items": items, "next_cursor": next_cursor}
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+async def ingest_metrics(docs: List[dict]):
+    """
+    Hand metric documents to the write-behind buffer (flushed with other
+    requests' samples in the next batch), or write directly when it is not running.
+    Raises IngestBufferFull when the buffer is at capacity.
+    """
+    if metric_buffer.running:
+        metric_buffer.submit(docs)
+    else:
+        await write_metrics(db, docs)
 
 @api_router.post("/metrics")
 async def add_metric(metric: HealthMetric, current_user: dict = Depends(get_current_user)):
     """Add a health metric (for demo/simulation)"""
     metric.user_id = current_user["user_id"]
-    await db.health_metrics.insert_one(metric.dict())
+    try:
+        await ingest_metrics([metric.dict()])
+    except IngestBufferFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Metric ingestion is busy. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     return {"message": "Metric recorded", "metric_id": metric.metric_id}
 
+@api_router.post("/metrics/batch")
+async def add_metrics_batch(batch: HealthMetricBatch, current_user: dict = Depends(get_current_user)):
+    """Add buffered ring samples in bulk (chunked, unordered inserts)"""
+    user_id = current_user["user_id"]
+    chunk_results = []
+    offset = 0
+    
+    for chunk_index, chunk in enumerate(chunked(batch.samples, METRICS_BATCH_CHUNK_SIZE)):
+        docs = []
+        doc_positions = []
+        errors = []
+        
+        # Validate the whole chunk up front; invalid samples are rejected, not fatal
+        for position, sample in enumerate(chunk, start=offset):
+            try:
+                metric = HealthMetric(**{**sample, "user_id": user_id})
+            except ValidationError as e:
+                errors.append({"index": position, "error": e.errors()[0].get("msg", "invalid sample")})
+                continue
+            docs.append(metric.dict())
+            doc_positions.append(position)
+        
+        inserted, write_errors = await write_metrics(db, docs)
+        for err in write_errors:
+            errors.append({"index": doc_positions[err["index"]], "error": err["error"]})
+        
+        chunk_results.append({
+            "chunk": chunk_index,
+            "received": len(chunk),
+            "accepted": inserted,
+            "rejected": len(chunk) - inserted,
+            "errors": errors
+        })
+        offset += len(chunk)
+    
+    accepted = sum(c["accepted"] for c in chunk_results)
+    logger.info(f"Batch ingest for user {user_id}: {accepted}/{len(batch.samples)} samples accepted")
+    
+    return {
+        "message": "Batch processed",
+        "received": len(batch.samples),
+        "accepted": accepted,
+        "rejected": len(batch.samples) - accepted,
+        "chunks": chunk_results
+    }
+
+# ===================== LIVE VITALS WEBSOCKET =====================
+
+WS_ACK_MAX_SAMPLES = 50  # Ack (and hand off to ingestion) after this many samples...
+WS_ACK_INTERVAL = 1.0    # ...or this many seconds after the first unacked sample
+
+def parse_compact_sample(frame: dict, user_id: str) -> dict:
+    """
+    Expand a compact ring frame into a HealthMetric document.
+    Frame keys: m=metric_type, v=value, t=epoch ms (optional), u=unit, s=status
+    """
+    sample = {"user_id": user_id, "metric_type": frame.get("m"), "value": frame.get("v")}
+    if frame.get("t") is not None:
+        sample["recorded_at"] = datetime.fromtimestamp(frame["t"] / 1000, tz=timezone.utc)
+    if frame.get("u") is not None:
+        sample["unit"] = frame["u"]
+    if frame.get("s") is not None:
+        sample["status"] = frame["s"]
+    return HealthMetric(**sample).dict()
+
+async def authenticate_websocket(websocket: WebSocket) -> Optional[dict]:
+    """Authenticate once per connection: Authorization header, session cookie or ?token="""
+    try:
+        return await get_current_user(websocket)
+    except HTTPException:
+        pass
+    
+    token = websocket.query_params.get("token")
+    user_id = verify_jwt_token(token) if token else None
+    if user_id:
+        return await load_user(user_id)
+    return None
+
+@api_router.websocket("/ws/vitals")
+async def live_vitals_socket(websocket: WebSocket):
+    """
+    Stream ring samples over one authenticated connection.
+    
+    Each frame is a compact sample ({"m", "v", "t", "u", "s"}) or a list of them.
+    Samples go through the same ingestion path as POST /metrics and are
+    acknowledged per batch: {"type": "ack", "accepted": n, "rejected": n, "total": n}
+    """
+    user = await authenticate_websocket(websocket)
+    if not user:
+        await websocket.close(code=4401)
+        return
+    
+    await websocket.accept()
+    user_id = user["user_id"]
+    loop = asyncio.get_running_loop()
+    pending = []
+    rejected = 0
+    total_accepted = 0
+    ack_deadline = None
+    
+    async def flush_and_ack():
+        nonlocal pending, rejected, total_accepted, ack_deadline
+        accepted = len(pending)
+        if pending:
+            try:
+                await ingest_metrics(pending)
+            except IngestBufferFull as e:
+                await websocket.send_json({"type": "busy", "rejected": len(pending) + rejected, "retry_after": e.retry_after})
+                pending, rejected, ack_deadline = [], 0, None
+                return
+        total_accepted += accepted
+        await websocket.send_json({"type": "ack", "accepted": accepted, "rejected": rejected, "total": total_accepted})
+        pending, rejected, ack_deadline = [], 0, None
+    
+    try:
+        while True:
+            timeout = None if ack_deadline is None else max(0.0, ack_deadline - loop.time())
+            try:
+                message = await asyncio.wait_for(websocket.receive_text(), timeout)
+            except asyncio.TimeoutError:
+                await flush_and_ack()
+                continue
+            
+            try:
+                frames = json.loads(message)
+            except json.JSONDecodeError:
+                rejected += 1
+                frames = []
+            for frame in frames if isinstance(frames, list) else [frames]:
+                try:
+                    pending.append(parse_compact_sample(frame, user_id))
+                except (ValidationError, TypeError, ValueError, AttributeError, OverflowError):
+                    rejected += 1
+            
+            if ack_deadline is None and (pending or rejected):
+                ack_deadline = loop.time() + WS_ACK_INTERVAL
+            if len(pending) >= WS_ACK_MAX_SAMPLES:
+                await flush_and_ack()
+    except WebSocketDisconnect:
+        if pending:
+            # Keep samples that arrived after the last ack
+            try:
+                await ingest_metrics(pending)
+            except IngestBufferFull:
+                logger.warning(f"Dropped {len(pending)} live samples for {user_id}: buffer full")
+        logger.info(f"Live vitals socket closed for {user_id} ({total_accepted + len(pending)} samples)")
+
 # ===================== ALERTS ENDPOINTS =====================
 
 @api_router.get("/alerts")
@@ -1767,8 +2228,58 @@ async def update_daily_summary_settings(
         {"_id": 0}
     )
     
+    # Reschedule if anything affecting delivery changed
+    if {"enabled", "delivery_time", "timezone"} & update_data.keys() or "next_due_at" not in settings:
+        schedule = schedule_fields(settings, datetime.now(timezone.utc))
+        await db.daily_summary_settings.update_one({"user_id": user_id}, {"$set": schedule})
+        settings.update(schedule)
+    
     return {"message": "Settings updated", "settings": settings}
 
+async def build_daily_summary(user_id: str, start_of_yesterday: datetime, date_str: str, settings: Optional[dict] = None) -> dict:
+    """Collect the sleep / heart / activity / other sections for one summary day"""
+    window = (start_of_yesterday, start_of_yesterday + timedelta(days=1))
+    stats = await daily_stats_batch(db, {user_id: window})
+    return summary_sections(stats[user_id], date_str, settings)
+
+async def deliver_daily_summaries(settings_batch: List[dict]) -> Dict[str, Optional[str]]:
+    """
+    Scheduler callback: queue summaries for a claimed chunk.
+    One users query and one stats aggregation cover the whole chunk; each
+    user's summary is rendered once and queued as one message for all
+    of its recipients.
+    Returns: {user_id: error or None}
+    """
+    user_ids = [s["user_id"] for s in settings_batch]
+    users = {
+        u["user_id"]: u
+        async for u in db.users.find({"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "name": 1, "email": 1})
+    }
+    
+    windows = {}
+    for settings in settings_batch:
+        day_start = summary_day(settings, settings["next_due_at"].replace(tzinfo=timezone.utc))
+        windows[settings["user_id"]] = (day_start, day_start + timedelta(days=1))
+    stats = await daily_stats_batch(db, windows)
+    
+    errors: Dict[str, Optional[str]] = {}
+    for settings in settings_batch:
+        user = users.get(settings["user_id"])
+        if not user:
+            errors[settings["user_id"]] = "User not found"
+            continue
+        
+        summary = summary_sections(stats[user["user_id"]], windows[user["user_id"]][0].strftime("%A, %B %d, %Y"), settings)
+        try:
+            await EmailService.queue_daily_summary_batch(
+                EmailService.get_daily_summary_recipients(settings, user),
+                **summary
+            )
+            errors[user["user_id"]] = None
+        except Exception as e:
+            errors[user["user_id"]] = str(e)
+    return errors
+
 @api_router.post("/settings/daily-summary/send-test")
 async def send_test_daily_summary(current_user: dict = Depends(get_current_user)):
     """Send a test daily summary email to the user"""
@@ -1782,120 +2293,34 @@ async def send_test_daily_summary(current_user: dict = Depends(get_current_user)
     # Get yesterday's date
     yesterday = datetime.now(timezone.utc) - timedelta(days=1)
     date_str = yesterday.strftime("%A, %B %d, %Y")
-    
-    # Fetch metrics for yesterday
     start_of_yesterday = yesterday.replace(hour=0, minute=0, second=0, microsecond=0)
-    end_of_yesterday = start_of_yesterday + timedelta(days=1)
-    
-    # Get sleep data
-    sleep_metric = await db.health_metrics.find_one(
-        {
-            "user_id": user_id,
-            "metric_type": "sleep",
-            "recorded_at": {"$gte": start_of_yesterday, "$lt": end_of_yesterday}
-        },
-        {"_id": 0},
-        sort=[("recorded_at", -1)]
-    )
-    
-    # Get heart rate data
-    heart_metrics = await db.health_metrics.find(
-        {
-            "user_id": user_id,
-            "metric_type": {"$in": ["heart_rate", "hrv"]},
-            "recorded_at": {"$gte": start_of_yesterday, "$lt": end_of_yesterday}
-        },
-        {"_id": 0}
-    ).to_list(100)
-    
-    # Get steps data
-    steps_metric = await db.health_metrics.find_one(
-        {
-            "user_id": user_id,
-            "metric_type": "steps",
-            "recorded_at": {"$gte": start_of_yesterday, "$lt": end_of_yesterday}
-        },
-        {"_id": 0},
-        sort=[("recorded_at", -1)]
-    )
-    
-    # Get SpO2 data
-    spo2_metric = await db.health_metrics.find_one(
-        {
-            "user_id": user_id,
-            "metric_type": "spo2",
-            "recorded_at": {"$gte": start_of_yesterday, "$lt": end_of_yesterday}
-        },
-        {"_id": 0},
-        sort=[("recorded_at", -1)]
-    )
-    
-    # Build summary data with defaults
-    sleep_data = {
-        "duration": sleep_metric.get("metadata", {}).get("duration", "7h 32m") if sleep_metric else "7h 32m",
-        "score": sleep_metric.get("value", 82) if sleep_metric else 82,
-        "stages": sleep_metric.get("metadata", {}).get("stages", "1h 45m / 4h 12m / 1h 35m") if sleep_metric else "1h 45m / 4h 12m / 1h 35m",
-        "apnea_risk": sleep_metric.get("metadata", {}).get("apnea_risk", "low") if sleep_metric else "low"
-    }
-    
-    # Calculate average heart rate
-    hr_values = [m["value"] for m in heart_metrics if m["metric_type"] == "heart_rate"]
-    hrv_values = [m["value"] for m in heart_metrics if m["metric_type"] == "hrv"]
-    
-    heart_data = {
-        "avg_hr": round(sum(hr_values) / len(hr_values)) if hr_values else 72,
-        "rhr": 62,  # Would come from specific resting HR calculation
-        "hrv": round(sum(hrv_values) / len(hrv_values)) if hrv_values else 45,
-        "vo2max": 38,  # Would be calculated separately
-        "irregularity_note": None
-    }
     
-    activity_data = {
-        "steps": steps_metric.get("value", 8432) if steps_metric else 8432,
-        "goal": 8000,
-        "workouts": 1,
-        "active_minutes": 45
-    }
-    
-    other_data = {
-        "spo2": spo2_metric.get("value", 98) if spo2_metric else 98,
-        "skin_temp_status": "Normal"
-    }
+    settings = await db.daily_summary_settings.find_one({"user_id": user_id}, {"_id": 0})
+    summary = await build_daily_summary(user_id, start_of_yesterday, date_str, settings)
     
-    # Generate insight
-    insight = "Your sleep quality was excellent last night! Your HRV is trending upward, indicating good recovery."
-    
-    # Send the email
-    result = await EmailService.send_daily_summary_email(
+    # Queue the email
+    message_id = await EmailService.queue_daily_summary_email(
         to_email=user_email,
         recipient_name=user_name,
         user_name=user_name,
-        date_str=date_str,
-        sleep_data=sleep_data,
-        heart_data=heart_data,
-        activity_data=activity_data,
-        other_data=other_data,
-        insight=insight,
-        is_caregiver=False
+        is_caregiver=False,
+        **summary
     )
     
-    if result.get("demo_mode"):
+    if message_id is None:
         return {
             "message": "Test email generated (demo mode - email provider not configured)",
             "preview_data": {
                 "date": date_str,
-                "sleep": sleep_data,
-                "heart": heart_data,
-                "activity": activity_data,
-                "other": other_data,
-                "insight": insight
+                "sleep": summary["sleep_data"],
+                "heart": summary["heart_data"],
+                "activity": summary["activity_data"],
+                "other": summary["other_data"],
+                "insight": summary["insight"]
             },
             "note": "Add EMAIL_API_KEY to .env to enable real email delivery"
         }
-    elif result.get("success"):
-        return {"message": f"Test daily summary sent to {user_email}"}
-    else:
-        raise HTTPException(status_code=500, detail=f"Failed to send email: {result.get('message')}")
+    return {"message": f"Test daily summary queued for {user_email}", "message_id": message_id}
 
 # ===================== SOS INCIDENT ENDPOINTS =====================
 
@@ -1953,24 +2378,21 @@ Please check on them immediately."""
 @api_router.post("/sos/trigger")
 async def trigger_sos(request: SOSTriggerRequest, current_user: dict = Depends(get_current_user)):
     """Trigger an SOS alert with vitals and location"""
+    triggered_at = time.monotonic()
     user_id = current_user["user_id"]
     user_name = current_user.get("name", "Miraii User")
     
-    # Get default vitals from latest metrics if not provided
+    # Vitals backfill and both contact lists in one concurrent round trip
     vitals = request.vitals or SOSVitals()
-    if not vitals.heart_rate or not vitals.spo2:
-        latest = await db.health_metrics.find(
-            {"user_id": user_id, "metric_type": {"$in": ["heart_rate", "spo2"]}},
-            {"_id": 0}
-        ).sort("recorded_at", -1).to_list(2)
-        
-        for metric in latest:
-            if metric["metric_type"] == "heart_rate" and not vitals.heart_rate:
-                vitals.heart_rate = metric.get("value")
-                vitals.heart_rate_status = metric.get("status", "Normal")
-            elif metric["metric_type"] == "spo2" and not vitals.spo2:
-                vitals.spo2 = metric.get("value")
-                vitals.spo2_status = metric.get("status", "Normal")
+    latest, emergency_contacts, health_contacts = await load_sos_context(
+        db, user_id, need_vitals=not vitals.heart_rate or not vitals.spo2
+    )
+    if "heart_rate" in latest and not vitals.heart_rate:
+        vitals.heart_rate = latest["heart_rate"].get("value")
+        vitals.heart_rate_status = latest["heart_rate"].get("status", "Normal")
+    if "spo2" in latest and not vitals.spo2:
+        vitals.spo2 = latest["spo2"].get("value")
+        vitals.spo2_status = latest["spo2"].get("status", "Normal")
     
     # Use provided location or mark as unavailable
     location = request.location or SOSLocation()
@@ -1979,47 +2401,17 @@ async def trigger_sos(request: SOSTriggerRequest, current_user: dict = Depends(g
     trigger_type = "fall_detected" if request.trigger_source == "fall_detection" else "manual_sos"
     message = generate_sos_message(user_name, trigger_type, request.trigger_source, vitals, location)
     
-    # Get all contacts to notify (emergency + health sharing)
-    emergency_contacts = await db.emergency_contacts.find(
-        {"user_id": user_id}, {"_id": 0}
-    ).to_list(20)
-    
-    health_contacts = await db.health_sharing.find(
-        {"user_id": user_id, "sharing_enabled": True}, {"_id": 0}
-    ).to_list(20)
-    
-    # Combine and deduplicate contacts by phone
-    all_contacts = {}
-    for contact in emergency_contacts:
-        all_contacts[contact["phone"]] = {
-            "id": contact.get("contact_id", str(uuid.uuid4())),
-            "name": contact["name"],
-            "phone": contact["phone"],
-            "is_primary": contact.get("is_primary", False)
-        }
-    for contact in health_contacts:
-        if contact["phone"] not in all_contacts:
-            all_contacts[contact["phone"]] = {
-                "id": contact.get("sharing_id", str(uuid.uuid4())),
-                "name": contact["name"],
-                "phone": contact["phone"],
-                "is_primary": False
-            }
+    # Emergency + health sharing contacts, deduplicated by phone
+    contacts = merge_sos_contacts(emergency_contacts, health_contacts)
     
-    # Record notifications
-    notifications = []
-    for phone, contact in all_contacts.items():
-        notifications.append(SOSContactNotification(
-            contact_id=contact["id"],
-            contact_name=contact["name"],
-            contact_phone=contact["phone"],
-            channel="sms",  # In production, this would be based on settings
-            status="sent",  # In production, this would reflect actual send status
-            sent_at=datetime.now(timezone.utc)
-        ))
+    # One notification per reachable (contact, channel); sent by the dispatcher after the response
+    incident_id = str(uuid.uuid4())
+    entries, deliveries = plan_deliveries(incident_id, contacts, message, sos_dispatcher.channels)
+    notifications = [SOSContactNotification(**entry) for entry in entries]
     
     # Create incident record
     incident = SOSIncident(
+        incident_id=incident_id,
         user_id=user_id,
         user_name=user_name,
         trigger_source=request.trigger_source,
@@ -2031,28 +2423,29 @@ async def trigger_sos(request: SOSTriggerRequest, current_user: dict = Depends(g
         status="active"
     )
     
-    await db.sos_incidents.insert_one(incident.dict())
-    
     # Also create an alert for the app
     alert = Alert(
         user_id=user_id,
         alert_type="sos_triggered",
         title="SOS Alert Sent",
-        description=f"Emergency alert sent to {len(notifications)} contacts",
+        description=f"Emergency alert sent to {len(contacts)} contacts",
         metadata={
             "incident_id": incident.incident_id,
             "trigger_source": request.trigger_source,
-            "contacts_count": len(notifications)
+            "contacts_count": len(contacts)
         }
     )
-    await db.alerts.insert_one(alert.dict())
+    await write_sos_incident(db, incident.dict(), alert.dict())
+    
+    sos_dispatcher.dispatch(incident.incident_id, deliveries, triggered_at)
     
-    logger.info(f"SOS triggered for user {user_id}, {len(notifications)} contacts notified")
+    logger.info(f"SOS triggered for user {user_id}, {len(deliveries)} notifications to {len(contacts)} contacts queued")
     
     return {
         "message": "SOS alert sent successfully",
         "incident_id": incident.incident_id,
-        "contacts_notified": len(notifications),
+        "contacts_notified": len(contacts),
+        "notifications_queued": len(deliveries),
         "vitals_included": {
             "heart_rate": vitals.heart_rate is not None,
             "spo2": vitals.spo2 is not None
@@ -2151,7 +2544,8 @@ User's name: {current_user.get('name', 'Friend')}
         chat = LlmChat(
             api_key=EMERGENT_LLM_KEY,
             session_id=f"elai_{user_id}",
-            system_message=system_message
+            system_message=system_message,
+            http_client=http_clients.get("llm")
         ).with_model("openai", "gpt-5.1")
         
         user_message = UserMessage(text=request.message)
@@ -2245,7 +2639,9 @@ async def seed_demo_data(current_user: dict = Depends(get_current_user)):
     now = datetime.now(timezone.utc)
     
     # Clear existing data
-    await db.health_metrics.delete_many({"user_id": user_id})
+    await db.health_metrics.delete_many(metric_filter(user_id))
+    await clear_latest_vitals(db, user_id)
+    await db.metric_rollups.delete_many({"user_id": user_id})
     await db.alerts.delete_many({"user_id": user_id})
     await db.pill_reminders.delete_many({"user_id": user_id})
     await db.health_sharing.delete_many({"user_id": user_id})
@@ -2348,7 +2744,7 @@ async def seed_demo_data(current_user: dict = Depends(get_current_user)):
             "metadata": {}
         }
     ]
-    await db.health_metrics.insert_many(metrics)
+    await write_metrics(db, metrics)
     
     # Seed alerts
     alerts = [
@@ -2459,6 +2855,55 @@ async def get_fall_history(current_user: dict = Depends(get_current_user)):
     ).sort("timestamp", -1).to_list(50)
     return events
 
+# ===================== STATUS ENDPOINTS =====================
+
+async def require_status_key(request: Request):
+    """Status endpoints are for operators only: X-Status-Key must match STATUS_API_KEY"""
+    if not STATUS_API_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("X-Status-Key", ""), STATUS_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid status key")
+
+status_router = APIRouter(prefix="/status", dependencies=[Depends(require_status_key)])
+
+@status_router.get("/caches")
+async def get_cache_stats():
+    """Hit / miss counters for the in-process caches"""
+    return {"caches": [user_cache.stats(), session_cache.stats()]}
+
+@status_router.get("/email-outbox")
+async def get_email_outbox_stats():
+    """Outbox backlog by delivery status plus this worker's send counters"""
+    counts = await email_outbox.status_counts(db) if not MOCK_MODE else {}
+    return {"running": email_outbox.running, "workers": email_outbox.workers, "by_status": counts, "processed": email_outbox.stats}
+
+@status_router.get("/email-providers")
+async def get_email_provider_stats():
+    """Provider chain routing order, breaker states, p95 latency and recent failover decisions"""
+    return email_router.stats()
+
+@status_router.get("/sos")
+async def get_sos_stats():
+    """SOS dispatcher queues, per-channel outcomes and trigger -> last attempt latency"""
+    return sos_dispatcher.status()
+
+@status_router.get("/daily-summaries")
+async def get_daily_summary_scheduler_stats():
+    """Claim / delivery counters for the daily summary scheduler"""
+    return {"enabled": DAILY_SUMMARY_SCHEDULER_ENABLED, "stats": daily_summary_scheduler.stats}
+
+@status_router.get("/rate-limits")
+async def get_rate_limit_stats():
+    """Allowed / limited counters for the in-memory rate limiters"""
+    return {"limiters": [otp_send_limiter.stats(), route_limiter.stats()]}
+
+@status_router.get("/http")
+async def get_http_pool_stats():
+    """Connection pool utilisation of the shared upstream HTTP clients"""
+    return {"upstreams": http_clients.stats()}
+
+api_router.include_router(status_router)
+
 # ===================== ROOT ENDPOINT =====================
 
 @api_router.get("/")
@@ -2481,6 +2926,16 @@ ALLOWED_ORIGINS = [
     "https://jbxjcl-dv2vif-3000.preview.emergentagent.com",
 ]
 
+async def rate_limit_key(request: Request) -> str:
+    """Signed-in callers are limited per user (no DB lookup), everyone else per client IP"""
+    auth_header = request.headers.get("Authorization", "")
+    token = auth_header[7:] if auth_header.startswith("Bearer ") else request.cookies.get("session_token")
+    user_id = verify_jwt_token(token) if token else None
+    return f"user:{user_id}" if user_id else f"ip:{client_ip(request)}"
+
+# Added before CORS so CORS (outermost) still decorates 429 responses
+app.add_middleware(RateLimitMiddleware, limiter=route_limiter, key_func=rate_limit_key)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -2491,4 +2946,17 @@ app.add_middleware(
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Flush buffered samples before the Mongo client goes away
+    await metric_buffer.stop()
+    await daily_summary_scheduler.stop()
+    await email_outbox.stop()
+    await sos_dispatcher.stop()
+    if RATE_LIMIT_PERSIST and not MOCK_MODE:
+        try:
+            await save_buckets(db, otp_send_limiter)
+        except Exception as e:
+            logger.warning(f"Saving rate limit buckets failed: {e}")
+    await vitals_pubsub.stop_change_stream()
+    await stop_key_refresh()
+    await http_clients.close_all()
     client.close()
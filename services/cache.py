@@ -0,0 +1,97 @@
+"""
+In-Process Caches
+=================
+
+Bounded LRU + TTL cache used to keep hot documents out of Mongo:
+- user_cache: user documents keyed by user_id (get_current_user)
+- session_cache: {user_id, expires_at} keyed by cookie session_token
+
+Entries expire after their TTL even without explicit invalidation, which
+bounds staleness across workers; writers in this process invalidate
+explicitly so their own changes are visible immediately.
+
+Environment Variables:
+- USER_CACHE_MAX_SIZE: (Optional) Max cached users (default: 10000)
+- USER_CACHE_TTL_SECONDS: (Optional) Seconds a cached user stays valid (default: 60)
+- SESSION_CACHE_MAX_SIZE: (Optional) Max cached sessions (default: 20000)
+- SESSION_CACHE_TTL_SECONDS: (Optional) Seconds a cached session stays valid (default: 60)
+"""
+
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+SESSION_CACHE_MAX_SIZE = int(os.getenv("SESSION_CACHE_MAX_SIZE", "20000"))
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "60"))
+
+# ============================================================
+# LRU + TTL Cache
+# ============================================================
+
+class TTLCache:
+    """Least-recently-used cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+user_cache = TTLCache("users", USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+session_cache = TTLCache("sessions", SESSION_CACHE_MAX_SIZE, SESSION_CACHE_TTL_SECONDS)
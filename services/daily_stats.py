@@ -0,0 +1,249 @@
+"""
+Daily Stats Builder
+===================
+
+Sleep, heart, activity and SpO2 figures for the daily summary email,
+computed for a whole batch of users in one aggregation:
+
+    $match  (user_id, recorded_at) windows for every user, OR-ed
+    $facet  sleep  -> latest sleep reading per user
+            heart  -> avg heart_rate / hrv per user
+            steps  -> latest steps reading per user
+            spo2   -> latest spo2 reading per user
+
+Users in different timezones have different "yesterday" windows; users
+sharing a window share one $in clause. Field paths go through
+metric_field() so the pipeline works in time-series storage mode too.
+The per-facet $sort stages can outgrow the 100MB in-memory sort limit on
+large batches, so the pipeline runs with allowDiskUse.
+
+CLI:
+    python -m services.daily_stats bench --users 500   # per-user queries vs one batched pipeline
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.metrics_store import metric_field
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+SUMMARY_METRIC_TYPES = ["sleep", "heart_rate", "hrv", "steps", "spo2"]
+SUMMARY_STEP_GOAL = 8000
+SUMMARY_SECTIONS = ("sleep", "heart", "activity", "other")
+
+# Window = (start inclusive, end exclusive), in UTC
+Window = Tuple[datetime, datetime]
+
+# ============================================================
+# Batched Aggregation
+# ============================================================
+
+def _latest_per_user(metric_type: str, user_path: str, type_path: str) -> List[Dict[str, Any]]:
+    return [
+        {"$match": {type_path: metric_type}},
+        {"$sort": {"recorded_at": -1}},
+        {"$group": {"_id": f"${user_path}", "value": {"$first": "$value"}, "metadata": {"$first": "$metadata"}}},
+    ]
+
+
+def build_daily_stats_pipeline(windows: Dict[str, Window]) -> List[Dict[str, Any]]:
+    user_path = metric_field("user_id")
+    type_path = metric_field("metric_type")
+
+    users_by_window: Dict[Window, List[str]] = defaultdict(list)
+    for user_id, window in windows.items():
+        users_by_window[window].append(user_id)
+
+    return [
+        {"$match": {
+            type_path: {"$in": SUMMARY_METRIC_TYPES},
+            "$or": [
+                {user_path: {"$in": user_ids}, "recorded_at": {"$gte": start, "$lt": end}}
+                for (start, end), user_ids in users_by_window.items()
+            ]
+        }},
+        {"$facet": {
+            "sleep": _latest_per_user("sleep", user_path, type_path),
+            "steps": _latest_per_user("steps", user_path, type_path),
+            "spo2": _latest_per_user("spo2", user_path, type_path),
+            "heart": [
+                {"$match": {type_path: {"$in": ["heart_rate", "hrv"]}}},
+                {"$group": {
+                    "_id": {"user_id": f"${user_path}", "metric_type": f"${type_path}"},
+                    "avg": {"$avg": "$value"}
+                }},
+            ],
+        }},
+    ]
+
+
+async def daily_stats_batch(db, windows: Dict[str, Window]) -> Dict[str, Dict[str, Any]]:
+    """
+    Raw per-user figures for each user's window.
+    Returns: {user_id: {"sleep": doc|None, "steps": doc|None, "spo2": doc|None,
+                        "avg_hr": float|None, "avg_hrv": float|None}}
+    """
+    stats = {
+        user_id: {"sleep": None, "steps": None, "spo2": None, "avg_hr": None, "avg_hrv": None}
+        for user_id in windows
+    }
+    if not windows:
+        return stats
+
+    result = await db.health_metrics.aggregate(build_daily_stats_pipeline(windows), allowDiskUse=True).to_list(1)
+    facets = result[0] if result else {}
+
+    for name in ("sleep", "steps", "spo2"):
+        for row in facets.get(name, []):
+            if row["_id"] in stats:
+                stats[row["_id"]][name] = row
+    for row in facets.get("heart", []):
+        user_id = row["_id"]["user_id"]
+        if user_id in stats:
+            key = "avg_hr" if row["_id"]["metric_type"] == "heart_rate" else "avg_hrv"
+            stats[user_id][key] = row["avg"]
+    return stats
+
+
+def summary_sections(raw: Dict[str, Any], date_str: str, settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Email sections from one user's raw figures. Missing readings stay None
+    (rendered as "No data"); sections the user's include_* settings turn
+    off are None and left out of the email.
+    """
+    settings = settings or {}
+    included = {name: settings.get(f"include_{name}", True) for name in SUMMARY_SECTIONS}
+    sleep_metric = raw.get("sleep")
+    steps_metric = raw.get("steps")
+    spo2_metric = raw.get("spo2")
+    sleep_meta = (sleep_metric or {}).get("metadata") or {}
+
+    sections = {
+        "sleep": {
+            "duration": sleep_meta.get("duration"),
+            "score": sleep_metric.get("value") if sleep_metric else None,
+            "stages": sleep_meta.get("stages"),
+            "apnea_risk": sleep_meta.get("apnea_risk")
+        },
+        "heart": {
+            "avg_hr": round(raw["avg_hr"]) if raw.get("avg_hr") is not None else None,
+            "hrv": round(raw["avg_hrv"]) if raw.get("avg_hrv") is not None else None,
+            "irregularity_note": None
+        },
+        "activity": {
+            "steps": steps_metric.get("value") if steps_metric else None,
+            "goal": SUMMARY_STEP_GOAL
+        },
+        "other": {
+            "spo2": spo2_metric.get("value") if spo2_metric else None
+        },
+    }
+    has_data = any(raw.get(key) is not None for key in ("sleep", "steps", "spo2", "avg_hr", "avg_hrv"))
+
+    return {
+        "date_str": date_str,
+        "sleep_data": sections["sleep"] if included["sleep"] else None,
+        "heart_data": sections["heart"] if included["heart"] else None,
+        "activity_data": sections["activity"] if included["activity"] else None,
+        "other_data": sections["other"] if included["other"] else None,
+        "insight": None if has_data else "Your ring didn't record any data for this day."
+    }
+
+# ============================================================
+# Benchmark: per-user queries vs one batched pipeline
+# ============================================================
+
+async def _per_user_baseline(db, user_id: str, window: Window) -> Dict[str, Any]:
+    """The four-queries-per-user shape this module replaces"""
+    from services.metrics_store import metric_filter, from_storage
+
+    start, end = window
+    sleep = await db.health_metrics.find_one(metric_filter(user_id, "sleep", since=start, until=end), sort=[("recorded_at", -1)])
+    heart = await db.health_metrics.find(metric_filter(user_id, ["heart_rate", "hrv"], since=start, until=end)).to_list(100)
+    steps = await db.health_metrics.find_one(metric_filter(user_id, "steps", since=start, until=end), sort=[("recorded_at", -1)])
+    spo2 = await db.health_metrics.find_one(metric_filter(user_id, "spo2", since=start, until=end), sort=[("recorded_at", -1)])
+    hr = [m["value"] for m in map(from_storage, heart) if m["metric_type"] == "heart_rate"]
+    return {"sleep": sleep, "steps": steps, "spo2": spo2, "avg_hr": sum(hr) / len(hr) if hr else None}
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import random
+    import argparse
+    import asyncio
+    from pathlib import Path
+    from datetime import timedelta, timezone
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Daily stats builder tools")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--hr-samples", type=int, default=96, help="heart_rate samples per user per day")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    async def main():
+        from services.metric_ingest import chunked
+        from services.metrics_store import to_storage, ensure_metrics_collection
+        from services.db_indexes import apply_indexes
+
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        bench_db_name = os.environ.get("DB_NAME", "miraii") + "_bench_daily_stats"
+        db = client[bench_db_name]
+        try:
+            await client.drop_database(bench_db_name)
+            await ensure_metrics_collection(db)
+            await apply_indexes(db)
+
+            start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+            window = (start, start + timedelta(days=1))
+            user_ids = [f"bench_user_{i}" for i in range(args.users)]
+
+            docs = []
+            for user_id in user_ids:
+                for metric_type, count, low, high in (
+                    ("heart_rate", args.hr_samples, 55, 110), ("hrv", 24, 20, 80),
+                    ("steps", 1, 2000, 15000), ("spo2", 24, 93, 100), ("sleep", 1, 60, 95)
+                ):
+                    for _ in range(count):
+                        docs.append(to_storage({
+                            "metric_id": f"m_{random.getrandbits(64):x}",
+                            "user_id": user_id,
+                            "metric_type": metric_type,
+                            "value": random.randint(low, high),
+                            "recorded_at": start + timedelta(seconds=random.randint(0, 86399)),
+                        }))
+            for chunk in chunked(docs, 5000):
+                await db.health_metrics.insert_many(chunk, ordered=False)
+            print(f"Seeded {len(docs)} samples for {len(user_ids)} users")
+
+            t0 = time.perf_counter()
+            for user_id in user_ids:
+                await _per_user_baseline(db, user_id, window)
+            per_user = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            for batch in chunked(user_ids, args.batch_size):
+                await daily_stats_batch(db, {user_id: window for user_id in batch})
+            batched = time.perf_counter() - t0
+
+            print(f"per-user: {per_user:8.3f}s  ({4 * len(user_ids)} queries)")
+            print(f"batched:  {batched:8.3f}s  ({-(-len(user_ids) // args.batch_size)} aggregations)")
+            print(f"speedup:  {per_user / batched:8.1f}x")
+        finally:
+            await client.drop_database(bench_db_name)
+            client.close()
+
+    asyncio.run(main())
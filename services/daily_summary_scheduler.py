@@ -0,0 +1,264 @@
+"""
+Daily Summary Scheduler
+=======================
+
+Background delivery of daily health summaries at each user's chosen
+local time:
+- Every settings doc carries `next_due_at`: the next UTC minute its
+  delivery_time occurs in its timezone
+- Each minute the scheduler reads only the due range of the
+  (enabled, next_due_at) index, never the whole collection
+- Due users are claimed in chunks with one update_many that sets
+  `claim_id` and `last_sent_at`, so each user goes to exactly one worker
+- Claimed chunks are delivered through an injected callable with
+  bounded concurrency, then rescheduled to their next occurrence
+
+Environment Variables:
+- DAILY_SUMMARY_SCHEDULER_ENABLED: (Optional) 'false' to disable (default: 'true')
+- DAILY_SUMMARY_CHUNK_SIZE: (Optional) Users claimed per chunk (default: 200)
+- DAILY_SUMMARY_CONCURRENCY: (Optional) Chunks delivered at once (default: 4)
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime, time as dtime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+DAILY_SUMMARY_SCHEDULER_ENABLED = os.getenv("DAILY_SUMMARY_SCHEDULER_ENABLED", "true").lower() == "true"
+DAILY_SUMMARY_CHUNK_SIZE = int(os.getenv("DAILY_SUMMARY_CHUNK_SIZE", "200"))
+DAILY_SUMMARY_CONCURRENCY = int(os.getenv("DAILY_SUMMARY_CONCURRENCY", "4"))
+
+DEFAULT_DELIVERY_TIME = "07:00"
+CLAIM_TIMEOUT = timedelta(minutes=15)   # a claim older than this belonged to a dead worker
+MAX_LATENESS = timedelta(hours=12)      # after downtime, skip summaries this stale
+SCHEDULE_INPUTS = ("enabled", "delivery_time", "timezone")
+
+# settings docs -> {user_id: error message or None}
+DeliverCallable = Callable[[List[Dict[str, Any]]], Awaitable[Dict[str, Optional[str]]]]
+
+# ============================================================
+# Due-Time Calculation
+# ============================================================
+
+def user_zone(tz_name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(tz_name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("UTC")
+
+
+def parse_delivery_time(value: Optional[str]) -> dtime:
+    try:
+        hour, minute = (value or DEFAULT_DELIVERY_TIME).split(":")
+        return dtime(int(hour), int(minute))
+    except ValueError:
+        hour, minute = DEFAULT_DELIVERY_TIME.split(":")
+        return dtime(int(hour), int(minute))
+
+
+def next_due_at(delivery_time: Optional[str], tz_name: Optional[str], after: datetime) -> datetime:
+    """First UTC minute strictly after `after` at which it is delivery_time in tz_name"""
+    zone = user_zone(tz_name)
+    at = parse_delivery_time(delivery_time)
+    local_after = after.astimezone(zone)
+
+    day = local_after.date()
+    while True:
+        candidate = datetime.combine(day, at, tzinfo=zone).astimezone(timezone.utc)
+        if candidate > after:
+            return candidate
+        day += timedelta(days=1)
+
+
+def schedule_fields(settings: Dict[str, Any], after: datetime) -> Dict[str, Any]:
+    """$set fields that (re)schedule a settings doc; disabled docs leave the due index"""
+    if not settings.get("enabled"):
+        return {"next_due_at": None}
+    return {"next_due_at": next_due_at(settings.get("delivery_time"), settings.get("timezone"), after)}
+
+
+def summary_day(settings: Dict[str, Any], due_at: datetime) -> datetime:
+    """Start (as UTC) of the user's local 'yesterday' relative to a delivery instant"""
+    zone = user_zone(settings.get("timezone"))
+    local_today = due_at.astimezone(zone).date()
+    return datetime.combine(local_today - timedelta(days=1), dtime(0, 0), tzinfo=zone).astimezone(timezone.utc)
+
+# ============================================================
+# Scheduler
+# ============================================================
+
+class DailySummaryScheduler:
+    """Minute-tick loop that claims due users in chunks and hands them to `deliver`"""
+
+    def __init__(
+        self,
+        deliver: DeliverCallable,
+        chunk_size: int = DAILY_SUMMARY_CHUNK_SIZE,
+        concurrency: int = DAILY_SUMMARY_CONCURRENCY
+    ):
+        self.deliver = deliver
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.db = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"ticks": 0, "claimed": 0, "delivered": 0, "failed": 0, "skipped_stale": 0}
+
+    def start(self, db):
+        if self._task is None:
+            self.db = db
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def backfill(self) -> int:
+        """Schedule enabled settings saved before next_due_at existed. Returns: docs updated"""
+        now = datetime.now(timezone.utc)
+        operations = []
+        cursor = self.db.daily_summary_settings.find(
+            {"enabled": True, "next_due_at": {"$exists": False}},
+            {"_id": 0, "user_id": 1, "enabled": 1, "delivery_time": 1, "timezone": 1}
+        )
+        async for settings in cursor:
+            operations.append(UpdateOne({"user_id": settings["user_id"]}, {"$set": schedule_fields(settings, now)}))
+        if operations:
+            await self.db.daily_summary_settings.bulk_write(operations, ordered=False)
+            logger.info(f"Scheduled {len(operations)} existing daily summary settings")
+        return len(operations)
+
+    async def _run(self):
+        try:
+            await self.backfill()
+        except Exception as e:
+            logger.warning(f"Daily summary backfill failed: {e}")
+
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Daily summary tick failed: {e}")
+            # Wake just after the next minute boundary
+            now = datetime.now(timezone.utc)
+            await asyncio.sleep(60 - now.second - now.microsecond / 1_000_000 + 0.5)
+
+    async def tick(self, now: Optional[datetime] = None):
+        """Claim and deliver everything due at `now`"""
+        now = now or datetime.now(timezone.utc)
+        self.stats["ticks"] += 1
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending: List[asyncio.Task] = []
+
+        # Claim only when a delivery slot is free, so other workers can share a big bucket
+        while True:
+            await semaphore.acquire()
+            try:
+                chunk = await self._claim_chunk(now)
+            except Exception:
+                semaphore.release()
+                raise
+            if not chunk:
+                semaphore.release()
+                break
+            task = asyncio.create_task(self._deliver_chunk(chunk, now))
+            task.add_done_callback(lambda _: semaphore.release())
+            pending.append(task)
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def _claim_chunk(self, now: datetime) -> List[Dict[str, Any]]:
+        """Claim up to chunk_size due users. Returns: [] only once nothing is left to claim"""
+        due = {
+            "enabled": True,
+            "next_due_at": {"$lte": now},
+            "$or": [{"claim_id": None}, {"claimed_at": {"$lt": now - CLAIM_TIMEOUT}}]
+        }
+        while True:
+            candidates = await self.db.daily_summary_settings.find(
+                due, {"_id": 0, "user_id": 1}
+            ).sort("next_due_at", 1).limit(self.chunk_size).to_list(self.chunk_size)
+            if not candidates:
+                return []
+
+            # Another worker may win some of these; only what we stamped is ours
+            claim_id = uuid.uuid4().hex
+            await self.db.daily_summary_settings.update_many(
+                {**due, "user_id": {"$in": [c["user_id"] for c in candidates]}},
+                {"$set": {"claim_id": claim_id, "claimed_at": now, "last_sent_at": now}}
+            )
+            claimed = await self.db.daily_summary_settings.find(
+                {"claim_id": claim_id}, {"_id": 0}
+            ).to_list(self.chunk_size)
+            self.stats["claimed"] += len(claimed)
+            # Losing every candidate to other workers doesn't mean the bucket is drained
+            if claimed:
+                return claimed
+
+    async def _deliver_chunk(self, chunk: List[Dict[str, Any]], now: datetime):
+        fresh = [s for s in chunk if now - s["next_due_at"].replace(tzinfo=timezone.utc) <= MAX_LATENESS]
+        fresh_ids = {s["user_id"] for s in fresh}
+        self.stats["skipped_stale"] += len(chunk) - len(fresh)
+
+        errors: Dict[str, Optional[str]] = {}
+        if fresh:
+            try:
+                errors = await self.deliver(fresh)
+            except Exception as e:
+                logger.error(f"Daily summary delivery failed for {len(fresh)} users: {e}")
+                errors = {s["user_id"]: str(e) for s in fresh}
+
+        for settings in chunk:
+            if settings["user_id"] in fresh_ids:
+                self.stats["failed" if errors.get(settings["user_id"]) else "delivered"] += 1
+
+        # Reschedule from the settings as stored now, not the claim-time snapshot, and only
+        # if they still match, so a PUT /settings/daily-summary made during delivery wins
+        claim_ids = list({s["claim_id"] for s in chunk})
+        current = await self.db.daily_summary_settings.find(
+            {"user_id": {"$in": [s["user_id"] for s in chunk]}, "claim_id": {"$in": claim_ids}},
+            {"_id": 0, "user_id": 1, "claim_id": 1, **{field: 1 for field in SCHEDULE_INPUTS}}
+        ).to_list(None)
+
+        operations = []
+        for settings in current:
+            # Reschedule regardless of outcome: a failing user must not retry every minute
+            operations.append(UpdateOne(
+                {
+                    "user_id": settings["user_id"],
+                    "claim_id": settings["claim_id"],
+                    **{field: settings.get(field) for field in SCHEDULE_INPUTS}
+                },
+                {
+                    "$set": {**schedule_fields(settings, now), "last_error": errors.get(settings["user_id"])},
+                    "$unset": {"claim_id": "", "claimed_at": ""}
+                }
+            ))
+        matched = 0
+        if operations:
+            result = await self.db.daily_summary_settings.bulk_write(operations, ordered=False)
+            matched = result.matched_count
+        if matched < len(operations):
+            # Changed between the read and the write: the PUT already rescheduled them
+            await self.db.daily_summary_settings.update_many(
+                {"claim_id": {"$in": claim_ids}},
+                {"$unset": {"claim_id": "", "claimed_at": ""}}
+            )
@@ -0,0 +1,209 @@
+"""
+Database Index Registry
+=======================
+
+Single declarative list of the indexes every collection needs, derived
+from the queries in server.py and the services package:
+- Lookup indexes for users, sessions, OTPs and per-user collections
+- TTL indexes so otps, password_resets, user_sessions and rate limit
+  snapshots expire on their own
+- Bucket / materialized-view indexes for metric_rollups and latest_vitals
+
+apply_indexes() is idempotent (create_index is a no-op for an existing
+identical index) and runs at startup.
+
+CLI:
+    python -m services.db_indexes apply     # create anything missing
+    python -m services.db_indexes report    # missing / unregistered / unused indexes
+"""
+
+import logging
+from typing import Any, Dict, List
+
+from pymongo.errors import OperationFailure
+
+from services.metrics_store import metric_field
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Registry
+# ============================================================
+
+INDEX_REGISTRY: Dict[str, List[Dict[str, Any]]] = {
+    "users": [
+        {"name": "user_id_unique", "keys": [("user_id", 1)], "unique": True},
+        {"name": "phone", "keys": [("phone", 1)]},
+        {"name": "email", "keys": [("email", 1)]},
+        {"name": "google_sub", "keys": [("google_sub", 1)], "sparse": True},
+        {"name": "firebase_uid", "keys": [("firebase_uid", 1)], "sparse": True},
+    ],
+    "user_sessions": [
+        {"name": "session_token", "keys": [("session_token", 1)]},
+        {"name": "user_id", "keys": [("user_id", 1)]},
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "otps": [
+        {"name": "identifier_created_at", "keys": [("identifier", 1), ("created_at", -1)]},
+        {"name": "identifier_otp", "keys": [("identifier", 1), ("otp", 1)]},
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "rate_limit_buckets": [
+        {"name": "limiter_key_unique", "keys": [("limiter", 1), ("key", 1)], "unique": True},
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "rate_limit_counters": [
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "password_resets": [
+        {"name": "email_unique", "keys": [("email", 1)], "unique": True},
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "health_metrics": [
+        {
+            "name": "user_type_recorded_at",
+            "keys": [
+                (metric_field("user_id"), 1),
+                (metric_field("metric_type"), 1),
+                ("recorded_at", 1),
+                ("metric_id", 1),
+            ],
+        },
+    ],
+    "latest_vitals": [
+        {"name": "user_id_unique", "keys": [("user_id", 1)], "unique": True},
+    ],
+    "metric_rollups": [
+        {
+            "name": "rollup_bucket_unique",
+            "keys": [("user_id", 1), ("metric_type", 1), ("resolution", 1), ("bucket_start", 1)],
+            "unique": True,
+        },
+        {"name": "rollup_minute_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "alerts": [
+        {"name": "user_created_at", "keys": [("user_id", 1), ("created_at", -1)]},
+        {"name": "alert_id", "keys": [("alert_id", 1)]},
+    ],
+    "chat_messages": [
+        {"name": "user_created_at", "keys": [("user_id", 1), ("created_at", 1)]},
+    ],
+    "sos_incidents": [
+        {"name": "user_created_at", "keys": [("user_id", 1), ("created_at", -1)]},
+        {"name": "incident_id", "keys": [("incident_id", 1)]},
+        # SOS dispatcher recovery sweep
+        {"name": "notification_status", "keys": [("contacts_notified.status", 1)]},
+    ],
+    "fall_events": [
+        {"name": "user_timestamp", "keys": [("user_id", 1), ("timestamp", -1)]},
+    ],
+    "emergency_contacts": [
+        {"name": "user_id", "keys": [("user_id", 1)]},
+    ],
+    "health_sharing": [
+        {"name": "user_id", "keys": [("user_id", 1)]},
+        {"name": "sharing_id", "keys": [("sharing_id", 1)]},
+    ],
+    "pill_reminders": [
+        {"name": "user_active", "keys": [("user_id", 1), ("active", 1)]},
+    ],
+    "daily_summary_settings": [
+        {"name": "user_id_unique", "keys": [("user_id", 1)], "unique": True},
+        {"name": "enabled_next_due", "keys": [("enabled", 1), ("next_due_at", 1)]},
+        {"name": "claim_id", "keys": [("claim_id", 1)], "sparse": True},
+    ],
+    "email_outbox": [
+        {"name": "message_id_unique", "keys": [("message_id", 1)], "unique": True},
+        {"name": "status_next_attempt", "keys": [("status", 1), ("next_attempt_at", 1)]},
+        {"name": "status_lease", "keys": [("status", 1), ("lease_until", 1)]},
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "products": [
+        {"name": "product_id", "keys": [("product_id", 1)]},
+    ],
+}
+
+# ============================================================
+# Apply / Report
+# ============================================================
+
+async def apply_indexes(db, registry: Dict[str, List[Dict[str, Any]]] = INDEX_REGISTRY) -> int:
+    """Create every registered index. Failures are logged, never fatal. Returns: failure count"""
+    failures = 0
+    for collection, specs in registry.items():
+        for spec in specs:
+            options = {k: v for k, v in spec.items() if k != "keys"}
+            try:
+                await db[collection].create_index(spec["keys"], **options)
+            except OperationFailure as e:
+                failures += 1
+                logger.warning(f"Index {collection}.{spec['name']} not applied: {e}")
+
+    if failures:
+        logger.warning(f"Index bootstrap finished with {failures} failure(s)")
+    else:
+        logger.info("Index bootstrap complete")
+    return failures
+
+
+async def index_report(db, registry: Dict[str, List[Dict[str, Any]]] = INDEX_REGISTRY) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compare live indexes with the registry.
+
+    Returns per collection:
+        {"missing": [...], "unregistered": [...], "unused": [...]}
+    where "unused" means $indexStats has recorded zero accesses since the
+    last server restart.
+    """
+    report: Dict[str, Dict[str, List[str]]] = {}
+    for collection, specs in registry.items():
+        expected = {spec["name"] for spec in specs}
+        live = set((await db[collection].index_information()).keys()) - {"_id_"}
+
+        unused: List[str] = []
+        try:
+            async for stat in db[collection].aggregate([{"$indexStats": {}}]):
+                if stat["name"] != "_id_" and stat.get("accesses", {}).get("ops", 0) == 0:
+                    unused.append(stat["name"])
+        except OperationFailure as e:
+            logger.debug(f"$indexStats unavailable for {collection}: {e}")
+
+        report[collection] = {
+            "missing": sorted(expected - live),
+            "unregistered": sorted(live - expected),
+            "unused": sorted(unused),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    import os
+    import argparse
+    import asyncio
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="MongoDB index registry tools")
+    parser.add_argument("command", choices=["apply", "report"])
+    args = parser.parse_args()
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        try:
+            db = client[os.environ.get("DB_NAME", "miraii")]
+            if args.command == "apply":
+                await apply_indexes(db)
+                return
+            report = await index_report(db)
+            for collection, result in report.items():
+                problems = {k: v for k, v in result.items() if v}
+                status = "ok" if not problems else ", ".join(f"{k}: {', '.join(v)}" for k, v in problems.items())
+                print(f"{collection:<24} {status}")
+        finally:
+            client.close()
+
+    asyncio.run(main())
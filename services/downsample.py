@@ -0,0 +1,86 @@
+"""
+Series Downsampling
+===================
+
+Largest-Triangle-Three-Buckets (LTTB) downsampling for chart series.
+
+LTTB keeps the first and last points and, for each of the buckets in
+between, the point forming the largest triangle with the previously
+selected point and the average of the next bucket. Peaks and dips that
+matter visually survive, while the response size is bounded by
+max_points regardless of the time range.
+
+The per-bucket work (bucket averages, triangle areas) is vectorized with
+numpy; only the walk over buckets is a Python loop.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Return the indices of the n_out points LTTB selects from (x, y)"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 buckets over the interior points [1, n - 1)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i == n_out - 3:
+            next_x, next_y = x[n - 1], y[n - 1]
+        else:
+            next_x, next_y = avg_x[i + 1], avg_y[i + 1]
+
+        areas = np.abs(
+            (x[a] - next_x) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y - y[a])
+        )
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    return selected
+
+
+def _epoch_seconds(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def downsample_rows(rows: List[Dict[str, Any]], max_points: int) -> List[Dict[str, Any]]:
+    """
+    Downsample time-ordered metric rows ({"recorded_at", "value", ...}) to
+    at most max_points rows. Non-numeric series (e.g. sleep strings) fall
+    back to evenly spaced selection.
+    """
+    n = len(rows)
+    if n <= max_points:
+        return rows
+
+    values = [row.get("value") for row in rows]
+    numeric = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)
+
+    if numeric:
+        x = np.fromiter((_epoch_seconds(row["recorded_at"]) for row in rows), dtype=np.float64, count=n)
+        y = np.asarray(values, dtype=np.float64)
+        indices = lttb_indices(x, y, max_points)
+    else:
+        indices = np.unique(np.linspace(0, n - 1, max_points).round().astype(np.int64))
+
+    return [rows[i] for i in indices]
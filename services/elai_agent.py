@@ -28,6 +28,8 @@ from datetime import datetime, timezone
 from typing import Optional, Dict, Any, Tuple, List
 from dotenv import load_dotenv
 
+from services.http_clients import http_clients
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -284,7 +286,8 @@ async def generate_elai_response(
         chat = LlmChat(
             api_key=EMERGENT_LLM_KEY,
             session_id=f"elai_{session_id}",
-            system_message=full_system
+            system_message=full_system,
+            http_client=http_clients.get("llm")
         ).with_model("openai", "gpt-4o")
         
         # Send message
@@ -450,24 +453,21 @@ async def speech_to_text(audio_path: str) -> Optional[str]:
         return None
     
     try:
-        import httpx
-        
         # Use OpenAI's Whisper API directly with Emergent key
-        async with httpx.AsyncClient() as client:
-            with open(audio_path, "rb") as audio_file:
-                response = await client.post(
-                    "https://api.openai.com/v1/audio/transcriptions",
-                    headers={
-                        "Authorization": f"Bearer {EMERGENT_LLM_KEY}"
-                    },
-                    files={
-                        "file": ("audio.wav", audio_file, "audio/wav")
-                    },
-                    data={
-                        "model": "whisper-1"
-                    },
-                    timeout=30.0
-                )
+        client = http_clients.get("stt")
+        with open(audio_path, "rb") as audio_file:
+            response = await client.post(
+                "https://api.openai.com/v1/audio/transcriptions",
+                headers={
+                    "Authorization": f"Bearer {EMERGENT_LLM_KEY}"
+                },
+                files={
+                    "file": ("audio.wav", audio_file, "audio/wav")
+                },
+                data={
+                    "model": "whisper-1"
+                }
+            )
         
         if response.status_code == 200:
             result = response.json()
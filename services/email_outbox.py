@@ -0,0 +1,351 @@
+"""
+Email Outbox
+============
+
+Durable, asynchronous email delivery:
+- Endpoints enqueue a rendered message into `email_outbox` (one insert) and return
+- A pool of background workers claims due messages, sends them through an
+  injected send callable, and records the outcome on the message
+- Failures retry with jittered exponential backoff; a crashed worker's
+  claim lapses after a lease and the message is picked up again
+- Every send carries the message_id as its idempotency key, so a retry
+  after an unknown outcome (timeout, 5xx) is not delivered twice
+- Batch messages (enqueue_batch) carry one shared body plus a small
+  fragment per recipient and go out through one batched provider call.
+  The outcome is recorded per recipient in `results`; delivered and
+  rejected recipients are dropped from `recipients`, so a retry only
+  resends to the ones still undecided
+
+Message lifecycle (`status`):
+    pending -> sending -> sent
+                       -> pending (retry, next_attempt_at in the future)
+                       -> failed  (attempts exhausted / rejected as invalid)
+                       -> skipped (provider not configured / demo mode)
+
+Once a message is settled its html/text are dropped (OTP and password
+reset bodies hold live codes); the rest is kept for the retention period.
+
+Environment Variables:
+- EMAIL_OUTBOX_WORKERS: (Optional) Concurrent senders per process (default: 4)
+- EMAIL_OUTBOX_MAX_ATTEMPTS: (Optional) Attempts before a message is marked failed (default: 6)
+- EMAIL_OUTBOX_RETENTION_DAYS: (Optional) How long finished messages' metadata is kept (default: 7)
+"""
+
+import os
+import uuid
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from services.email_providers import PERMANENT_STATUS
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+EMAIL_OUTBOX_WORKERS = int(os.getenv("EMAIL_OUTBOX_WORKERS", "4"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", "7"))
+
+OUTBOX_LEASE_SECONDS = 120      # longer than any provider timeout
+OUTBOX_POLL_SECONDS = 5.0       # idle poll; enqueue() wakes workers immediately
+OUTBOX_BACKOFF_BASE = 2.0
+OUTBOX_BACKOFF_MAX = 600.0
+
+# send(to_email=, subject=, html_content=, text_content=, idempotency_key=)
+SendCallable = Callable[..., Awaitable[Dict[str, Any]]]
+# send_batch(subject=, html_content=, text_content=, recipients=[{"to", "fragment"}], idempotency_key=)
+#   -> {"success", "message", "provider", "delivered": [to], "rejected": [{"to", "error"}]}
+# Without "delivered", success means every recipient got it.
+SendBatchCallable = Callable[..., Awaitable[Dict[str, Any]]]
+
+
+def retry_delay(attempt: int) -> float:
+    """Equal-jitter exponential backoff: half fixed, half random"""
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * (2 ** (attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+# ============================================================
+# Outbox
+# ============================================================
+
+class EmailOutbox:
+    """Outbox collection plus the worker pool that drains it"""
+
+    def __init__(
+        self,
+        send: SendCallable,
+        send_batch: Optional[SendBatchCallable] = None,
+        workers: int = EMAIL_OUTBOX_WORKERS,
+        max_attempts: int = EMAIL_OUTBOX_MAX_ATTEMPTS
+    ):
+        self.send = send
+        self.send_batch = send_batch
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.db = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.stats = {"sent": 0, "retried": 0, "failed": 0, "skipped": 0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def enqueue(
+        self,
+        db,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        text_content: str = "",
+        kind: str = "generic"
+    ) -> str:
+        """Store a message for delivery. Returns: message_id"""
+        now = datetime.now(timezone.utc)
+        message_id = f"email_{uuid.uuid4().hex[:16]}"
+        await db.email_outbox.insert_one({
+            "message_id": message_id,
+            "kind": kind,
+            "to": to_email,
+            "subject": subject,
+            "html": html_content,
+            "text": text_content,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+        })
+        self._wakeup.set()
+        return message_id
+
+    async def enqueue_batch(
+        self,
+        db,
+        recipients: List[Dict[str, str]],
+        subject: str,
+        html_content: str,
+        text_content: str = "",
+        kind: str = "generic"
+    ) -> str:
+        """
+        Store one message for several recipients: html_content is shared and each
+        recipient's {"to", "fragment"} is merged into it at send time.
+        Returns: message_id
+        """
+        now = datetime.now(timezone.utc)
+        message_id = f"email_{uuid.uuid4().hex[:16]}"
+        await db.email_outbox.insert_one({
+            "message_id": message_id,
+            "kind": kind,
+            "to": [r["to"] for r in recipients],
+            "recipients": recipients,
+            "subject": subject,
+            "html": html_content,
+            "text": text_content,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+        })
+        self._wakeup.set()
+        return message_id
+
+    # ------------------------------------------------------------
+    # Worker pool
+    # ------------------------------------------------------------
+
+    def start(self, db):
+        if self._tasks:
+            return
+        self.db = db
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Email outbox started with {self.workers} workers")
+
+    async def stop(self):
+        """Let in-flight sends finish; unclaimed messages stay pending for next start"""
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, index: int):
+        while not self._stopping:
+            # Clear before claiming so an enqueue() racing the claim still wakes us
+            self._wakeup.clear()
+            try:
+                message = await self._claim()
+            except Exception as e:
+                logger.warning(f"Email outbox claim failed: {e}")
+                message = None
+
+            if message is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._deliver(message)
+            except Exception as e:
+                # Leave the claim to lapse; the lease brings the message back
+                logger.error(f"Email outbox worker {index} failed on {message['message_id']}: {e}")
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return await self.db.email_outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "lease_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {"status": "sending", "lease_until": now + timedelta(seconds=OUTBOX_LEASE_SECONDS)},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("next_attempt_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _deliver(self, message: Dict[str, Any]):
+        try:
+            if message.get("recipients") is not None:
+                result = await self.send_batch(
+                    subject=message["subject"],
+                    html_content=message["html"],
+                    text_content=message.get("text", ""),
+                    recipients=message["recipients"],
+                    idempotency_key=message["message_id"]
+                )
+            else:
+                result = await self.send(
+                    to_email=message["to"],
+                    subject=message["subject"],
+                    html_content=message["html"],
+                    text_content=message.get("text", ""),
+                    idempotency_key=message["message_id"]
+                )
+        except Exception as e:
+            result = {"success": False, "message": str(e)}
+
+        now = datetime.now(timezone.utc)
+        update: Dict[str, Any] = {"provider": result.get("provider"), "updated_at": now}
+        results: List[Dict[str, Any]] = []
+        exhausted = message["attempts"] >= self.max_attempts
+
+        if message.get("recipients") is None and result.get("status_code") in PERMANENT_STATUS:
+            # The provider rejected the message itself; resending it can't succeed
+            exhausted = True
+
+        if message.get("recipients") is not None and not result.get("demo_mode"):
+            # Settle recipients one by one; only those still undecided are retried
+            if "delivered" in result:
+                delivered = set(result["delivered"])
+            else:
+                delivered = {r["to"] for r in message["recipients"]} if result.get("success") else set()
+            rejected = {r["to"]: r.get("error") for r in result.get("rejected", [])}
+            remaining = [r for r in message["recipients"] if r["to"] not in delivered and r["to"] not in rejected]
+            results = [{"to": to, "status": "sent", "at": now} for to in sorted(delivered)]
+            results += [{"to": to, "status": "rejected", "error": error, "at": now} for to, error in rejected.items()]
+            update["recipients"] = remaining
+
+            if remaining:
+                result = {**result, "success": False}
+                if exhausted:
+                    results += [{"to": r["to"], "status": "failed", "error": result.get("message"), "at": now} for r in remaining]
+            else:
+                sent_before = any(r["status"] == "sent" for r in message.get("results", []))
+                result = {**result, "success": bool(delivered) or sent_before}
+                if not result["success"]:
+                    result["message"] = "All recipients rejected"
+                    exhausted = True
+
+        if result.get("success") or result.get("demo_mode"):
+            status = "sent" if result.get("success") else "skipped"
+            update.update({"status": status, "sent_at": now if status == "sent" else None})
+        elif exhausted:
+            status = "failed"
+            update.update({"status": status, "last_error": result.get("message")})
+            logger.error(f"Email {message['message_id']} to {message['to']} failed after {message['attempts']} attempts: {result.get('message')}")
+        else:
+            status = "retried"
+            update.update({
+                "status": "pending",
+                "last_error": result.get("message"),
+                "next_attempt_at": now + timedelta(seconds=retry_delay(message["attempts"]))
+            })
+
+        unset = {"lease_until": ""}
+        if update["status"] != "pending":
+            update["expires_at"] = now + timedelta(days=EMAIL_OUTBOX_RETENTION_DAYS)
+            unset.update(html="", text="")
+
+        changes: Dict[str, Any] = {"$set": update, "$unset": unset}
+        if results:
+            changes["$push"] = {"results": {"$each": results}}
+        await self.db.email_outbox.update_one(
+            {"message_id": message["message_id"], "status": "sending"},
+            changes
+        )
+        self.stats[status] += 1
+
+    async def status_counts(self, db) -> Dict[str, int]:
+        counts = {}
+        async for row in db.email_outbox.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+# ============================================================
+# Fake Provider (tests / local development)
+# ============================================================
+
+class FakeEmailProvider:
+    """Records messages instead of sending them; can be told to fail"""
+
+    def __init__(self):
+        self.sent: List[Dict[str, Any]] = []
+        self.batch_calls = 0
+        self.fail_next = 0
+        self.delay = 0.0
+        self.reject: set = set()    # addresses a batch rejects individually
+
+    async def send(self, to_email: str, subject: str, html_content: str, text_content: str = "") -> Dict[str, Any]:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            return {"success": False, "message": "Simulated provider failure", "provider": "fake"}
+        self.sent.append({"to": to_email, "subject": subject, "html": html_content, "text": text_content})
+        return {"success": True, "message": "Email recorded", "provider": "fake"}
+
+    async def send_batch(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """messages: [{"to", "subject", "html", "text"}], recorded as one provider call"""
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            return {"success": False, "message": "Simulated provider failure", "provider": "fake"}
+        self.batch_calls += 1
+        accepted = [m for m in messages if m["to"] not in self.reject]
+        self.sent.extend(accepted)
+        return {
+            "success": True,
+            "message": f"{len(accepted)} emails recorded",
+            "provider": "fake",
+            "delivered": [m["to"] for m in accepted],
+            "rejected": [{"to": m["to"], "error": "Simulated invalid address"} for m in messages if m["to"] in self.reject],
+        }
+
+
+fake_email_provider = FakeEmailProvider()
@@ -0,0 +1,243 @@
+"""
+Email Provider Routing
+======================
+
+Sends every email through a chain of providers (e.g. Resend, then Brevo)
+instead of a single fixed one:
+- Per-provider circuit breaker: after N consecutive failures the provider
+  is skipped for a cool-down, then a single probe decides whether it closes
+- Per-provider latency window (last 10 minutes); healthy providers are
+  tried fastest-p95 first, ties (within one bucket) keep the configured order
+- Every attempt is bounded by its own timeout
+- Failover only happens when the message provably never reached the
+  provider (connection errors, 401/403/429). After a timeout or a 5xx the
+  provider may already have accepted it, so the failure is returned instead
+  and the caller (the outbox) retries later with the same idempotency key
+- Recent routing decisions and per-provider p95 are kept for /api/status/email-providers
+
+A 400/422 means the provider is up but rejected the message; that is
+returned as-is without failover or a breaker failure.
+
+Environment Variables:
+- EMAIL_PROVIDERS: (Optional) Comma-separated chain, e.g. 'RESEND,BREVO' (default: EMAIL_PROVIDER)
+- EMAIL_API_KEY_<PROVIDER>: (Optional) Key for one provider in the chain (default: EMAIL_API_KEY)
+- EMAIL_PROVIDER_TIMEOUT: (Optional) Seconds per provider attempt (default: 10)
+- EMAIL_BREAKER_FAILURES: (Optional) Consecutive failures that open a breaker (default: 5)
+- EMAIL_BREAKER_RESET_SECONDS: (Optional) Seconds an open breaker waits before a probe (default: 30)
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+EMAIL_PROVIDER_TIMEOUT = float(os.getenv("EMAIL_PROVIDER_TIMEOUT", "10"))
+EMAIL_BREAKER_FAILURES = int(os.getenv("EMAIL_BREAKER_FAILURES", "5"))
+EMAIL_BREAKER_RESET_SECONDS = float(os.getenv("EMAIL_BREAKER_RESET_SECONDS", "30"))
+
+LATENCY_WINDOW_SECONDS = 600
+LATENCY_MAX_SAMPLES = 500
+LATENCY_BUCKET_SECONDS = 0.25   # p95s closer than this are treated as equal
+RECENT_DECISIONS = 50
+
+PERMANENT_STATUS = {400, 422}   # message rejected; another provider would reject it too
+NOT_SENT_STATUS = {401, 403, 429}   # refused before acceptance; safe to fail over
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+AttemptCallable = Callable[[str], Awaitable[Dict[str, Any]]]
+
+# ============================================================
+# Circuit Breaker
+# ============================================================
+
+class CircuitBreaker:
+    """closed -> open after `failures` in a row -> half_open (one probe) after `reset_seconds`"""
+
+    def __init__(self, failures: int = EMAIL_BREAKER_FAILURES, reset_seconds: float = EMAIL_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self, now: float) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and now - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release(self):
+        """Give back a probe slot that allow() granted but was never used"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self, now: float):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Email provider circuit opened after {self.consecutive_failures} failures")
+            self.state = "open"
+            self.opened_at = now
+
+# ============================================================
+# Health
+# ============================================================
+
+class ProviderHealth:
+    """Attempt counters plus a time-bounded latency window"""
+
+    def __init__(self):
+        self.latencies: Deque[Tuple[float, float]] = deque(maxlen=LATENCY_MAX_SAMPLES)
+        self.attempts = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def record(self, now: float, latency: float, ok: bool, error: Optional[str] = None):
+        self.attempts += 1
+        self.latencies.append((now, latency))
+        if not ok:
+            self.failures += 1
+            self.last_error = error
+
+    def percentile(self, now: float, pct: float) -> Optional[float]:
+        while self.latencies and now - self.latencies[0][0] > LATENCY_WINDOW_SECONDS:
+            self.latencies.popleft()
+        if not self.latencies:
+            return None
+        values = sorted(latency for _, latency in self.latencies)
+        return values[min(len(values) - 1, int(pct * len(values)))]
+
+# ============================================================
+# Router
+# ============================================================
+
+class ProviderRouter:
+    """Orders the provider chain by breaker state and latency, and runs attempts down it"""
+
+    def __init__(self, providers: List[str], timeout: float = EMAIL_PROVIDER_TIMEOUT):
+        self.providers = providers
+        self.timeout = timeout
+        self.breakers = {name: CircuitBreaker() for name in providers}
+        self.health = {name: ProviderHealth() for name in providers}
+        self.chosen = {name: 0 for name in providers}    # times ranked first
+        self.served = {name: 0 for name in providers}    # sends it completed
+        self.failovers = 0
+        self.exhausted = 0
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_DECISIONS)
+
+    def candidates(self) -> List[str]:
+        """Providers whose breaker admits a request, fastest p95 first; no samples counts as fastest"""
+        now = time.monotonic()
+        available = [name for name in self.providers if self.breakers[name].allow(now)]
+
+        def rank(name: str):
+            p95 = self.health[name].percentile(now, 0.95) or 0.0
+            return (int(p95 / LATENCY_BUCKET_SECONDS), self.providers.index(name))
+        return sorted(available, key=rank)
+
+    async def send(self, attempt: AttemptCallable) -> Dict[str, Any]:
+        """
+        Run attempt(provider) down the chain until one succeeds, moving on only
+        while the failure shows the message was not sent.
+        Returns: the successful (or permanently rejected) result, else the last failure
+        """
+        order = self.candidates()
+        decision: Dict[str, Any] = {"at": datetime.now(timezone.utc).isoformat(), "order": order, "failed": []}
+        self.recent.append(decision)
+        if not order:
+            self.exhausted += 1
+            decision["served_by"] = None
+            return {"success": False, "message": "All email providers unavailable (circuits open)"}
+        self.chosen[order[0]] += 1
+
+        result: Dict[str, Any] = {}
+        untried = list(order)
+        try:
+            for index, name in enumerate(order):
+                untried.remove(name)
+                if index > 0:
+                    self.failovers += 1
+                started = time.monotonic()
+                try:
+                    result = await asyncio.wait_for(attempt(name), timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    result = {"success": False, "message": f"Timed out after {self.timeout:g}s", "provider": name.lower()}
+                except NOT_SENT_ERRORS as e:
+                    result = {"success": False, "message": f"Connection failed: {e!r}", "provider": name.lower(), "not_sent": True}
+                except Exception as e:
+                    result = {"success": False, "message": str(e), "provider": name.lower()}
+                finished = time.monotonic()
+
+                ok = bool(result.get("success")) or result.get("status_code") in PERMANENT_STATUS
+                self.health[name].record(finished, finished - started, ok, result.get("message"))
+                if ok:
+                    self.breakers[name].record_success()
+                    self.served[name] += 1
+                    decision["served_by"] = name
+                    return result
+
+                self.breakers[name].record_failure(finished)
+                decision["failed"].append({"provider": name, "error": (result.get("message") or "")[:200]})
+                if not result.get("not_sent") and result.get("status_code") not in NOT_SENT_STATUS:
+                    # The provider may have accepted it; failing over could deliver it twice
+                    logger.warning(f"Email provider {name} failed with unknown outcome, not failing over: {result.get('message')}")
+                    break
+                logger.warning(f"Email provider {name} failed, {'trying next' if index + 1 < len(order) else 'no providers left'}: {result.get('message')}")
+        finally:
+            for name in untried:
+                self.breakers[name].release()
+
+        decision["served_by"] = None
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        providers = []
+        for name in self.providers:
+            breaker, health = self.breakers[name], self.health[name]
+            p50, p95 = health.percentile(now, 0.5), health.percentile(now, 0.95)
+            providers.append({
+                "name": name,
+                "state": breaker.state,
+                "consecutive_failures": breaker.consecutive_failures,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "attempts": health.attempts,
+                "failures": health.failures,
+                "chosen_first": self.chosen[name],
+                "served": self.served[name],
+                "last_error": health.last_error,
+            })
+        return {
+            "chain": self.providers,
+            "routing_order": [name for name in sorted(
+                self.providers,
+                key=lambda n: (self.breakers[n].state != "closed", int((self.health[n].percentile(now, 0.95) or 0.0) / LATENCY_BUCKET_SECONDS), self.providers.index(n))
+            )],
+            "timeout_seconds": self.timeout,
+            "failovers": self.failovers,
+            "exhausted": self.exhausted,
+            "providers": providers,
+            "recent_decisions": list(self.recent)[-10:],
+        }
@@ -0,0 +1,177 @@
+"""
+Email Templates
+===============
+
+Compiled Jinja2 templates for transactional and summary emails
+(services/templates/email/):
+- base.html carries the document shell, footer and the shared CSS, which
+  is read from shared.css once and injected as a global
+- otp.html, password_reset.html, daily_summary.html extend it
+- daily_summary.html is shared by every recipient of one user's summary;
+  the banner and greeting come from daily_summary_recipient.html and are
+  dropped into its recipient slot, so a summary going to several
+  caregivers is rendered once and only the small fragment per recipient
+- Every template is compiled once by load_templates() (at import) and
+  kept in TEMPLATES; rendering never touches the filesystem or the parser
+
+Values are HTML-escaped (names and insights come from user input).
+
+CLI:
+    python -m services.email_templates bench --renders 10000
+"""
+
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+from markupsafe import Markup
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = Path(__file__).parent / "templates" / "email"
+TEMPLATE_NAMES = ("otp.html", "password_reset.html", "daily_summary.html", "daily_summary_recipient.html")
+
+# Marks where the per-recipient fragment goes in a shared body. An HTML comment,
+# so user-supplied values (escaped) can never produce it
+RECIPIENT_SLOT = "<!--miraii:recipient-->"
+
+# ============================================================
+# Environment
+# ============================================================
+
+def build_environment(template_dir: Path = TEMPLATE_DIR) -> Environment:
+    env = Environment(
+        loader=FileSystemLoader(str(template_dir)),
+        autoescape=select_autoescape(["html"]),
+        auto_reload=False,   # templates are immutable at runtime; skip the mtime check per render
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+    env.globals["shared_css"] = Markup((template_dir / "shared.css").read_text())
+    env.globals["recipient_slot"] = Markup(RECIPIENT_SLOT)
+    return env
+
+
+def load_templates(env: Environment) -> Dict[str, Template]:
+    templates = {name: env.get_template(name) for name in TEMPLATE_NAMES}
+    logger.debug(f"Compiled {len(templates)} email templates")
+    return templates
+
+
+_env = build_environment()
+TEMPLATES: Dict[str, Template] = load_templates(_env)
+
+# ============================================================
+# Renderers
+# ============================================================
+
+def render_otp_email(otp: str) -> str:
+    return TEMPLATES["otp.html"].render(otp=otp)
+
+
+def render_password_reset_email(reset_token: str) -> str:
+    return TEMPLATES["password_reset.html"].render(reset_token=reset_token)
+
+
+def render_daily_summary_body(
+    date_str: str,
+    sleep_data: Optional[Dict[str, Any]],
+    heart_data: Optional[Dict[str, Any]],
+    activity_data: Optional[Dict[str, Any]],
+    other_data: Optional[Dict[str, Any]],
+    insight: Optional[str]
+) -> str:
+    """
+    The part of a daily summary every recipient shares, with RECIPIENT_SLOT left in it.
+    A None section is left out; None values render as "No data".
+    """
+    return TEMPLATES["daily_summary.html"].render(
+        date_str=date_str,
+        sleep_data=sleep_data,
+        heart_data=heart_data,
+        activity_data=activity_data,
+        other_data=other_data,
+        insight=insight
+    )
+
+
+def render_daily_summary_recipient(recipient_name: str, user_name: str, is_caregiver: bool = False) -> str:
+    """Caregiver banner and greeting for one recipient"""
+    return TEMPLATES["daily_summary_recipient.html"].render(
+        recipient_name=recipient_name,
+        user_name=user_name,
+        is_caregiver=is_caregiver
+    )
+
+
+def personalize(body: str, fragment: str) -> str:
+    return body.replace(RECIPIENT_SLOT, fragment, 1)
+
+
+def render_daily_summary_email(
+    recipient_name: str,
+    user_name: str,
+    date_str: str,
+    sleep_data: Dict[str, Any],
+    heart_data: Dict[str, Any],
+    activity_data: Dict[str, Any],
+    other_data: Dict[str, Any],
+    insight: str,
+    is_caregiver: bool = False
+) -> str:
+    body = render_daily_summary_body(date_str, sleep_data, heart_data, activity_data, other_data, insight)
+    return personalize(body, render_daily_summary_recipient(recipient_name, user_name, is_caregiver))
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Email template tools")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--renders", type=int, default=10000)
+    parser.add_argument("--recipients", type=int, default=5, help="recipients per daily summary")
+    args = parser.parse_args()
+
+    summary = {
+        "recipient_name": "Asha",
+        "user_name": "Ravi",
+        "date_str": "Monday, March 02, 2026",
+        "sleep_data": {"duration": "7h 32m", "score": 82, "stages": "1h 45m / 4h 12m / 1h 35m", "apnea_risk": "moderate"},
+        "heart_data": {"avg_hr": 72, "hrv": 45, "irregularity_note": None},
+        "activity_data": {"steps": 8432, "goal": 8000},
+        "other_data": {"spo2": 98},
+        "insight": "Your HRV is trending upward.",
+        "is_caregiver": True,
+    }
+    cases = {
+        "otp": lambda: render_otp_email("123456"),
+        "password_reset": lambda: render_password_reset_email("A" * 32),
+        "daily_summary": lambda: render_daily_summary_email(**summary),
+    }
+
+    shared = {k: v for k, v in summary.items() if k not in ("recipient_name", "user_name", "is_caregiver")}
+    names = [f"Caregiver {i}" for i in range(args.recipients)]
+    cases[f"daily_summary x{args.recipients} (full render each)"] = lambda: [
+        render_daily_summary_email(**{**summary, "recipient_name": name}) for name in names
+    ]
+
+    def render_once_send_many():
+        body = render_daily_summary_body(**shared)
+        return [personalize(body, render_daily_summary_recipient(name, "Ravi", True)) for name in names]
+    cases[f"daily_summary x{args.recipients} (body once)"] = render_once_send_many
+
+    # Baseline: what a per-send compile (no template cache) would cost
+    source = (TEMPLATE_DIR / "daily_summary.html").read_text()
+    uncached_env = build_environment()
+    cases["daily_summary (compile per render)"] = lambda: uncached_env.from_string(source).render(**summary)
+
+    for name, render in cases.items():
+        render()
+        n = args.renders if "compile" not in name else max(1, args.renders // 20)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            render()
+        elapsed = time.perf_counter() - t0
+        print(f"{name:<36} {n / elapsed:>10.0f} renders/s  {elapsed / n * 1e6:>8.1f} us/render")
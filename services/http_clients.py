@@ -0,0 +1,143 @@
+"""
+Shared HTTP Clients
+===================
+
+One pooled httpx.AsyncClient per upstream, reused for the life of the
+process instead of a fresh client (DNS + TCP + TLS handshake) per call:
+- Per-upstream connection limits, keep-alive pool and timeouts
+- Optional HTTP/2 (requires the `h2` package)
+- Pool utilisation counters for /api/status/http
+
+Clients are created lazily on first use and closed by close_all() at
+shutdown.
+
+Environment Variables:
+- HTTP_CLIENT_HTTP2: (Optional) 'true' to negotiate HTTP/2 where the upstream supports it (default: 'false')
+- HTTP_<UPSTREAM>_MAX_CONNECTIONS: (Optional) Override an upstream's connection limit, e.g. HTTP_LLM_MAX_CONNECTIONS
+- HTTP_<UPSTREAM>_TIMEOUT: (Optional) Override an upstream's read/write timeout in seconds
+"""
+
+import os
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# ============================================================
+# Configuration
+# ============================================================
+
+HTTP_CLIENT_HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "false").lower() == "true"
+HTTP_CONNECT_TIMEOUT = 5.0
+HTTP_KEEPALIVE_EXPIRY = 30.0
+
+# name -> max connections, keep-alive connections, read/write timeout (s)
+UPSTREAMS: Dict[str, Dict[str, Any]] = {
+    "email": {"max_connections": 20, "max_keepalive": 10, "timeout": 30.0},        # Resend / Brevo
+    "google": {"max_connections": 20, "max_keepalive": 10, "timeout": 10.0},       # tokeninfo, JWKS, identitytoolkit
+    "emergent_auth": {"max_connections": 10, "max_keepalive": 5, "timeout": 10.0},  # Emergent session exchange
+    "llm": {"max_connections": 50, "max_keepalive": 20, "timeout": 40.0},          # chat completions
+    "stt": {"max_connections": 10, "max_keepalive": 5, "timeout": 30.0},           # Whisper transcription
+    "sms": {"max_connections": 10, "max_keepalive": 5, "timeout": 10.0},           # Twilio (SOS)
+}
+
+
+def _upstream_config(name: str) -> Dict[str, Any]:
+    config = dict(UPSTREAMS[name])
+    prefix = f"HTTP_{name.upper()}_"
+    if os.getenv(prefix + "MAX_CONNECTIONS"):
+        config["max_connections"] = int(os.getenv(prefix + "MAX_CONNECTIONS"))
+        config["max_keepalive"] = min(config["max_keepalive"], config["max_connections"])
+    if os.getenv(prefix + "TIMEOUT"):
+        config["timeout"] = float(os.getenv(prefix + "TIMEOUT"))
+    return config
+
+# ============================================================
+# Registry
+# ============================================================
+
+class HttpClientRegistry:
+    """Lazily created, process-wide httpx clients keyed by upstream name"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._requests: Dict[str, int] = {}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(name)
+            self._clients[name] = client
+        return client
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        config = _upstream_config(name)
+        http2 = HTTP_CLIENT_HTTP2 and HTTP2_AVAILABLE
+        if HTTP_CLIENT_HTTP2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP_CLIENT_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+
+        async def count_request(request: httpx.Request):
+            self._requests[name] = self._requests.get(name, 0) + 1
+
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=config["max_connections"],
+                max_keepalive_connections=config["max_keepalive"],
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(config["timeout"], connect=HTTP_CONNECT_TIMEOUT),
+            event_hooks={"request": [count_request]}
+        )
+
+    async def close_all(self):
+        for name, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Closing HTTP client '{name}' failed: {e}")
+        self._clients.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-upstream pool size and utilisation (connection counts need httpcore's pool)"""
+        report = {}
+        for name in UPSTREAMS:
+            config = _upstream_config(name)
+            client = self._clients.get(name)
+            entry: Dict[str, Any] = {
+                "open": client is not None and not client.is_closed,
+                "max_connections": config["max_connections"],
+                "timeout_seconds": config["timeout"],
+                "requests": self._requests.get(name, 0),
+                "connections": None,
+                "active": None,
+                "utilisation": None,
+            }
+            pool = _connection_pool(client) if client is not None else None
+            if pool is not None:
+                connections = list(pool.connections)
+                active = sum(1 for conn in connections if not conn.is_idle())
+                entry.update({
+                    "connections": len(connections),
+                    "active": active,
+                    "utilisation": round(active / config["max_connections"], 4),
+                })
+            report[name] = entry
+        return report
+
+
+def _connection_pool(client: httpx.AsyncClient) -> Optional[Any]:
+    # httpx doesn't expose the pool publicly; degrade to counters only if it moves
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    return pool if hasattr(pool, "connections") else None
+
+
+http_clients = HttpClientRegistry()
@@ -0,0 +1,241 @@
+"""
+ID Token Verification
+=====================
+
+Offline RS256 verification of Google Sign-In and Firebase Auth ID tokens:
+- Signing keys come from a JWKS key source cached in memory
+- Remote key sets refresh in the background on their Cache-Control max-age,
+  so sign-in never waits on Google and survives short upstream outages
+- A file-based key source stands in for Google in tests / local setups
+
+Environment Variables:
+- ID_TOKEN_JWKS_FILE: (Optional) Path to a JWKS JSON file used instead of Google's endpoints
+- ID_TOKEN_LEEWAY_SECONDS: (Optional) Clock skew tolerated on exp / iat (default: 60)
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+import jwt
+from jwt.algorithms import RSAAlgorithm
+
+from services.http_clients import http_clients
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+GOOGLE_JWKS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+FIREBASE_JWKS_URL = "https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+ID_TOKEN_JWKS_FILE = os.getenv("ID_TOKEN_JWKS_FILE", "")
+ID_TOKEN_LEEWAY_SECONDS = int(os.getenv("ID_TOKEN_LEEWAY_SECONDS", "60"))
+
+JWKS_DEFAULT_MAX_AGE = 3600     # when the response has no usable Cache-Control
+JWKS_MIN_REFRESH = 60           # never poll faster than this
+JWKS_RETRY_DELAY = 30           # after a failed background refresh
+JWKS_UNKNOWN_KID_COOLDOWN = 30  # min seconds between refreshes forced by an unknown kid
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class IdTokenError(Exception):
+    """Token is malformed, expired, for another audience or badly signed"""
+
+
+class KeySourceUnavailable(Exception):
+    """No signing keys could be loaded (network down and nothing cached)"""
+
+# ============================================================
+# Key Sources
+# ============================================================
+
+def parse_jwks(jwks: Dict[str, Any]) -> Dict[str, Any]:
+    """{"keys": [jwk, ...]} -> {kid: RSA public key}"""
+    keys = {}
+    for jwk in jwks.get("keys", []):
+        if jwk.get("kty") != "RSA" or not jwk.get("kid"):
+            continue
+        keys[jwk["kid"]] = RSAAlgorithm.from_jwk(json.dumps(jwk))
+    return keys
+
+
+def cache_max_age(cache_control: Optional[str]) -> int:
+    match = _MAX_AGE_RE.search(cache_control or "")
+    return int(match.group(1)) if match else JWKS_DEFAULT_MAX_AGE
+
+
+class FileJWKS:
+    """Static key set read once from a local JWKS file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path) as f:
+            self._keys = parse_jwks(json.load(f))
+
+    async def get_key(self, kid: str):
+        return self._keys.get(kid)
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class RemoteJWKS:
+    """JWKS endpoint cached in memory and refreshed in the background"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._last_forced = 0.0
+        self._lock = asyncio.Lock()
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> int:
+        """Fetch the key set. Returns: seconds until it should be fetched again"""
+        client = http_clients.get("google")
+        response = await client.get(self.url)
+        response.raise_for_status()
+        self._keys = parse_jwks(response.json())
+        max_age = max(JWKS_MIN_REFRESH, cache_max_age(response.headers.get("cache-control")))
+        self._expires_at = time.monotonic() + max_age
+        logger.info(f"Loaded {len(self._keys)} signing keys from {self.url} (max-age {max_age}s)")
+        return max_age
+
+    async def get_key(self, kid: str):
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        # Cold cache, or Google rotated in a key we haven't seen yet
+        async with self._lock:
+            key = self._keys.get(kid)
+            if key is not None:
+                return key
+            now = time.monotonic()
+            if self._keys and now - self._last_forced < JWKS_UNKNOWN_KID_COOLDOWN:
+                return None
+            self._last_forced = now
+            try:
+                await self.refresh()
+            except Exception as e:
+                if not self._keys:
+                    raise KeySourceUnavailable(f"{self.url}: {e}") from e
+                logger.warning(f"JWKS refresh from {self.url} failed, keeping cached keys: {e}")
+            return self._keys.get(kid)
+
+    def start(self):
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresher is None:
+            return
+        self._refresher.cancel()
+        try:
+            await self._refresher
+        except asyncio.CancelledError:
+            pass
+        self._refresher = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                delay = await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Stale keys stay in use; Google rotates well ahead of expiry
+                logger.warning(f"JWKS refresh from {self.url} failed: {e}; retrying in {JWKS_RETRY_DELAY}s")
+                delay = JWKS_RETRY_DELAY
+            await asyncio.sleep(delay)
+
+
+def key_source(url: str):
+    if ID_TOKEN_JWKS_FILE:
+        return FileJWKS(ID_TOKEN_JWKS_FILE)
+    return RemoteJWKS(url)
+
+
+google_keys = key_source(GOOGLE_JWKS_URL)
+firebase_keys = key_source(FIREBASE_JWKS_URL)
+
+# ============================================================
+# Verification
+# ============================================================
+
+async def verify_id_token(
+    id_token: str,
+    keys,
+    issuers: Iterable[str],
+    audience: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Verify signature, expiry, issuer and (if given) audience. Returns: claims
+
+    Raises IdTokenError for a bad token, KeySourceUnavailable if no keys
+    could be loaded at all.
+    """
+    try:
+        header = jwt.get_unverified_header(id_token)
+    except jwt.PyJWTError as e:
+        raise IdTokenError(f"Malformed token: {e}") from e
+
+    if header.get("alg") != "RS256":
+        raise IdTokenError(f"Unexpected signing algorithm: {header.get('alg')}")
+
+    key = await keys.get_key(header.get("kid", ""))
+    if key is None:
+        raise IdTokenError(f"Unknown signing key: {header.get('kid')}")
+
+    try:
+        claims = jwt.decode(
+            id_token,
+            key,
+            algorithms=["RS256"],
+            audience=audience,
+            leeway=ID_TOKEN_LEEWAY_SECONDS,
+            options={"verify_aud": audience is not None, "require": ["exp", "iat", "iss", "sub"]}
+        )
+    except jwt.PyJWTError as e:
+        raise IdTokenError(str(e)) from e
+
+    if claims["iss"] not in issuers:
+        raise IdTokenError(f"Unexpected issuer: {claims['iss']}")
+    return claims
+
+
+async def verify_google_token(id_token: str) -> Dict[str, Any]:
+    """Google Sign-In ID token; audience is checked by the caller"""
+    return await verify_id_token(id_token, google_keys, GOOGLE_ISSUERS)
+
+
+async def verify_firebase_token(id_token: str, project_id: str) -> Dict[str, Any]:
+    """Firebase Auth ID token for the given project"""
+    return await verify_id_token(
+        id_token,
+        firebase_keys,
+        (f"https://securetoken.google.com/{project_id}",),
+        audience=project_id
+    )
+
+
+def start_key_refresh():
+    google_keys.start()
+    firebase_keys.start()
+
+
+async def stop_key_refresh():
+    await google_keys.stop()
+    await firebase_keys.stop()
@@ -0,0 +1,184 @@
+"""
+Latest Vitals Service
+=====================
+
+Materialized "latest vitals" document per user:
+
+    {"user_id": str, "metrics": {metric_type: <newest metric doc>}, "updated_at": datetime,
+     "rebuilt": bool}
+
+The document is updated atomically on every metric write (newest
+recorded_at wins), so the dashboard, the chat health context and the
+SOS vitals backfill all read it with a single point lookup.
+
+A write can create the document before it was ever seeded from history
+(e.g. the first sample after deploy), so it would only hold the types just
+written. `rebuilt` marks documents seeded by rebuild_latest_vitals; the read
+path rebuilds any document without it.
+
+CLI (seed every user up front instead of on first read):
+    python -m services.latest_vitals rebuild [--user-id USER_ID]
+"""
+
+import re
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from services.metrics_store import metric_filter, from_storage
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+DASHBOARD_METRIC_TYPES = ["heart_rate", "spo2", "sleep", "steps", "skin_temp", "hrv", "fall_detection", "workout"]
+
+# metric_type becomes part of a field path, so only plain identifiers are materialized
+_SAFE_METRIC_TYPE = re.compile(r"^[A-Za-z0-9_]+$")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# ============================================================
+# Write Path
+# ============================================================
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def newest_by_user_and_type(docs: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Reduce metric documents to {user_id: {metric_type: newest doc}}"""
+    newest: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for doc in docs:
+        metric_type = doc.get("metric_type")
+        if not metric_type or not _SAFE_METRIC_TYPE.match(metric_type):
+            continue
+        per_user = newest.setdefault(doc["user_id"], {})
+        current = per_user.get(metric_type)
+        if current is None or as_utc(doc["recorded_at"]) >= as_utc(current["recorded_at"]):
+            per_user[metric_type] = {k: v for k, v in doc.items() if k != "_id"}
+    return newest
+
+
+def build_latest_vitals_update(user_id: str, metrics: Dict[str, Dict[str, Any]], rebuilt: bool = False) -> UpdateOne:
+    """
+    Pipeline upsert that replaces each metric slot only if the new sample
+    is at least as recent as the stored one, so out-of-order syncs never
+    overwrite a newer reading.
+    """
+    fields: Dict[str, Any] = {
+        f"metrics.{metric_type}": {
+            "$cond": [
+                {"$gte": [doc["recorded_at"], {"$ifNull": [f"$metrics.{metric_type}.recorded_at", _EPOCH]}]},
+                {"$literal": doc},
+                f"$metrics.{metric_type}"
+            ]
+        }
+        for metric_type, doc in metrics.items()
+    }
+    fields["user_id"] = user_id
+    fields["updated_at"] = "$$NOW"
+    if rebuilt:
+        fields["rebuilt"] = True
+    return UpdateOne({"user_id": user_id}, [{"$set": fields}], upsert=True)
+
+
+async def update_latest_vitals(db, docs: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Fold freshly written metric documents (API shape) into latest_vitals.
+    Returns: the {user_id: {metric_type: doc}} candidates that were applied
+    """
+    newest = newest_by_user_and_type(docs)
+    if not newest:
+        return newest
+    operations = [build_latest_vitals_update(user_id, metrics) for user_id, metrics in newest.items()]
+    await db.latest_vitals.bulk_write(operations, ordered=False)
+    return newest
+
+# ============================================================
+# Read Path
+# ============================================================
+
+async def rebuild_latest_vitals(db, user_id: str) -> Dict[str, Dict[str, Any]]:
+    """Materialize latest_vitals for a user from health_metrics (first read / legacy data)"""
+    metrics: Dict[str, Dict[str, Any]] = {}
+    for metric_type in DASHBOARD_METRIC_TYPES:
+        metric = await db.health_metrics.find_one(
+            metric_filter(user_id, metric_type),
+            {"_id": 0},
+            sort=[("recorded_at", -1)]
+        )
+        if metric:
+            metrics[metric_type] = from_storage(metric)
+
+    if metrics:
+        # Same newest-wins merge as the write path, so samples written meanwhile are kept
+        await db.latest_vitals.bulk_write([build_latest_vitals_update(user_id, metrics, rebuilt=True)])
+    else:
+        await db.latest_vitals.update_one(
+            {"user_id": user_id},
+            {
+                "$set": {"rebuilt": True},
+                "$setOnInsert": {"user_id": user_id, "metrics": {}, "updated_at": datetime.now(timezone.utc)}
+            },
+            upsert=True
+        )
+    logger.info(f"Rebuilt latest vitals for user {user_id} ({len(metrics)} metric types)")
+    return metrics
+
+
+async def get_latest_vitals(db, user_id: str, metric_types: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Return {metric_type: newest metric doc} with one point lookup.
+    Falls back to a one-off rebuild when the document is missing or was
+    created by a write before it was seeded from history.
+    """
+    doc = await db.latest_vitals.find_one({"user_id": user_id}, {"_id": 0, "metrics": 1, "rebuilt": 1})
+    if doc and doc.get("rebuilt"):
+        metrics = doc.get("metrics", {})
+    else:
+        # rebuild_latest_vitals only returns history; merge what writes already stored
+        metrics = {**(doc or {}).get("metrics", {}), **await rebuild_latest_vitals(db, user_id)}
+
+    wanted = metric_types or DASHBOARD_METRIC_TYPES
+    return {t: metrics[t] for t in wanted if t in metrics}
+
+
+async def clear_latest_vitals(db, user_id: str):
+    await db.latest_vitals.delete_one({"user_id": user_id})
+
+
+if __name__ == "__main__":
+    import os
+    import argparse
+    import asyncio
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from services.metrics_store import metric_field
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Latest vitals tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="Seed latest_vitals from health_metrics")
+    rebuild_parser.add_argument("--user-id", help="Only this user (default: every user with metrics)")
+    args = parser.parse_args()
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        try:
+            db = client[os.environ.get("DB_NAME", "miraii")]
+            if args.command == "rebuild":
+                user_ids = [args.user_id] if args.user_id else await db.health_metrics.distinct(metric_field("user_id"))
+                for user_id in user_ids:
+                    await rebuild_latest_vitals(db, user_id)
+        finally:
+            client.close()
+
+    asyncio.run(main())
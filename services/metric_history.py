@@ -0,0 +1,117 @@
+"""
+Metric History Service
+======================
+
+Raw metric history without loading everything into one list:
+- Keyset pagination on (recorded_at, metric_id) with an opaque continuation token
+- NDJSON streaming straight off the Motor cursor for large exports; with a
+  limit the stream stops after that many rows and, if more remain, ends
+  with a {"next_cursor": token} line
+"""
+
+import json
+import base64
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from services.metrics_store import from_storage
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+HISTORY_SORT = [("recorded_at", 1), ("metric_id", 1)]
+HISTORY_DEFAULT_LIMIT = 1000
+HISTORY_PAGE_MAX = 5000
+STREAM_BATCH_SIZE = 500
+
+# ============================================================
+# Continuation Tokens
+# ============================================================
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Opaque token pointing just past `doc` in (recorded_at, metric_id) order"""
+    payload = json.dumps({"t": doc["recorded_at"].isoformat(), "id": doc.get("metric_id", "")})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[datetime, str]:
+    """Raises ValueError for malformed tokens"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), str(payload["id"])
+    except (KeyError, TypeError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+
+
+def after_cursor(query: Dict[str, Any], token: Optional[str]) -> Dict[str, Any]:
+    """Restrict a history query to rows strictly after the continuation token"""
+    if not token:
+        return query
+    recorded_at, metric_id = decode_cursor(token)
+    return {
+        "$and": [
+            query,
+            {"$or": [
+                {"recorded_at": {"$gt": recorded_at}},
+                {"recorded_at": recorded_at, "metric_id": {"$gt": metric_id}}
+            ]}
+        ]
+    }
+
+# ============================================================
+# Pagination / Streaming
+# ============================================================
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    limit: int,
+    token: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Return (rows, next_token); next_token is None on the last page"""
+    rows = await collection.find(after_cursor(query, token), {"_id": 0}) \
+        .sort(HISTORY_SORT).limit(limit + 1).to_list(limit + 1)
+
+    has_more = len(rows) > limit
+    rows = [from_storage(r) for r in rows[:limit]]
+    next_token = encode_cursor(rows[-1]) if has_more and rows else None
+    return rows, next_token
+
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+async def stream_ndjson(
+    collection,
+    query: Dict[str, Any],
+    token: Optional[str] = None,
+    limit: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yield one JSON line per row as the cursor produces them (memory stays flat).
+    With `limit`, at most that many rows, then a {"next_cursor"} line if there are more.
+    """
+    cursor = collection.find(after_cursor(query, token), {"_id": 0}) \
+        .sort(HISTORY_SORT).batch_size(STREAM_BATCH_SIZE)
+    if limit is not None:
+        cursor = cursor.limit(limit + 1)
+
+    count = 0
+    last = None
+    async for row in cursor:
+        row = from_storage(row)
+        if limit is not None and count == limit:
+            yield (json.dumps({"next_cursor": encode_cursor(last)}) + "\n").encode()
+            break
+        count += 1
+        last = row
+        yield (json.dumps(row, default=_json_default) + "\n").encode()
+    logger.info(f"Streamed {count} history rows")
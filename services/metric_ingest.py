@@ -0,0 +1,326 @@
+"""
+Metric Ingestion Service
+========================
+
+Write path for ring samples:
+- Chunked, unordered bulk inserts for buffered ring syncs
+- Per-chunk accepted / rejected accounting
+- Post-write fan-out (materialized latest vitals, minute/hour/day rollups,
+  live-vitals pub/sub)
+- Write-behind buffer that coalesces single-sample writes into batches
+
+Every metric write should go through write_metrics() so derived
+collections stay in step with health_metrics.
+
+Environment Variables:
+- METRICS_BATCH_MAX_SAMPLES: (Optional) Max samples per batch request (default: 5000)
+- METRICS_BATCH_CHUNK_SIZE: (Optional) Samples per insert_many call (default: 500)
+- METRICS_BUFFER_MAX_BATCH: (Optional) Samples per write-behind flush (default: 500)
+- METRICS_BUFFER_MAX_DELAY_MS: (Optional) Max time a sample waits before flush (default: 50)
+- METRICS_BUFFER_MAX_PENDING: (Optional) Max samples held in memory (default: 20000)
+- METRICS_BUFFER_SPILL_DIR: (Optional) Where batches that can't be flushed at shutdown
+  are written, to be replayed on the next start (default: <backend>/metric_spill)
+"""
+
+import os
+import math
+import uuid
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+from services.metrics_store import metric_field, to_storage
+from services.latest_vitals import as_utc, update_latest_vitals
+from services.metric_rollups import update_rollups
+from services.vitals_pubsub import vitals_pubsub
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+METRICS_BATCH_MAX_SAMPLES = int(os.getenv("METRICS_BATCH_MAX_SAMPLES", "5000"))
+METRICS_BATCH_CHUNK_SIZE = int(os.getenv("METRICS_BATCH_CHUNK_SIZE", "500"))
+METRICS_BUFFER_MAX_BATCH = int(os.getenv("METRICS_BUFFER_MAX_BATCH", "500"))
+METRICS_BUFFER_MAX_DELAY_MS = int(os.getenv("METRICS_BUFFER_MAX_DELAY_MS", "50"))
+METRICS_BUFFER_MAX_PENDING = int(os.getenv("METRICS_BUFFER_MAX_PENDING", "20000"))
+METRICS_BUFFER_SPILL_DIR = Path(os.getenv("METRICS_BUFFER_SPILL_DIR", str(Path(__file__).parent.parent / "metric_spill")))
+
+# ============================================================
+# Bulk Writes
+# ============================================================
+
+def chunked(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    """Yield consecutive slices of at most `size` items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def insert_metric_chunk(collection, docs: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Insert one chunk of metric documents with an unordered insert_many.
+
+    Unordered writes keep going past a bad document, so a single rejected
+    sample does not drop the rest of the chunk.
+
+    Returns: (inserted_count, [{"index": int, "error": str}, ...])
+    """
+    if not docs:
+        return 0, []
+
+    try:
+        result = await collection.insert_many(docs, ordered=False)
+        return len(result.inserted_ids), []
+    except BulkWriteError as e:
+        details = e.details or {}
+        errors = [
+            {"index": err.get("index"), "error": err.get("errmsg", "write error")}
+            for err in details.get("writeErrors", [])
+        ]
+        logger.warning(f"Metric chunk partially rejected: {len(errors)} of {len(docs)} failed")
+        return details.get("nInserted", 0), errors
+
+
+async def stored_metric_ids(db, docs: List[Dict[str, Any]]) -> Set[str]:
+    """metric_ids of `docs` already in health_metrics (an insert that errored may still have landed)"""
+    ids = [doc["metric_id"] for doc in docs if doc.get("metric_id")]
+    if not ids:
+        return set()
+    recorded = [as_utc(doc["recorded_at"]) for doc in docs]
+    cursor = db.health_metrics.find(
+        {
+            metric_field("user_id"): {"$in": list({doc["user_id"] for doc in docs})},
+            "recorded_at": {"$gte": min(recorded), "$lte": max(recorded)},
+            "metric_id": {"$in": ids},
+        },
+        {"_id": 0, "metric_id": 1}
+    )
+    return {doc["metric_id"] async for doc in cursor}
+
+
+async def write_metrics(
+    db,
+    docs: List[Dict[str, Any]],
+    progress: Optional[Dict[str, Any]] = None
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Store metric documents (API shape) and update derived collections
+    for the ones that were accepted.
+
+    Each stage (insert, latest vitals, rollups) is recorded in `progress`;
+    calling again with the same dict after a failure resumes at the stage
+    that failed. A resumed insert skips samples that are already stored,
+    and rollups ($inc) are never re-applied once they succeeded.
+
+    Returns: (inserted_count, [{"index": int, "error": str}, ...])
+    """
+    progress = {} if progress is None else progress
+
+    if "written" not in progress:
+        pending = list(range(len(docs)))
+        already = []
+        if progress.get("insert_attempted"):
+            stored = await stored_metric_ids(db, docs)
+            already = [i for i in pending if docs[i].get("metric_id") in stored]
+            pending = [i for i in pending if docs[i].get("metric_id") not in stored]
+        progress["insert_attempted"] = True
+
+        inserted, errors = await insert_metric_chunk(db.health_metrics, [to_storage(dict(docs[i])) for i in pending])
+        errors = [{"index": pending[err["index"]], "error": err["error"]} for err in errors]
+        failed = {err["index"] for err in errors}
+        progress["inserted"] = inserted + len(already)
+        progress["errors"] = errors
+        progress["written"] = [doc for i, doc in enumerate(docs) if i not in failed]
+
+    written = progress["written"]
+    stages = [
+        name for name in ("latest_vitals", "rollups")
+        if written and name not in progress
+    ]
+    if stages:
+        updates = {"latest_vitals": update_latest_vitals, "rollups": update_rollups}
+        results = await asyncio.gather(*(updates[name](db, written) for name in stages), return_exceptions=True)
+        for name, result in zip(stages, results):
+            if not isinstance(result, BaseException):
+                progress[name] = result
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        newest = progress.get("latest_vitals")
+        if "latest_vitals" in stages and newest and not vitals_pubsub.uses_change_stream:
+            for user_id, delta in newest.items():
+                vitals_pubsub.publish(user_id, delta)
+
+    return progress["inserted"], progress["errors"]
+
+# ============================================================
+# Write-Behind Buffer
+# ============================================================
+
+class IngestBufferFull(Exception):
+    """Raised when the write-behind buffer cannot take more samples"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Metric ingestion buffer is full")
+        self.retry_after = retry_after
+
+
+_STOP = object()
+
+
+class MetricWriteBuffer:
+    """
+    In-process write-behind queue that coalesces metric writes from all
+    requests into insert_many batches.
+
+    - A batch is flushed when it reaches max_batch samples or when the
+      oldest sample in it has waited max_delay seconds
+    - At most max_pending samples are held; beyond that submit() raises
+      IngestBufferFull so the endpoint can answer 503 + Retry-After
+    - stop() drains and flushes everything still queued
+    - A failed flush is retried with the same progress dict, so the
+      retry resumes at the stage that failed (see write_metrics)
+    - Samples are never dropped: while running, a failing flush is retried
+      until it succeeds and the queue fills up, which turns into 503s for
+      new submits (backpressure). During stop() a batch that still fails
+      after max_retries is spilled to spill_dir and replayed on the next start()
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[Dict[str, Any]], Dict[str, Any]], Awaitable[Any]],
+        max_batch: int = METRICS_BUFFER_MAX_BATCH,
+        max_delay: float = METRICS_BUFFER_MAX_DELAY_MS / 1000,
+        max_pending: int = METRICS_BUFFER_MAX_PENDING,
+        max_retries: int = 5,
+        spill_dir: Path = METRICS_BUFFER_SPILL_DIR
+    ):
+        self._flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.spill_dir = spill_dir
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closing = False
+        self.stats = {"submitted": 0, "flushed": 0, "batches": 0, "rejected": 0, "retries": 0, "spilled": 0, "replayed": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._closing
+
+    def start(self):
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._closing = False
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"Metric write buffer started (batch={self.max_batch}, delay={self.max_delay}s, pending<={self.max_pending})")
+
+    async def stop(self):
+        """Stop accepting samples and flush everything already queued"""
+        if self._worker is None:
+            return
+        self._closing = True
+        await self._queue.put(_STOP)
+        await self._worker
+        self._worker = None
+        logger.info(f"Metric write buffer stopped: {self.stats}")
+
+    def submit(self, docs: List[Dict[str, Any]]):
+        """Queue metric documents (API shape) for the next batch"""
+        if self._closing or self._queue.maxsize - self._queue.qsize() < len(docs):
+            self.stats["rejected"] += len(docs)
+            raise IngestBufferFull(retry_after=max(1, math.ceil(self.max_delay * 2)))
+        for doc in docs:
+            self._queue.put_nowait(doc)
+        self.stats["submitted"] += len(docs)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        await self._replay_spilled()
+
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.max_delay
+
+            while len(batch) < self.max_batch:
+                # Drain whatever is already queued before waiting on the deadline
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush_batch(batch)
+
+        # Nothing is accepted once closing, but flush anything queued ahead of the stop marker
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftover.append(item)
+        for chunk in chunked(leftover, self.max_batch):
+            await self._flush_batch(list(chunk))
+
+    async def _flush_batch(self, batch: List[Dict[str, Any]], progress: Optional[Dict[str, Any]] = None):
+        progress = {} if progress is None else progress
+        attempt = 0
+        while True:
+            try:
+                await self._flush(batch, progress)
+                self.stats["flushed"] += len(batch)
+                self.stats["batches"] += 1
+                return
+            except Exception as e:
+                attempt += 1
+                if self._closing and attempt >= self.max_retries:
+                    self._spill(batch, progress, e)
+                    return
+                self.stats["retries"] += 1
+                delay = min(2 ** (attempt - 1) * 0.1, 5.0)
+                logger.warning(f"Metric batch flush failed (attempt {attempt}): {e}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    # ------------------------------------------------------------
+    # Spill (shutdown with the database unreachable)
+    # ------------------------------------------------------------
+
+    def _spill(self, batch: List[Dict[str, Any]], progress: Dict[str, Any], error: Exception):
+        """Write a batch that could not be flushed at shutdown to disk, with its progress"""
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spill_dir / f"metrics_{uuid.uuid4().hex}.json"
+        path.write_text(json_util.dumps({"batch": batch, "progress": progress}))
+        self.stats["spilled"] += len(batch)
+        logger.error(f"Spilled {len(batch)} metric samples to {path} after {self.max_retries} failed flushes at shutdown: {error}")
+
+    async def _replay_spilled(self):
+        """Flush batches spilled by an earlier shutdown, resuming at their recorded stage"""
+        if not self.spill_dir.is_dir():
+            return
+        for path in sorted(self.spill_dir.glob("metrics_*.json")):
+            spilled = json_util.loads(path.read_text())
+            await self._flush_batch(spilled["batch"], spilled["progress"])
+            path.unlink()
+            self.stats["replayed"] += len(spilled["batch"])
+            logger.info(f"Replayed {len(spilled['batch'])} spilled metric samples from {path.name}")
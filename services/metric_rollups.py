@@ -0,0 +1,344 @@
+"""
+Metric Rollups Service
+======================
+
+Pre-aggregated min / max / avg / count buckets per user and metric type
+at minute, hour and day resolution, kept in the `metric_rollups`
+collection:
+
+    {"user_id", "metric_type", "resolution", "bucket_start",
+     "count", "sum", "min", "max", "expires_at" (minute buckets only)}
+
+Buckets are updated incrementally with $inc / $min / $max upserts on
+every metric write, so history charts read at most a few hundred
+documents regardless of the raw sample rate.
+
+History written before rollups existed has no buckets. rebuild_rollups
+recomputes a user's buckets from health_metrics (idempotent: buckets are
+replaced, not incremented). Until it has run, get_rollup_series buckets
+the raw samples for whatever leading part of the window has no rollups,
+reading at most ROLLUP_GAP_FILL_MAX_ROWS of them (newest first; the series
+is flagged partial when the cap cuts it short), and starts a background
+rebuild for the user. Minute windows are clamped to minute retention.
+
+Environment Variables:
+- ROLLUP_MIN_POINTS: (Optional) Minimum chart points 'auto' resolution aims for (default: 30)
+- ROLLUP_MINUTE_RETENTION_DAYS: (Optional) How long minute buckets are kept (default: 14)
+- ROLLUP_GAP_FILL_MAX_ROWS: (Optional) Raw samples one read may bucket for a window without rollups (default: 20000)
+
+CLI:
+    python -m services.metric_rollups rebuild [--user-id USER_ID]   # all users when omitted
+"""
+
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+
+from services.latest_vitals import as_utc
+from services.metrics_store import metric_field, metric_filter
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+ROLLUP_RESOLUTIONS: Dict[str, timedelta] = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+ROLLUP_MIN_POINTS = int(os.getenv("ROLLUP_MIN_POINTS", "30"))
+ROLLUP_MINUTE_RETENTION_DAYS = int(os.getenv("ROLLUP_MINUTE_RETENTION_DAYS", "14"))
+ROLLUP_GAP_FILL_MAX_ROWS = int(os.getenv("ROLLUP_GAP_FILL_MAX_ROWS", "20000"))
+
+# ============================================================
+# Bucketing
+# ============================================================
+
+def bucket_start(recorded_at: datetime, resolution: str) -> datetime:
+    """Truncate a timestamp to the start of its UTC bucket"""
+    if recorded_at.tzinfo is None:
+        recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+    else:
+        recorded_at = recorded_at.astimezone(timezone.utc)
+
+    if resolution == "minute":
+        return recorded_at.replace(second=0, microsecond=0)
+    if resolution == "hour":
+        return recorded_at.replace(minute=0, second=0, microsecond=0)
+    return recorded_at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def numeric_value(value: Any) -> Optional[float]:
+    """Only numeric readings are rolled up (sleep strings, fall states, etc. are skipped)"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+def pick_resolution(days: int) -> str:
+    """Coarsest resolution that still yields ROLLUP_MIN_POINTS buckets over the range"""
+    span = timedelta(days=days)
+    for resolution in ("day", "hour"):
+        if span / ROLLUP_RESOLUTIONS[resolution] >= ROLLUP_MIN_POINTS:
+            return resolution
+    return "minute"
+
+# ============================================================
+# Write Path
+# ============================================================
+
+BucketKey = Tuple[str, str, str, datetime]
+
+
+def aggregate_samples(docs: Iterable[Dict[str, Any]], resolutions: Iterable[str] = ROLLUP_RESOLUTIONS) -> Dict[BucketKey, Dict[str, float]]:
+    """Combine numeric samples into {(user_id, metric_type, resolution, bucket_start): count/sum/min/max}"""
+    resolutions = list(resolutions)
+    buckets: Dict[BucketKey, Dict[str, float]] = {}
+
+    for doc in docs:
+        value = numeric_value(doc.get("value"))
+        if value is None:
+            continue
+        for resolution in resolutions:
+            key = (doc["user_id"], doc["metric_type"], resolution, bucket_start(doc["recorded_at"], resolution))
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = {"count": 1, "sum": value, "min": value, "max": value}
+            else:
+                agg["count"] += 1
+                agg["sum"] += value
+                agg["min"] = min(agg["min"], value)
+                agg["max"] = max(agg["max"], value)
+    return buckets
+
+
+def build_rollup_updates(docs: Iterable[Dict[str, Any]]) -> List[UpdateOne]:
+    """Pre-combine samples per bucket, then emit one upsert per touched bucket"""
+    operations = []
+    for (user_id, metric_type, resolution, start), agg in aggregate_samples(docs).items():
+        on_insert: Dict[str, Any] = {}
+        if resolution == "minute":
+            on_insert["expires_at"] = start + timedelta(days=ROLLUP_MINUTE_RETENTION_DAYS)
+        update: Dict[str, Any] = {
+            "$inc": {"count": agg["count"], "sum": agg["sum"]},
+            "$min": {"min": agg["min"]},
+            "$max": {"max": agg["max"]},
+        }
+        if on_insert:
+            update["$setOnInsert"] = on_insert
+        operations.append(UpdateOne(
+            {"user_id": user_id, "metric_type": metric_type, "resolution": resolution, "bucket_start": start},
+            update,
+            upsert=True
+        ))
+    return operations
+
+
+async def update_rollups(db, docs: Iterable[Dict[str, Any]]):
+    """Fold freshly written metric documents (API shape) into metric_rollups"""
+    operations = build_rollup_updates(docs)
+    if operations:
+        await db.metric_rollups.bulk_write(operations, ordered=False)
+
+# ============================================================
+# Rebuild (history from before rollups existed)
+# ============================================================
+
+def build_rollup_replacements(buckets: Dict[BucketKey, Dict[str, float]]) -> List[UpdateOne]:
+    """Upserts that overwrite each bucket with the given totals, so a rebuild can run twice"""
+    operations = []
+    for (user_id, metric_type, resolution, start), agg in buckets.items():
+        values: Dict[str, Any] = dict(agg)
+        if resolution == "minute":
+            values["expires_at"] = start + timedelta(days=ROLLUP_MINUTE_RETENTION_DAYS)
+        operations.append(UpdateOne(
+            {"user_id": user_id, "metric_type": metric_type, "resolution": resolution, "bucket_start": start},
+            {"$set": values},
+            upsert=True
+        ))
+    return operations
+
+
+async def rebuild_rollups(db, user_id: str, until: Optional[datetime] = None) -> int:
+    """
+    Recompute a user's rollup buckets from health_metrics, one UTC day at a time.
+
+    Only buckets that end before `until` (default: start of today, UTC) are
+    rewritten; later buckets stay with the live write path, which has been
+    updating them incrementally. Minute buckets past retention are skipped.
+
+    Returns: number of buckets written
+    """
+    now = datetime.now(timezone.utc)
+    until = until or now.replace(hour=0, minute=0, second=0, microsecond=0)
+    minute_floor = now - timedelta(days=ROLLUP_MINUTE_RETENTION_DAYS)
+    written = 0
+
+    async def flush(day_docs: List[Dict[str, Any]]):
+        nonlocal written
+        keep_minutes = bucket_start(day_docs[0]["recorded_at"], "day") >= bucket_start(minute_floor, "day")
+        resolutions = [r for r in ROLLUP_RESOLUTIONS if keep_minutes or r != "minute"]
+        operations = build_rollup_replacements(aggregate_samples(day_docs, resolutions))
+        if operations:
+            await db.metric_rollups.bulk_write(operations, ordered=False)
+            written += len(operations)
+
+    metric_types = await db.health_metrics.distinct(metric_field("metric_type"), metric_filter(user_id))
+    for metric_type in metric_types:
+        day_docs: List[Dict[str, Any]] = []
+        day = None
+        cursor = db.health_metrics.find(
+            metric_filter(user_id, metric_type, until=until),
+            {"_id": 0, "recorded_at": 1, "value": 1}
+        ).sort("recorded_at", 1)
+        async for doc in cursor:
+            doc.update(user_id=user_id, metric_type=metric_type)
+            doc_day = bucket_start(doc["recorded_at"], "day")
+            if day_docs and doc_day != day:
+                await flush(day_docs)
+                day_docs = []
+            day = doc_day
+            day_docs.append(doc)
+        if day_docs:
+            await flush(day_docs)
+
+    logger.info(f"Rebuilt {written} rollup buckets for user {user_id} ({len(metric_types)} metric types)")
+    return written
+
+# ============================================================
+# Read Path
+# ============================================================
+
+def series_from_samples(rows: Iterable[Dict[str, Any]], resolution: str) -> List[Dict[str, Any]]:
+    """Bucket raw {"recorded_at", "value"} rows into the get_rollup_series shape"""
+    buckets = aggregate_samples(({**row, "user_id": "", "metric_type": ""} for row in rows), [resolution])
+    return [
+        {
+            "bucket_start": start,
+            "count": int(agg["count"]),
+            "avg": round(agg["sum"] / agg["count"], 2),
+            "min": agg["min"],
+            "max": agg["max"]
+        }
+        for (_, _, _, start), agg in sorted(buckets.items(), key=lambda item: item[0][3])
+    ]
+
+
+# Users whose rollups have been rebuilt (or are being rebuilt) by this process
+_rebuilt_users: Set[str] = set()
+_rebuild_tasks: Set[asyncio.Task] = set()
+
+
+def schedule_rebuild(db, user_id: str):
+    """Rebuild a user's rollups in the background, at most once per process"""
+    if user_id in _rebuilt_users:
+        return
+    _rebuilt_users.add(user_id)
+
+    async def run():
+        try:
+            await rebuild_rollups(db, user_id)
+        except Exception as e:
+            _rebuilt_users.discard(user_id)
+            logger.error(f"Background rollup rebuild failed for user {user_id}: {e}")
+
+    task = asyncio.create_task(run())
+    _rebuild_tasks.add(task)
+    task.add_done_callback(_rebuild_tasks.discard)
+
+
+async def get_rollup_series(
+    db,
+    user_id: str,
+    metric_type: str,
+    since: datetime,
+    resolution: str
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Return ([{"bucket_start", "count", "avg", "min", "max"}] in time order, partial).
+    Any leading part of the window without rollups (history older than the
+    rollups, not yet rebuilt) is bucketed from at most ROLLUP_GAP_FILL_MAX_ROWS
+    raw samples, nearest the rolled-up part first; partial is True when older
+    samples were left out. Raw samples found there also start a background
+    rebuild so the next read is served from buckets alone.
+    """
+    if resolution == "minute":
+        # Minute buckets past retention are never kept, so don't try to fill them from raw
+        since = max(as_utc(since), datetime.now(timezone.utc) - timedelta(days=ROLLUP_MINUTE_RETENTION_DAYS))
+    first = bucket_start(since, resolution)
+    buckets = db.metric_rollups.find(
+        {
+            "user_id": user_id,
+            "metric_type": metric_type,
+            "resolution": resolution,
+            "bucket_start": {"$gte": first}
+        },
+        {"_id": 0, "bucket_start": 1, "count": 1, "sum": 1, "min": 1, "max": 1}
+    ).sort("bucket_start", 1)
+
+    series = []
+    async for bucket in buckets:
+        count = bucket.get("count") or 0
+        series.append({
+            "bucket_start": bucket["bucket_start"],
+            "count": count,
+            "avg": round(bucket["sum"] / count, 2) if count else None,
+            "min": bucket.get("min"),
+            "max": bucket.get("max")
+        })
+
+    partial = False
+    covered_from = bucket_start(series[0]["bucket_start"], resolution) if series else None
+    if covered_from is None or covered_from > first:
+        rows = await db.health_metrics.find(
+            metric_filter(user_id, metric_type, since=first, until=covered_from),
+            {"_id": 0, "recorded_at": 1, "value": 1}
+        ).sort("recorded_at", -1).limit(ROLLUP_GAP_FILL_MAX_ROWS + 1).to_list(None)
+        if rows:
+            schedule_rebuild(db, user_id)
+            partial = len(rows) > ROLLUP_GAP_FILL_MAX_ROWS
+            filled = series_from_samples(rows[:ROLLUP_GAP_FILL_MAX_ROWS], resolution)
+            if partial:
+                # The oldest bucket read may be missing samples the cap cut off
+                filled = filled[1:]
+            # Same naive-UTC datetimes the stored buckets come back with
+            for bucket in filled:
+                bucket["bucket_start"] = bucket["bucket_start"].replace(tzinfo=None)
+            series = filled + series
+    return series, partial
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Metric rollup tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="Recompute rollups from health_metrics")
+    rebuild_parser.add_argument("--user-id", help="Only this user (default: every user with metrics)")
+    args = parser.parse_args()
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        try:
+            db = client[os.environ.get("DB_NAME", "miraii")]
+            if args.command == "rebuild":
+                user_ids = [args.user_id] if args.user_id else await db.health_metrics.distinct(metric_field("user_id"))
+                for user_id in user_ids:
+                    await rebuild_rollups(db, user_id)
+        finally:
+            client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,270 @@
+"""
+Health Metrics Storage
+======================
+
+Storage layout for the `health_metrics` collection:
+- 'standard': one plain document per reading (user_id / metric_type at top level)
+- 'timeseries': native MongoDB time-series collection with
+  timeField=recorded_at and metaField=meta ({user_id, metric_type}),
+  so MongoDB buckets readings per user and metric type
+
+All reads and writes go through metric_filter / to_storage / from_storage,
+so endpoints return the same document shape in either mode.
+
+Environment Variables:
+- METRICS_STORAGE_MODE: (Optional) 'standard' or 'timeseries' (default: 'standard')
+- METRICS_TIMESERIES_GRANULARITY: (Optional) 'seconds', 'minutes' or 'hours' (default: 'seconds')
+
+Migration (copies an existing plain collection into a time-series one):
+    python -m services.metrics_store migrate --batch-size 1000
+"""
+
+import os
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+METRICS_COLLECTION = "health_metrics"
+METRICS_LEGACY_COLLECTION = "health_metrics_legacy"
+METRICS_STORAGE_MODE = os.getenv("METRICS_STORAGE_MODE", "standard").lower()
+METRICS_TIMESERIES_GRANULARITY = os.getenv("METRICS_TIMESERIES_GRANULARITY", "seconds")
+META_FIELD = "meta"
+META_KEYS = ("user_id", "metric_type")
+
+MIGRATION_ID = "health_metrics_timeseries"
+
+
+def is_timeseries() -> bool:
+    return METRICS_STORAGE_MODE == "timeseries"
+
+# ============================================================
+# Query / Document Mapping
+# ============================================================
+
+def metric_filter(
+    user_id: str,
+    metric_type: Union[str, List[str], None] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Build a health_metrics filter that matches the active storage layout"""
+    prefix = f"{META_FIELD}." if is_timeseries() else ""
+    query: Dict[str, Any] = {f"{prefix}user_id": user_id}
+
+    if isinstance(metric_type, (list, tuple)):
+        query[f"{prefix}metric_type"] = {"$in": list(metric_type)}
+    elif metric_type:
+        query[f"{prefix}metric_type"] = metric_type
+
+    if since or until:
+        time_range = {}
+        if since:
+            time_range["$gte"] = since
+        if until:
+            time_range["$lt"] = until
+        query["recorded_at"] = time_range
+
+    return query
+
+
+def metric_field(name: str) -> str:
+    """Name of a metric field as stored (meta keys are nested in time-series mode)"""
+    if is_timeseries() and name in META_KEYS:
+        return f"{META_FIELD}.{name}"
+    return name
+
+
+def _nest_meta(doc: Dict[str, Any]) -> Dict[str, Any]:
+    stored = {k: v for k, v in doc.items() if k not in META_KEYS}
+    stored[META_FIELD] = {k: doc.get(k) for k in META_KEYS}
+    return stored
+
+
+def to_storage(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert an API metric document into its stored form"""
+    return _nest_meta(doc) if is_timeseries() else doc
+
+
+def from_storage(doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Convert a stored metric document back into the API shape"""
+    if doc is None:
+        return None
+    doc.pop("_id", None)
+    meta = doc.pop(META_FIELD, None)
+    if isinstance(meta, dict):
+        for key in META_KEYS:
+            doc.setdefault(key, meta.get(key))
+    return doc
+
+# ============================================================
+# Collection Bootstrap
+# ============================================================
+
+async def get_collection_type(db, name: str) -> Optional[str]:
+    """Return 'collection', 'timeseries', 'view' or None if it does not exist"""
+    async for info in await db.list_collections(filter={"name": name}):
+        return info.get("type", "collection")
+    return None
+
+
+async def create_timeseries_collection(db, name: str = METRICS_COLLECTION):
+    await db.create_collection(
+        name,
+        timeseries={
+            "timeField": "recorded_at",
+            "metaField": META_FIELD,
+            "granularity": METRICS_TIMESERIES_GRANULARITY
+        }
+    )
+    logger.info(f"Created time-series collection '{name}' (granularity={METRICS_TIMESERIES_GRANULARITY})")
+
+
+async def ensure_metrics_collection(db):
+    """Create health_metrics as a time-series collection when that mode is enabled"""
+    if not is_timeseries():
+        return
+
+    collection_type = await get_collection_type(db, METRICS_COLLECTION)
+    if collection_type is None:
+        await create_timeseries_collection(db)
+    elif collection_type != "timeseries":
+        logger.warning(
+            f"METRICS_STORAGE_MODE=timeseries but '{METRICS_COLLECTION}' is a plain collection. "
+            f"Run `python -m services.metrics_store migrate` to convert it."
+        )
+
+# ============================================================
+# Migration
+# ============================================================
+
+async def migrate_to_timeseries(db, batch_size: int = 1000) -> int:
+    """
+    Copy a plain health_metrics collection into a time-series one.
+
+    1. Rename the plain collection to health_metrics_legacy
+    2. Create health_metrics as a time-series collection
+    3. Copy legacy documents over in _id order, batch_size at a time
+
+    Progress is checkpointed in db.migrations, so an interrupted run
+    resumes where it stopped. Copies keep the legacy _id, and the upper _id
+    of each batch is recorded before it is inserted, so a resumed run skips
+    documents that a crashed batch inserted without checkpointing. The
+    legacy collection is left in place for verification and can be dropped
+    afterwards.
+
+    Refuses to run unless METRICS_STORAGE_MODE is 'timeseries': copies are
+    written in time-series shape, which standard-mode readers can't query.
+
+    Returns: number of documents copied in this run
+    """
+    if not is_timeseries():
+        raise RuntimeError(
+            f"METRICS_STORAGE_MODE is '{METRICS_STORAGE_MODE}'; set it to 'timeseries' "
+            f"(and deploy that setting) before migrating"
+        )
+    collection_type = await get_collection_type(db, METRICS_COLLECTION)
+    legacy_type = await get_collection_type(db, METRICS_LEGACY_COLLECTION)
+
+    if collection_type == "collection":
+        if legacy_type is not None:
+            raise RuntimeError(
+                f"Both '{METRICS_COLLECTION}' and '{METRICS_LEGACY_COLLECTION}' are plain collections; "
+                f"resolve manually before migrating"
+            )
+        await db[METRICS_COLLECTION].rename(METRICS_LEGACY_COLLECTION)
+        logger.info(f"Renamed '{METRICS_COLLECTION}' to '{METRICS_LEGACY_COLLECTION}'")
+        collection_type = None
+        legacy_type = "collection"
+
+    if collection_type is None:
+        await create_timeseries_collection(db)
+
+    if legacy_type is None:
+        logger.info("No legacy metrics to migrate")
+        return 0
+
+    checkpoint = await db.migrations.find_one({"_id": MIGRATION_ID}) or {}
+    last_id = checkpoint.get("last_id")
+    in_flight_until = checkpoint.get("in_flight_until")
+    copied = 0
+
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = await db[METRICS_LEGACY_COLLECTION].find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        already_copied = set()
+        if in_flight_until is not None and batch[0]["_id"] <= in_flight_until:
+            # A previous run inserted up to here and died before checkpointing it
+            existing = db[METRICS_COLLECTION].find({"_id": {"$in": [doc["_id"] for doc in batch]}}, {"_id": 1})
+            already_copied = {doc["_id"] async for doc in existing}
+
+        last_id = batch[-1]["_id"]
+        docs = []
+        for doc in batch:
+            if doc["_id"] in already_copied:
+                continue
+            if doc.get("recorded_at") is None:
+                # timeField is mandatory in a time-series collection
+                continue
+            docs.append(_nest_meta(doc))
+
+        if docs:
+            if in_flight_until is None or last_id > in_flight_until:
+                in_flight_until = last_id
+                await db.migrations.update_one(
+                    {"_id": MIGRATION_ID},
+                    {"$set": {"in_flight_until": in_flight_until}},
+                    upsert=True
+                )
+            await db[METRICS_COLLECTION].insert_many(docs, ordered=False)
+        copied += len(docs)
+
+        await db.migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"last_id": last_id, "updated_at": datetime.now(timezone.utc)}, "$inc": {"copied": len(docs)}},
+            upsert=True
+        )
+        logger.info(f"Migrated {copied} metrics so far")
+
+    logger.info(f"Migration complete: {copied} metrics copied into time-series '{METRICS_COLLECTION}'")
+    return copied
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+    # Read at import, before .env was loaded
+    METRICS_STORAGE_MODE = os.getenv("METRICS_STORAGE_MODE", "standard").lower()
+
+    parser = argparse.ArgumentParser(description="Health metrics storage tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Copy health_metrics into a time-series collection")
+    migrate_parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    if args.command == "migrate" and not is_timeseries():
+        parser.error(f"METRICS_STORAGE_MODE is '{METRICS_STORAGE_MODE}'; migrate only runs with METRICS_STORAGE_MODE=timeseries")
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        try:
+            db = client[os.environ.get("DB_NAME", "miraii")]
+            if args.command == "migrate":
+                await migrate_to_timeseries(db, batch_size=args.batch_size)
+        finally:
+            client.close()
+
+    asyncio.run(main())
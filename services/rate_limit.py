@@ -0,0 +1,169 @@
+"""
+In-Memory Rate Limiting
+=======================
+
+Per-key rate limiters that answer without a database round trip:
+- TokenBucketLimiter: burst capacity refilled at a steady rate (OTP sends)
+
+State lives in a fixed number of shards, each a bounded LRU of keys, so
+memory stays flat no matter how many identifiers hit the endpoint.
+Buckets can optionally be snapshotted to Mongo at shutdown and restored
+at startup so a deploy doesn't hand every client a fresh burst.
+
+Environment Variables:
+- OTP_SEND_BURST: (Optional) OTPs an identifier may request back-to-back (default: 5)
+- OTP_SEND_WINDOW_SECONDS: (Optional) Time to refill the full burst (default: 600)
+- RATE_LIMIT_PERSIST: (Optional) 'true' to save / restore buckets in Mongo (default: 'false')
+"""
+
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Hashable, List, Tuple
+
+from pymongo import ReplaceOne
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+OTP_SEND_BURST = int(os.getenv("OTP_SEND_BURST", "5"))
+OTP_SEND_WINDOW_SECONDS = float(os.getenv("OTP_SEND_WINDOW_SECONDS", "600"))
+RATE_LIMIT_PERSIST = os.getenv("RATE_LIMIT_PERSIST", "false").lower() == "true"
+
+RATE_LIMIT_SHARDS = 16
+RATE_LIMIT_KEYS_PER_SHARD = 20000
+
+# ============================================================
+# Token Bucket
+# ============================================================
+
+class TokenBucketLimiter:
+    """`capacity` tokens per key, refilled continuously at `refill_rate` tokens / second"""
+
+    def __init__(
+        self,
+        name: str,
+        capacity: float,
+        refill_rate: float,
+        shards: int = RATE_LIMIT_SHARDS,
+        keys_per_shard: int = RATE_LIMIT_KEYS_PER_SHARD
+    ):
+        self.name = name
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.keys_per_shard = keys_per_shard
+        # key -> (tokens, updated_at epoch seconds)
+        self._shards: List["OrderedDict[Hashable, Tuple[float, float]]"] = [OrderedDict() for _ in range(shards)]
+        self.allowed = 0
+        self.limited = 0
+
+    def _shard(self, key: Hashable) -> "OrderedDict[Hashable, Tuple[float, float]]":
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _level(self, tokens: float, updated_at: float, now: float) -> float:
+        return min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+
+    def try_acquire(self, key: Hashable, cost: float = 1.0) -> Tuple[bool, float]:
+        """Take `cost` tokens if available. Returns: (allowed, retry_after_seconds)"""
+        now = time.time()
+        shard = self._shard(key)
+        tokens, updated_at = shard.get(key, (self.capacity, now))
+        tokens = self._level(tokens, updated_at, now)
+
+        if tokens < cost:
+            self.limited += 1
+            shard[key] = (tokens, now)
+            shard.move_to_end(key)
+            return False, (cost - tokens) / self.refill_rate
+
+        shard[key] = (tokens - cost, now)
+        shard.move_to_end(key)
+        # Evicting the least recently used key only ever hands it a full bucket early
+        while len(shard) > self.keys_per_shard:
+            shard.popitem(last=False)
+        self.allowed += 1
+        return True, 0.0
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Buckets that are not yet full (a full bucket is the same as no entry)"""
+        now = time.time()
+        entries = []
+        for shard in self._shards:
+            for key, (tokens, updated_at) in shard.items():
+                level = self._level(tokens, updated_at, now)
+                if level < self.capacity:
+                    entries.append({"key": key, "tokens": level, "updated_at": now})
+        return entries
+
+    def restore(self, entries: List[Dict[str, Any]]):
+        for entry in entries:
+            self._shard(entry["key"])[entry["key"]] = (entry["tokens"], entry["updated_at"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "keys": sum(len(shard) for shard in self._shards),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+otp_send_limiter = TokenBucketLimiter(
+    "otp_send",
+    capacity=OTP_SEND_BURST,
+    refill_rate=OTP_SEND_BURST / OTP_SEND_WINDOW_SECONDS
+)
+
+# ============================================================
+# Persistence (optional)
+# ============================================================
+
+async def save_buckets(db, limiter: TokenBucketLimiter) -> int:
+    """Write partially drained buckets to db.rate_limit_buckets. Returns: buckets saved"""
+    entries = limiter.snapshot()
+    if not entries:
+        return 0
+
+    # A bucket is worthless once it would have refilled completely
+    refill_seconds = limiter.capacity / limiter.refill_rate
+    operations = []
+    for entry in entries:
+        updated_at = datetime.fromtimestamp(entry["updated_at"], tz=timezone.utc)
+        operations.append(ReplaceOne(
+            {"limiter": limiter.name, "key": entry["key"]},
+            {
+                "limiter": limiter.name,
+                "key": entry["key"],
+                "tokens": entry["tokens"],
+                "updated_at": updated_at,
+                "expires_at": updated_at + timedelta(seconds=refill_seconds)
+            },
+            upsert=True
+        ))
+    await db.rate_limit_buckets.bulk_write(operations, ordered=False)
+    logger.info(f"Saved {len(operations)} '{limiter.name}' rate limit buckets")
+    return len(operations)
+
+
+async def load_buckets(db, limiter: TokenBucketLimiter) -> int:
+    """Restore buckets saved by save_buckets(). Returns: buckets loaded"""
+    entries = []
+    cursor = db.rate_limit_buckets.find(
+        {"limiter": limiter.name, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+        {"_id": 0, "key": 1, "tokens": 1, "updated_at": 1}
+    )
+    async for doc in cursor:
+        updated_at = doc["updated_at"]
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        entries.append({"key": doc["key"], "tokens": doc["tokens"], "updated_at": updated_at.timestamp()})
+
+    limiter.restore(entries)
+    if entries:
+        logger.info(f"Restored {len(entries)} '{limiter.name}' rate limit buckets")
+    return len(entries)
@@ -0,0 +1,294 @@
+"""
+Per-Route Rate Limiting
+=======================
+
+ASGI middleware enforcing declarative per-route limits on the expensive
+endpoints (LLM chat, speech-to-text, TTS, auth):
+- Sliding-window counters (current + weighted previous fixed window)
+- 'memory' backend: sharded in-process store, no I/O on the request path
+- 'mongo' backend: counters shared by every worker via $inc upserts
+- Limited requests get 429 with Retry-After and RateLimit-* headers
+
+Environment Variables:
+- RATE_LIMIT_ENABLED: (Optional) 'false' to disable the middleware (default: 'true')
+- RATE_LIMIT_BACKEND: (Optional) 'memory' or 'mongo' (default: 'memory')
+- RATE_LIMIT_<RULE>: (Optional) Override a rule as '<limit>/<window seconds>', e.g. RATE_LIMIT_ELAI_VOICE=5/60
+- TRUSTED_PROXY_HOPS: (Optional) Reverse proxies in front of the app that append to
+  X-Forwarded-For (default: 0 = key on the socket peer, as resolved by uvicorn --proxy-headers)
+"""
+
+import os
+import json
+import math
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from starlette.requests import Request
+
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+COUNTER_SHARDS = 16
+COUNTER_KEYS_PER_SHARD = 20000
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    name: str
+    path: str
+    limit: int
+    window: int                  # seconds
+    prefix: bool = False         # match every path under `path`
+    methods: Tuple[str, ...] = ("POST",)
+
+    def matches(self, method: str, path: str) -> bool:
+        if method not in self.methods:
+            return False
+        return path.startswith(self.path) if self.prefix else path == self.path
+
+
+def _rule(name: str, path: str, limit: int, window: int, **kwargs) -> RateLimitRule:
+    override = os.getenv(f"RATE_LIMIT_{name.upper()}")
+    if override:
+        limit_str, _, window_str = override.partition("/")
+        limit = int(limit_str)
+        window = int(window_str or window)
+    return RateLimitRule(name, path, limit, window, **kwargs)
+
+
+# First matching rule wins
+RATE_LIMIT_RULES: List[RateLimitRule] = [
+    _rule("chat", "/api/chat", 20, 60),
+    _rule("elai_chat", "/api/elai/chat", 20, 60),
+    _rule("elai_voice", "/api/elai/voice", 10, 60),
+    _rule("elai_tts", "/api/elai/tts", 20, 60),
+    _rule("auth", "/api/auth/", 30, 60, prefix=True),
+]
+
+# ============================================================
+# Sliding Window Counters
+# ============================================================
+
+def sliding_estimate(previous: int, current: int, elapsed: float, window: int) -> float:
+    """Requests in the trailing window, assuming the previous window's hits were evenly spread"""
+    return previous * (1 - elapsed / window) + current
+
+
+def retry_after(previous: int, current: int, elapsed: float, window: int, limit: int) -> float:
+    """Seconds until one more request fits under the limit"""
+    if current + 1 > limit:
+        # Only the next window (where `current` becomes the decaying part) can help
+        return window - elapsed + window * (current + 1 - limit) / max(current, 1)
+    # The previous window's share decays at previous / window per second
+    excess = sliding_estimate(previous, current, elapsed, window) + 1 - limit
+    return min(window - elapsed, excess * window / previous) if previous else 0.0
+
+
+class MemoryCounterStore:
+    """Sliding-window counters in bounded LRU shards: key -> [window_index, current, previous]"""
+
+    def __init__(self, shards: int = COUNTER_SHARDS, keys_per_shard: int = COUNTER_KEYS_PER_SHARD):
+        self.keys_per_shard = keys_per_shard
+        self._shards: List["OrderedDict[str, List[int]]"] = [OrderedDict() for _ in range(shards)]
+
+    async def hit(self, key: str, limit: int, window: int) -> Tuple[bool, float, float]:
+        """Count one request if it fits. Returns: (allowed, remaining, retry_after)"""
+        now = time.time()
+        index = int(now // window)
+        elapsed = now - index * window
+
+        shard = self._shards[hash(key) % len(self._shards)]
+        entry = shard.get(key)
+        if entry is None or entry[0] < index - 1:
+            entry = [index, 0, 0]
+        elif entry[0] == index - 1:
+            entry = [index, 0, entry[1]]
+        shard[key] = entry
+        shard.move_to_end(key)
+        while len(shard) > self.keys_per_shard:
+            shard.popitem(last=False)
+
+        _, current, previous = entry
+        estimate = sliding_estimate(previous, current, elapsed, window)
+        if estimate + 1 > limit:
+            return False, 0.0, retry_after(previous, current, elapsed, window, limit)
+        entry[1] += 1
+        return True, limit - estimate - 1, 0.0
+
+
+class MongoCounterStore:
+    """Counters shared across workers: one doc per key per fixed window in rate_limit_counters"""
+
+    def __init__(self):
+        self.db = None
+        # Closed windows never change, so their counts are cached locally
+        self._closed = TTLCache("rate_limit_closed_windows", COUNTER_SHARDS * COUNTER_KEYS_PER_SHARD, 60)
+
+    def bind(self, db):
+        self.db = db
+
+    async def _increment(self, key: str, index: int, window: int) -> int:
+        window_end = datetime.fromtimestamp((index + 1) * window, tz=timezone.utc)
+        doc = await self.db.rate_limit_counters.find_one_and_update(
+            {"_id": f"{key}:{index}"},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": window_end + timedelta(seconds=window)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["count"]
+
+    async def hit(self, key: str, limit: int, window: int) -> Tuple[bool, float, float]:
+        now = time.time()
+        index = int(now // window)
+        elapsed = now - index * window
+
+        previous = self._closed.get((key, index - 1))
+        if previous is None:
+            doc = await self.db.rate_limit_counters.find_one({"_id": f"{key}:{index - 1}"}, {"count": 1})
+            previous = doc["count"] if doc else 0
+            self._closed.set((key, index - 1), previous, ttl=window * 2)
+
+        # Rejected requests are counted too; keeps this at one atomic write
+        current = await self._increment(key, index, window)
+        estimate = sliding_estimate(previous, current - 1, elapsed, window)
+        if estimate + 1 > limit:
+            return False, 0.0, retry_after(previous, current - 1, elapsed, window, limit)
+        return True, limit - estimate - 1, 0.0
+
+
+class RouteRateLimiter:
+    """Applies RATE_LIMIT_RULES against a counter store, falling back to memory if the store fails"""
+
+    def __init__(self, rules: List[RateLimitRule], backend: str = RATE_LIMIT_BACKEND):
+        self.rules = rules
+        self.memory = MemoryCounterStore()
+        self.store = MongoCounterStore() if backend == "mongo" else self.memory
+        self.allowed: Dict[str, int] = {rule.name: 0 for rule in rules}
+        self.limited: Dict[str, int] = {rule.name: 0 for rule in rules}
+
+    def bind(self, db):
+        if isinstance(self.store, MongoCounterStore):
+            self.store.bind(db)
+
+    def match(self, method: str, path: str) -> Optional[RateLimitRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    async def check(self, rule: RateLimitRule, client_key: str) -> Tuple[bool, float, float]:
+        key = f"{rule.name}:{client_key}"
+        store = self.store
+        if isinstance(store, MongoCounterStore) and store.db is None:
+            store = self.memory
+        try:
+            result = await store.hit(key, rule.limit, rule.window)
+        except Exception as e:
+            logger.warning(f"Shared rate limit store failed, using in-memory counters: {e}")
+            result = await self.memory.hit(key, rule.limit, rule.window)
+
+        (self.allowed if result[0] else self.limited)[rule.name] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": "routes",
+            "backend": "mongo" if isinstance(self.store, MongoCounterStore) else "memory",
+            "rules": [
+                {
+                    "name": rule.name,
+                    "path": rule.path + ("*" if rule.prefix else ""),
+                    "limit": rule.limit,
+                    "window_seconds": rule.window,
+                    "allowed": self.allowed[rule.name],
+                    "limited": self.limited[rule.name],
+                }
+                for rule in self.rules
+            ],
+        }
+
+
+route_limiter = RouteRateLimiter(RATE_LIMIT_RULES)
+
+# ============================================================
+# ASGI Middleware
+# ============================================================
+
+ClientKeyFunc = Callable[[Request], Awaitable[str]]
+
+
+def client_ip(request: Request, trusted_hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """
+    Address to key anonymous limits on. The client controls everything left
+    of what our own proxies appended to X-Forwarded-For, so only the entry
+    added by the outermost trusted proxy is used, and only when one is configured.
+    """
+    if trusted_hops > 0:
+        hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if len(hops) >= trusted_hops:
+            return hops[-trusted_hops]
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimitMiddleware:
+    """Pure ASGI so streaming / WebSocket routes are passed through untouched"""
+
+    def __init__(self, app, limiter: RouteRateLimiter, key_func: ClientKeyFunc, enabled: bool = RATE_LIMIT_ENABLED):
+        self.app = app
+        self.limiter = limiter
+        self.key_func = key_func
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rule = self.limiter.match(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        client_key = await self.key_func(Request(scope))
+        allowed, remaining, wait = await self.limiter.check(rule, client_key)
+        headers = [
+            (b"ratelimit-limit", str(rule.limit).encode()),
+            (b"ratelimit-remaining", str(max(0, math.floor(remaining))).encode()),
+        ]
+
+        if not allowed:
+            retry = str(max(1, math.ceil(wait))).encode()
+            body = json.dumps({"detail": "Too many requests. Please slow down."}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": headers + [
+                    (b"retry-after", retry),
+                    (b"ratelimit-reset", retry),
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,67 @@
+"""
+Columnar Series Format
+======================
+
+Compact chart payloads: one shared header plus parallel arrays instead
+of one JSON object per reading.
+
+    {"header": {"user_id", "metric_type", "unit", "resolution", ...},
+     "t": [epoch_ms, ...], "v": [value, ...]}                       # raw
+     "t": [...], "avg": [...], "min": [...], "max": [...], "count": [...]   # rollups
+
+Encodings:
+- json: compact JSON (no per-row keys, no whitespace)
+- msgpack: MessagePack binary (requires the `msgpack` package)
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+COLUMNAR_ENCODINGS = ("json", "msgpack")
+
+
+def to_epoch_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def raw_columns(rows: List[Dict[str, Any]], header: Dict[str, Any]) -> Dict[str, Any]:
+    """Columnar form of raw metric rows ({"recorded_at", "value", "unit", ...})"""
+    unit = next((row.get("unit") for row in rows if row.get("unit")), None)
+    return {
+        "header": {**header, "unit": unit, "count": len(rows)},
+        "t": [to_epoch_ms(row["recorded_at"]) for row in rows],
+        "v": [row.get("value") for row in rows],
+    }
+
+
+def rollup_columns(buckets: List[Dict[str, Any]], header: Dict[str, Any]) -> Dict[str, Any]:
+    """Columnar form of rollup buckets ({"bucket_start", "avg", "min", "max", "count"})"""
+    return {
+        "header": {**header, "count": len(buckets)},
+        "t": [to_epoch_ms(b["bucket_start"]) for b in buckets],
+        "avg": [b["avg"] for b in buckets],
+        "min": [b["min"] for b in buckets],
+        "max": [b["max"] for b in buckets],
+        "count": [b["count"] for b in buckets],
+    }
+
+
+def encode_columnar(payload: Dict[str, Any], encoding: str = "json") -> Tuple[bytes, str]:
+    """Serialize a columnar payload. Returns: (body, media_type)"""
+    if encoding == "msgpack":
+        if not MSGPACK_AVAILABLE:
+            raise RuntimeError("msgpack encoding requested but the msgpack package is not installed")
+        return msgpack.packb(payload, use_bin_type=True), "application/x-msgpack"
+    return json.dumps(payload, separators=(",", ":"), default=str).encode(), "application/json"
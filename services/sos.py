@@ -0,0 +1,236 @@
+"""
+SOS Trigger Path
+================
+
+Database work behind POST /api/sos/trigger, shaped so the app gets its
+incident_id after two waits on Mongo instead of five sequential ones:
+- load_sos_context: the vitals backfill, emergency_contacts and
+  health_sharing reads run concurrently
+- write_sos_incident: the incident and the app alert are inserted
+  concurrently (different collections, so no single bulk_write covers both);
+  an alert failure does not fail the trigger once the incident is saved
+- Notification fan-out runs after the response, on the worker pools
+  of services/sos_dispatch
+
+CLI (drives the real endpoint in-process over httpx's ASGI transport):
+    python -m services.sos bench --triggers 500 --budget-ms 100   # exits 1 if p99 exceeds the budget
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Dict, List, Tuple
+
+from services.latest_vitals import get_latest_vitals
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+SOS_CONTACT_LIMIT = 20
+SOS_VITAL_TYPES = ["heart_rate", "spo2"]
+SOS_TRIGGER_P99_BUDGET_MS = float(os.getenv("SOS_TRIGGER_P99_BUDGET_MS", "100"))
+
+# ============================================================
+# Trigger Path
+# ============================================================
+
+async def _no_vitals() -> Dict[str, Dict[str, Any]]:
+    return {}
+
+
+async def load_sos_context(
+    db,
+    user_id: str,
+    need_vitals: bool
+) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Returns: (latest vitals by type, emergency contacts, health-sharing contacts), fetched concurrently"""
+    return await asyncio.gather(
+        get_latest_vitals(db, user_id, SOS_VITAL_TYPES) if need_vitals else _no_vitals(),
+        db.emergency_contacts.find({"user_id": user_id}, {"_id": 0}).to_list(SOS_CONTACT_LIMIT),
+        db.health_sharing.find({"user_id": user_id, "sharing_enabled": True}, {"_id": 0}).to_list(SOS_CONTACT_LIMIT),
+    )
+
+
+def merge_sos_contacts(emergency_contacts: List[Dict[str, Any]], health_contacts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Emergency contacts first, then health-sharing contacts, deduplicated by
+    phone. When both lists have the same phone the emergency contact's id and
+    name are kept and the number is texted once; the health-sharing contact's
+    email fills in a missing one, or, if it differs, is kept as an email-only
+    contact so that inbox is still notified.
+    """
+    contacts: Dict[str, Dict[str, Any]] = {}
+    for contact in emergency_contacts:
+        contacts[contact["phone"]] = {
+            "id": contact.get("contact_id", str(uuid.uuid4())),
+            "name": contact["name"],
+            "phone": contact["phone"],
+            "email": contact.get("email"),
+            "is_primary": contact.get("is_primary", False)
+        }
+    for contact in health_contacts:
+        existing = contacts.get(contact["phone"])
+        email = contact.get("email")
+        if existing is None:
+            contacts[contact["phone"]] = {
+                "id": contact.get("sharing_id", str(uuid.uuid4())),
+                "name": contact["name"],
+                "phone": contact["phone"],
+                "email": email,
+                "is_primary": False
+            }
+        elif not existing["email"]:
+            existing["email"] = email
+        elif email and email.lower() != existing["email"].lower():
+            contacts[f"{contact['phone']}|email"] = {
+                "id": contact.get("sharing_id", str(uuid.uuid4())),
+                "name": contact["name"],
+                "phone": None,
+                "email": email,
+                "is_primary": False
+            }
+    return list(contacts.values())
+
+
+async def write_sos_incident(db, incident: Dict[str, Any], alert: Dict[str, Any]) -> bool:
+    """
+    Insert the incident and its app alert concurrently (two inserts in
+    flight together; they are different collections, so not one batch).
+
+    The incident is what the caller needs: if only the alert insert fails it
+    is logged and False is returned, so the trigger still answers with the
+    incident_id and notifications still go out instead of the app retrying
+    into a duplicate incident. If the incident insert fails, an alert that
+    did land is deleted again and the error is raised.
+
+    Returns: whether the alert was written
+    """
+    incident_result, alert_result = await asyncio.gather(
+        db.sos_incidents.insert_one(incident),
+        db.alerts.insert_one(alert),
+        return_exceptions=True
+    )
+    if isinstance(incident_result, BaseException):
+        if not isinstance(alert_result, BaseException):
+            try:
+                await db.alerts.delete_one({"alert_id": alert["alert_id"]})
+            except Exception as e:
+                logger.error(f"Could not remove alert {alert['alert_id']} for unsaved SOS incident: {e}")
+        raise incident_result
+    if isinstance(alert_result, BaseException):
+        logger.error(f"SOS incident {incident['incident_id']} saved but its app alert was not: {alert_result}")
+        return False
+    return True
+
+# ============================================================
+# Benchmark: trigger latency (what the client waits for)
+# ============================================================
+
+async def _sequential_baseline(db, user_id: str, incident: Dict[str, Any], alert: Dict[str, Any]):
+    """The five-awaits-in-a-row shape this module replaces"""
+    await get_latest_vitals(db, user_id, SOS_VITAL_TYPES)
+    emergency = await db.emergency_contacts.find({"user_id": user_id}, {"_id": 0}).to_list(SOS_CONTACT_LIMIT)
+    health = await db.health_sharing.find({"user_id": user_id, "sharing_enabled": True}, {"_id": 0}).to_list(SOS_CONTACT_LIMIT)
+    merge_sos_contacts(emergency, health)
+    await db.sos_incidents.insert_one(incident)
+    await db.alerts.insert_one(alert)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct * len(ordered)))]
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    from pathlib import Path
+    from datetime import datetime, timezone
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="SOS trigger path tools")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--triggers", type=int, default=500)
+    parser.add_argument("--contacts", type=int, default=5, help="emergency contacts per user")
+    parser.add_argument("--budget-ms", type=float, default=SOS_TRIGGER_P99_BUDGET_MS)
+    args = parser.parse_args()
+
+    def _docs(user_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        incident_id = str(uuid.uuid4())
+        now = datetime.now(timezone.utc)
+        incident = {"incident_id": incident_id, "user_id": user_id, "status": "active", "contacts_notified": [], "created_at": now}
+        alert = {"alert_id": str(uuid.uuid4()), "user_id": user_id, "alert_type": "sos_triggered", "metadata": {"incident_id": incident_id}, "created_at": now}
+        return incident, alert
+
+    async def main() -> int:
+        import httpx
+        from services.db_indexes import apply_indexes
+        from services.latest_vitals import rebuild_latest_vitals
+        from services.sos_dispatch import FakeChannelAdapter
+
+        # server.py binds its db at import time, so point it at the bench database first
+        bench_db_name = os.environ.get("DB_NAME", "miraii") + "_bench_sos"
+        os.environ["DB_NAME"] = bench_db_name
+        import server
+
+        client, db = server.client, server.db
+        dispatcher = server.sos_dispatcher
+        try:
+            await client.drop_database(bench_db_name)
+            await apply_indexes(db)
+            user_id = "bench_user"
+            await db.users.insert_one({"user_id": user_id, "name": "Bench User", "email": "bench@example.com"})
+            await db.emergency_contacts.insert_many([
+                {"contact_id": f"c{i}", "user_id": user_id, "name": f"Contact {i}", "phone": f"+1555000{i:04d}", "is_primary": i == 0}
+                for i in range(args.contacts)
+            ])
+            await db.health_sharing.insert_many([
+                {"sharing_id": f"s{i}", "user_id": user_id, "name": f"Carer {i}", "phone": f"+1555100{i:04d}", "sharing_enabled": True}
+                for i in range(2)
+            ])
+            await rebuild_latest_vitals(db, user_id)
+
+            # Fan-out runs on fake channels after each response, as it would in production
+            if "sms" not in dispatcher.channels:
+                dispatcher.register(FakeChannelAdapter("sms"))
+            dispatcher.start(db)
+
+            headers = {"Authorization": f"Bearer {server.create_jwt_token(user_id)}"}
+            body = {"trigger_source": "app_button"}
+            results: Dict[str, List[float]] = {"sequential (db only)": [], "POST /api/sos/trigger": []}
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+                for _ in range(args.triggers):
+                    t0 = time.perf_counter()
+                    await _sequential_baseline(db, user_id, *_docs(user_id))
+                    results["sequential (db only)"].append((time.perf_counter() - t0) * 1000)
+
+                    t0 = time.perf_counter()
+                    response = await http.post("/api/sos/trigger", json=body, headers=headers)
+                    results["POST /api/sos/trigger"].append((time.perf_counter() - t0) * 1000)
+                    if response.status_code != 200:
+                        print(f"FAIL: trigger returned {response.status_code}: {response.text[:200]}")
+                        return 1
+
+            for name, samples in results.items():
+                print(f"{name:<22} p50 {percentile(samples, 0.50):7.2f} ms  p99 {percentile(samples, 0.99):7.2f} ms")
+            p99 = percentile(results["POST /api/sos/trigger"], 0.99)
+            if p99 > args.budget_ms:
+                print(f"FAIL: p99 {p99:.2f} ms exceeds budget {args.budget_ms:.0f} ms")
+                return 1
+            print(f"OK: p99 {p99:.2f} ms within budget {args.budget_ms:.0f} ms")
+            return 0
+        finally:
+            await dispatcher.stop()
+            await client.drop_database(bench_db_name)
+            client.close()
+
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,645 @@
+"""
+SOS Notification Dispatcher
+===========================
+
+Delivers SOS alerts to a user's contacts over SMS and email, and records
+every delivery on the incident:
+- One channel adapter per transport (Twilio SMS, EmailService),
+  each drained by its own worker pool so a slow channel never holds up another
+- At most SOS_PER_CONTACT_CONCURRENCY sends to the same contact at once
+- Failed sends retry with short jittered backoff; permanent errors
+  (bad number, rejected address) fail immediately
+- Each outcome is written to its entry in sos_incidents.contacts_notified
+  with a positional update, matched on (contact_id, channel)
+- Trigger -> last attempt latency is recorded per incident (and on the
+  incident as notification_latency_ms)
+
+Queues are in-process, so every entry carries updated_at and the
+dispatcher recovers what a stopped or crashed process left behind:
+- stop() writes deliveries still queued or waiting on a retry timer as
+  'interrupted' instead of dropping them
+- A recovery sweep (at start, then every SOS_RECOVERY_STALE_SECONDS)
+  re-enqueues 'interrupted' entries and 'queued'/'retrying' entries nobody
+  has touched for SOS_RECOVERY_STALE_SECONDS; each entry is claimed with a
+  compare-and-set on updated_at so two workers never resend the same one
+- Entries that can't be resent (incident older than
+  SOS_RECOVERY_MAX_AGE_MINUTES or no longer active, channel not configured,
+  attempts used up) are marked 'failed' with the reason
+
+Fake adapters (SMS_PROVIDER=FAKE) record sends locally.
+
+Environment Variables:
+- SMS_PROVIDER: (Optional) 'TWILIO' or 'FAKE'; SMS is unavailable when unset
+- TWILIO_ACCOUNT_SID / TWILIO_AUTH_TOKEN / TWILIO_FROM_NUMBER: Twilio credentials
+- SOS_DISPATCH_WORKERS: (Optional) Workers per channel (default: 4)
+- SOS_PER_CONTACT_CONCURRENCY: (Optional) Concurrent sends to one contact (default: 2)
+- SOS_MAX_ATTEMPTS: (Optional) Attempts per notification (default: 4)
+- SOS_RECOVERY_STALE_SECONDS: (Optional) Idle time before a queued entry counts as orphaned (default: 120)
+- SOS_RECOVERY_MAX_AGE_MINUTES: (Optional) Older incidents are marked failed instead of resent (default: 60)
+
+CLI:
+    python -m services.sos_dispatch bench --incidents 200 --contacts 5 --fail-rate 0.1   # fake adapters, real Mongo write-back
+"""
+
+import os
+import time
+import html
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from services.http_clients import http_clients
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+SMS_PROVIDER = os.getenv("SMS_PROVIDER", "").upper()
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
+TWILIO_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER", "")
+
+SOS_DISPATCH_WORKERS = int(os.getenv("SOS_DISPATCH_WORKERS", "4"))
+SOS_PER_CONTACT_CONCURRENCY = int(os.getenv("SOS_PER_CONTACT_CONCURRENCY", "2"))
+SOS_MAX_ATTEMPTS = int(os.getenv("SOS_MAX_ATTEMPTS", "4"))
+SOS_RECOVERY_STALE_SECONDS = int(os.getenv("SOS_RECOVERY_STALE_SECONDS", "120"))
+SOS_RECOVERY_MAX_AGE_MINUTES = int(os.getenv("SOS_RECOVERY_MAX_AGE_MINUTES", "60"))
+
+SOS_RETRY_BASE = 0.5      # seconds; an emergency can't wait for the email outbox's minutes-long backoff
+SOS_RETRY_MAX = 8.0
+LATENCY_SAMPLES = 500
+
+SOS_SUBJECT = "🚨 Miraii SOS alert"
+
+# ============================================================
+# Channel Adapters
+# ============================================================
+
+def _result(success: bool, message: str = "", retryable: bool = True) -> Dict[str, Any]:
+    return {"success": success, "message": message, "retryable": retryable}
+
+
+class ChannelAdapter:
+    """send(address, message) -> {"success", "message", "retryable"}"""
+
+    channel = ""
+
+    async def send(self, address: str, message: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class TwilioSMSAdapter(ChannelAdapter):
+    channel = "sms"
+    API_URL = "https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json"
+
+    async def send(self, address: str, message: str) -> Dict[str, Any]:
+        response = await http_clients.get("sms").post(
+            self.API_URL.format(sid=TWILIO_ACCOUNT_SID),
+            auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+            data={"To": address, "From": TWILIO_FROM_NUMBER, "Body": message}
+        )
+        if response.status_code in [200, 201]:
+            return _result(True, response.json().get("sid", ""))
+        # 4xx other than rate limiting means the number/request is bad; retrying won't help
+        return _result(False, f"Twilio {response.status_code}: {response.text[:200]}",
+                       retryable=response.status_code == 429 or response.status_code >= 500)
+
+
+class EmailChannelAdapter(ChannelAdapter):
+    """Sends directly through the email provider chain; the outbox's retry pacing is too slow for SOS"""
+
+    channel = "email"
+
+    def __init__(self, send_email: Callable[..., Awaitable[Dict[str, Any]]]):
+        self.send_email = send_email
+
+    async def send(self, address: str, message: str) -> Dict[str, Any]:
+        result = await self.send_email(
+            to_email=address,
+            subject=SOS_SUBJECT,
+            html_content=f'<pre style="font-family: inherit; white-space: pre-wrap;">{html.escape(message)}</pre>',
+            text_content=message
+        )
+        if result.get("success"):
+            return _result(True, result.get("provider", ""))
+        return _result(False, result.get("message", "Email send failed"),
+                       retryable=not result.get("demo_mode") and result.get("status_code") not in (400, 422))
+
+
+class FakeChannelAdapter(ChannelAdapter):
+    """Records sends instead of making them; can be told to fail or be slow"""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.sent: List[Dict[str, str]] = []
+        self.fail_next = 0
+        self.delay = 0.0
+
+    async def send(self, address: str, message: str) -> Dict[str, Any]:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            return _result(False, "Simulated channel failure")
+        self.sent.append({"to": address, "message": message})
+        return _result(True, "recorded")
+
+
+def configured_adapters() -> Dict[str, ChannelAdapter]:
+    """SMS adapter if its provider is configured; email is registered by the app (it owns EmailService)"""
+    adapters: Dict[str, ChannelAdapter] = {}
+    if SMS_PROVIDER == "FAKE":
+        adapters["sms"] = FakeChannelAdapter("sms")
+    elif SMS_PROVIDER == "TWILIO" and TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_FROM_NUMBER:
+        adapters["sms"] = TwilioSMSAdapter()
+    elif SMS_PROVIDER:
+        logger.warning(f"SMS provider {SMS_PROVIDER} not usable (unknown or missing credentials)")
+    return adapters
+
+# ============================================================
+# Dispatcher
+# ============================================================
+
+@dataclass
+class Delivery:
+    incident_id: str
+    contact_id: str
+    channel: str
+    address: str
+    message: str
+    attempts: int = 0
+
+
+def plan_deliveries(
+    incident_id: str,
+    contacts: List[Dict[str, Any]],
+    message: str,
+    channels: List[str]
+) -> Tuple[List[Dict[str, Any]], List[Delivery]]:
+    """
+    One notification entry per (contact, channel the contact can be reached on).
+    Returns: (contacts_notified entries for the incident, deliveries to dispatch)
+    A contact whose phone can't be texted (no SMS provider) gets a 'failed'
+    entry so the incident shows who was not reached.
+    """
+    entries: List[Dict[str, Any]] = []
+    deliveries: List[Delivery] = []
+    now = datetime.now(timezone.utc)
+    for contact in contacts:
+        targets = (("sms", contact.get("phone")), ("email", contact.get("email")))
+        for channel, address in targets:
+            if not address:
+                continue
+            entry = {
+                "contact_id": contact["id"],
+                "contact_name": contact["name"],
+                "contact_phone": contact.get("phone"),
+                "channel": channel,
+                "address": address,
+                "status": "queued",
+                "sent_at": None,
+                "attempts": 0,
+                "last_error": None,
+                "updated_at": now,
+            }
+            if channel in channels:
+                deliveries.append(Delivery(incident_id, contact["id"], channel, address, message))
+            elif channel == "sms":
+                entry.update({"status": "failed", "last_error": "SMS provider not configured"})
+            else:
+                continue
+            entries.append(entry)
+    return entries, deliveries
+
+
+def retry_delay(attempt: int) -> float:
+    """Equal-jitter exponential backoff on a sub-second base"""
+    delay = min(SOS_RETRY_MAX, SOS_RETRY_BASE * (2 ** (attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class SOSDispatcher:
+    """Per-channel queues and worker pools; outcomes written back to the incident"""
+
+    def __init__(
+        self,
+        adapters: Dict[str, ChannelAdapter],
+        workers: int = SOS_DISPATCH_WORKERS,
+        per_contact: int = SOS_PER_CONTACT_CONCURRENCY,
+        max_attempts: int = SOS_MAX_ATTEMPTS
+    ):
+        self.adapters = adapters
+        self.workers = workers
+        self.per_contact = per_contact
+        self.max_attempts = max_attempts
+        self.db = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._recovery_task: Optional[asyncio.Task] = None
+        # pending retry -> the delivery it will requeue, so stop() can record it
+        self._retry_timers: Dict[asyncio.TimerHandle, Delivery] = {}
+        # contact_id -> [semaphore, holders+waiters]
+        self._contact_slots: Dict[str, List[Any]] = {}
+        # incident_id -> {"remaining": n, "triggered_at": monotonic}
+        self._incidents: Dict[str, Dict[str, Any]] = {}
+        self.latencies_ms: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {
+            channel: {"sent": 0, "failed": 0, "retried": 0}
+            for channel in adapters
+        }
+        self.recovery_stats = {"resent": 0, "abandoned": 0, "interrupted": 0}
+
+    @property
+    def channels(self) -> List[str]:
+        return list(self.adapters)
+
+    def register(self, adapter: ChannelAdapter):
+        """Add a channel before start()"""
+        self.adapters[adapter.channel] = adapter
+        self.stats[adapter.channel] = {"sent": 0, "failed": 0, "retried": 0}
+
+    def start(self, db):
+        if self._tasks:
+            return
+        self.db = db
+        for channel in self.adapters:
+            self._queues[channel] = asyncio.Queue()
+            self._tasks += [asyncio.create_task(self._worker(channel)) for _ in range(self.workers)]
+        self._recovery_task = asyncio.create_task(self._recovery_loop())
+        logger.info(f"SOS dispatcher started: channels={self.channels}, {self.workers} workers each")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """
+        Give queued deliveries `drain_timeout` to go out, then cancel workers.
+        Whatever is still queued or waiting on a retry is written back as
+        'interrupted' so the next recovery sweep resends it.
+        """
+        if not self._tasks:
+            return
+        if self._recovery_task:
+            self._recovery_task.cancel()
+            await asyncio.gather(self._recovery_task, return_exceptions=True)
+            self._recovery_task = None
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues.values())),
+                timeout=drain_timeout
+            )
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        undelivered: List[Delivery] = []
+        for timer, delivery in self._retry_timers.items():
+            timer.cancel()
+            undelivered.append(delivery)
+        self._retry_timers.clear()
+        for queue in self._queues.values():
+            while not queue.empty():
+                undelivered.append(queue.get_nowait())
+        if undelivered:
+            logger.warning(f"SOS dispatcher stopped with {len(undelivered)} deliveries unsent; recording them as interrupted")
+            for delivery in undelivered:
+                try:
+                    await self._record_interrupted(delivery)
+                    self.recovery_stats["interrupted"] += 1
+                except Exception as e:
+                    logger.error(f"SOS could not record interrupted {delivery.channel} delivery for incident {delivery.incident_id}: {e}")
+
+    def dispatch(self, incident_id: str, deliveries: List[Delivery], triggered_at: Optional[float] = None):
+        """Queue an incident's deliveries. triggered_at: time.monotonic() when the SOS came in"""
+        if not deliveries:
+            return
+        if not self._tasks:
+            logger.error(f"SOS dispatcher not running; {len(deliveries)} notifications for incident {incident_id} left for recovery")
+            return
+        self._incidents[incident_id] = {"remaining": len(deliveries), "triggered_at": triggered_at or time.monotonic()}
+        for delivery in deliveries:
+            self._queues[delivery.channel].put_nowait(delivery)
+
+    # ------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------
+
+    async def _worker(self, channel: str):
+        queue = self._queues[channel]
+        while True:
+            delivery = await queue.get()
+            try:
+                await self._attempt(delivery)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"SOS {channel} worker failed on incident {delivery.incident_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def _attempt(self, delivery: Delivery):
+        delivery.attempts += 1
+        async with self._contact_slot(delivery.contact_id):
+            try:
+                result = await self.adapters[delivery.channel].send(delivery.address, delivery.message)
+            except Exception as e:
+                result = _result(False, str(e))
+
+        # Queue the retry / settle the incident before any Mongo write, so a
+        # failed write-back can't lose a retry or leave the incident in flight
+        attempt = delivery.attempts
+        stats = self.stats[delivery.channel]
+        if result["success"]:
+            stats["sent"] += 1
+            status, error = "sent", None
+        elif result["retryable"] and attempt < self.max_attempts:
+            stats["retried"] += 1
+            status, error = "retrying", result["message"]
+            self._schedule_retry(delivery)
+        else:
+            stats["failed"] += 1
+            status, error = "failed", result["message"]
+            logger.error(f"SOS {delivery.channel} to contact {delivery.contact_id} failed after {attempt} attempts: {error}")
+        latency_ms = self._finished(delivery) if status != "retrying" else None
+
+        try:
+            await self._record(delivery, attempt, status, error)
+            if latency_ms is not None:
+                await self._record_completion(delivery.incident_id, latency_ms)
+        except Exception as e:
+            logger.error(f"SOS write-back failed for incident {delivery.incident_id} ({delivery.channel} {status}): {e}")
+
+    @asynccontextmanager
+    async def _contact_slot(self, contact_id: str):
+        slot = self._contact_slots.setdefault(contact_id, [asyncio.Semaphore(self.per_contact), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                self._contact_slots.pop(contact_id, None)
+
+    def _schedule_retry(self, delivery: Delivery):
+        loop = asyncio.get_running_loop()
+        queue = self._queues[delivery.channel]
+
+        def requeue():
+            self._retry_timers.pop(timer, None)
+            queue.put_nowait(delivery)
+
+        timer = loop.call_later(retry_delay(delivery.attempts), requeue)
+        self._retry_timers[timer] = delivery
+
+    # ------------------------------------------------------------
+    # Status write-back
+    # ------------------------------------------------------------
+
+    async def _record(self, delivery: Delivery, attempt: int, status: str, error: Optional[str]):
+        """Positional update of the delivery's entry; an older attempt never overwrites a newer one"""
+        update = {
+            "contacts_notified.$.status": status,
+            "contacts_notified.$.attempts": attempt,
+            "contacts_notified.$.last_error": error,
+            "contacts_notified.$.updated_at": datetime.now(timezone.utc),
+        }
+        if status == "sent":
+            update["contacts_notified.$.sent_at"] = datetime.now(timezone.utc)
+        await self.db.sos_incidents.update_one(
+            {
+                "incident_id": delivery.incident_id,
+                "contacts_notified": {"$elemMatch": {
+                    "contact_id": delivery.contact_id,
+                    "channel": delivery.channel,
+                    "attempts": {"$lt": attempt}
+                }}
+            },
+            {"$set": update}
+        )
+
+    async def _record_interrupted(self, delivery: Delivery):
+        await self.db.sos_incidents.update_one(
+            {
+                "incident_id": delivery.incident_id,
+                "contacts_notified": {"$elemMatch": {
+                    "contact_id": delivery.contact_id,
+                    "channel": delivery.channel,
+                    "attempts": {"$lte": delivery.attempts},
+                    "status": {"$in": ["queued", "retrying"]}
+                }}
+            },
+            {"$set": {
+                "contacts_notified.$.status": "interrupted",
+                "contacts_notified.$.last_error": "Dispatcher stopped before delivery",
+                "contacts_notified.$.updated_at": datetime.now(timezone.utc)
+            }}
+        )
+
+    def _finished(self, delivery: Delivery) -> Optional[float]:
+        """Count a delivery as done; returns the trigger latency once the incident's last one is"""
+        incident = self._incidents.get(delivery.incident_id)
+        if incident is None:
+            return None
+        incident["remaining"] -= 1
+        if incident["remaining"] > 0:
+            return None
+        del self._incidents[delivery.incident_id]
+        latency_ms = (time.monotonic() - incident["triggered_at"]) * 1000
+        self.latencies_ms.append(latency_ms)
+        return latency_ms
+
+    async def _record_completion(self, incident_id: str, latency_ms: float):
+        await self.db.sos_incidents.update_one(
+            {"incident_id": incident_id},
+            {"$set": {
+                "notifications_completed_at": datetime.now(timezone.utc),
+                "notification_latency_ms": round(latency_ms, 1)
+            }}
+        )
+
+    # ------------------------------------------------------------
+    # Recovery
+    # ------------------------------------------------------------
+
+    async def _recovery_loop(self):
+        while True:
+            try:
+                await self.recover()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"SOS recovery sweep failed: {e}")
+            await asyncio.sleep(SOS_RECOVERY_STALE_SECONDS)
+
+    async def recover(self) -> Dict[str, int]:
+        """
+        Resend entries another (stopped or crashed) process left unsent;
+        mark the ones that can't be resent as failed.
+        Returns: {"resent": n, "abandoned": n}
+        """
+        now = datetime.now(timezone.utc)
+        # The client isn't tz-aware, so stored datetimes come back naive UTC
+        stale_before = (now - timedelta(seconds=SOS_RECOVERY_STALE_SECONDS)).replace(tzinfo=None)
+        too_old = (now - timedelta(minutes=SOS_RECOVERY_MAX_AGE_MINUTES)).replace(tzinfo=None)
+        orphaned = {"$or": [
+            {"status": "interrupted"},
+            {"status": {"$in": ["queued", "retrying"]}, "updated_at": {"$lt": stale_before}},
+            # entries written before updated_at existed
+            {"status": {"$in": ["queued", "retrying"]}, "updated_at": None},
+        ]}
+        counts = {"resent": 0, "abandoned": 0}
+        cursor = self.db.sos_incidents.find(
+            {"contacts_notified": {"$elemMatch": orphaned}},
+            {"_id": 0, "incident_id": 1, "status": 1, "created_at": 1, "message_sent": 1, "contacts_notified": 1}
+        )
+        async for incident in cursor:
+            created_at = incident.get("created_at")
+            if created_at is not None and created_at.tzinfo is not None:
+                created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+            for entry in incident.get("contacts_notified", []):
+                status, updated_at = entry.get("status"), entry.get("updated_at")
+                if not (status == "interrupted" or (
+                    status in ("queued", "retrying") and (updated_at is None or updated_at < stale_before)
+                )):
+                    continue
+                if incident.get("status") != "active":
+                    reason = f"Not resent: incident {incident.get('status')}"
+                elif created_at is None or created_at < too_old:
+                    reason = f"Not resent: incident older than {SOS_RECOVERY_MAX_AGE_MINUTES} minutes"
+                elif entry.get("channel") not in self.adapters:
+                    reason = f"Not resent: {entry.get('channel')} channel not configured"
+                elif not entry.get("address"):
+                    reason = "Not resent: no address recorded"
+                elif entry.get("attempts", 0) >= self.max_attempts:
+                    reason = f"Not resent: {entry.get('attempts')} attempts used"
+                else:
+                    reason = None
+                # Compare-and-set on the entry as read: another sweeper (or a
+                # late write-back) that got there first makes this a no-op
+                claimed = await self.db.sos_incidents.update_one(
+                    {
+                        "incident_id": incident["incident_id"],
+                        "contacts_notified": {"$elemMatch": {
+                            "contact_id": entry["contact_id"],
+                            "channel": entry["channel"],
+                            "status": status,
+                            "attempts": entry.get("attempts", 0),
+                            "updated_at": updated_at
+                        }}
+                    },
+                    {"$set": {
+                        "contacts_notified.$.status": "failed" if reason else "queued",
+                        "contacts_notified.$.last_error": reason or entry.get("last_error"),
+                        "contacts_notified.$.updated_at": datetime.now(timezone.utc)
+                    }}
+                )
+                if not claimed.modified_count:
+                    continue
+                if reason:
+                    counts["abandoned"] += 1
+                    logger.error(f"SOS {entry['channel']} to contact {entry['contact_id']} for incident {incident['incident_id']}: {reason}")
+                    continue
+                counts["resent"] += 1
+                self._queues[entry["channel"]].put_nowait(Delivery(
+                    incident["incident_id"], entry["contact_id"], entry["channel"],
+                    entry["address"], incident["message_sent"], entry.get("attempts", 0)
+                ))
+        if counts["resent"] or counts["abandoned"]:
+            logger.warning(f"SOS recovery: {counts['resent']} deliveries resent, {counts['abandoned']} marked failed")
+        for key, value in counts.items():
+            self.recovery_stats[key] += value
+        return counts
+
+    def latency_percentiles(self) -> Dict[str, Optional[float]]:
+        """Trigger -> last attempt, over the most recent incidents"""
+        ordered = sorted(self.latencies_ms)
+        if not ordered:
+            return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+        pick = lambda pct: round(ordered[min(len(ordered) - 1, int(pct * len(ordered)))], 1)
+        return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "channels": self.channels,
+            "workers_per_channel": self.workers,
+            "queued": {channel: queue.qsize() for channel, queue in self._queues.items()},
+            "retries_scheduled": len(self._retry_timers),
+            "incidents_in_flight": len(self._incidents),
+            "by_channel": self.stats,
+            "recovery": self.recovery_stats,
+            "trigger_to_last_attempt": self.latency_percentiles(),
+        }
+
+
+sos_dispatcher = SOSDispatcher(configured_adapters())
+
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="SOS dispatcher tools")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--incidents", type=int, default=200)
+    parser.add_argument("--contacts", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="simulated provider latency")
+    parser.add_argument("--fail-rate", type=float, default=0.1, help="fraction of sends that fail once")
+    args = parser.parse_args()
+
+    class FlakyFakeAdapter(FakeChannelAdapter):
+        async def send(self, address: str, message: str) -> Dict[str, Any]:
+            await asyncio.sleep(args.latency_ms / 1000 * random.uniform(0.5, 1.5))
+            if random.random() < args.fail_rate:
+                return _result(False, "Simulated channel failure")
+            return await super().send(address, message)
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        bench_db_name = os.environ.get("DB_NAME", "miraii") + "_bench_sos_dispatch"
+        db = client[bench_db_name]
+        dispatcher = SOSDispatcher({channel: FlakyFakeAdapter(channel) for channel in ("sms", "email")})
+        try:
+            await client.drop_database(bench_db_name)
+            await db.sos_incidents.create_index("incident_id")
+            dispatcher.start(db)
+            contacts = [
+                {"id": f"c{i}", "name": f"Contact {i}", "phone": f"+1555000{i:04d}", "email": f"c{i}@example.com"}
+                for i in range(args.contacts)
+            ]
+            for n in range(args.incidents):
+                incident_id = f"bench_{n}"
+                triggered_at = time.monotonic()
+                entries, deliveries = plan_deliveries(incident_id, contacts, "bench", dispatcher.channels)
+                await db.sos_incidents.insert_one({
+                    "incident_id": incident_id, "status": "active", "created_at": datetime.now(timezone.utc),
+                    "message_sent": "bench", "contacts_notified": entries
+                })
+                dispatcher.dispatch(incident_id, deliveries, triggered_at)
+            while dispatcher._incidents:
+                await asyncio.sleep(0.05)
+
+            statuses = await db.sos_incidents.aggregate([
+                {"$unwind": "$contacts_notified"},
+                {"$group": {"_id": "$contacts_notified.status", "count": {"$sum": 1}}}
+            ]).to_list(None)
+            print(f"deliveries by status: { {row['_id']: row['count'] for row in statuses} }")
+            print(f"trigger -> last attempt: {dispatcher.latency_percentiles()}")
+        finally:
+            await dispatcher.stop(drain_timeout=1.0)
+            await client.drop_database(bench_db_name)
+            client.close()
+
+    asyncio.run(main())
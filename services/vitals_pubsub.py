@@ -0,0 +1,139 @@
+"""
+Live Vitals Pub/Sub
+===================
+
+Fan-out of latest-vitals changes to connected dashboards (SSE):
+- 'local' source: the metric write path publishes directly (single worker)
+- 'changestream' source: a MongoDB change stream on latest_vitals publishes,
+  so every worker sees writes made by every other worker (needs a replica set)
+
+Subscribers get a bounded queue each; a slow subscriber loses its oldest
+deltas rather than holding memory or blocking writers.
+
+Environment Variables:
+- VITALS_PUBSUB_SOURCE: (Optional) 'local' or 'changestream' (default: 'local')
+"""
+
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Configuration
+# ============================================================
+
+VITALS_PUBSUB_SOURCE = os.getenv("VITALS_PUBSUB_SOURCE", "local").lower()
+SUBSCRIBER_QUEUE_SIZE = 32
+
+# ============================================================
+# Pub/Sub
+# ============================================================
+
+class VitalsPubSub:
+    """In-process per-user channels of latest-vitals deltas"""
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._watcher: Optional[asyncio.Task] = None
+
+    @property
+    def uses_change_stream(self) -> bool:
+        return VITALS_PUBSUB_SOURCE == "changestream"
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            self._subscribers.pop(user_id, None)
+
+    def publish(self, user_id: str, delta: Dict[str, Any]):
+        """Push {metric_type: newest doc} to every subscriber of user_id (never blocks)"""
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(delta)
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    # ------------------------------------------------------------
+    # Change stream source (multi-worker)
+    # ------------------------------------------------------------
+
+    def start_change_stream(self, db):
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch(db))
+
+    async def stop_change_stream(self):
+        if self._watcher is None:
+            return
+        self._watcher.cancel()
+        try:
+            await self._watcher
+        except asyncio.CancelledError:
+            pass
+        self._watcher = None
+
+    async def _watch(self, db):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        while True:
+            try:
+                async with db.latest_vitals.watch(pipeline, full_document="updateLookup") as stream:
+                    logger.info("Watching latest_vitals change stream")
+                    async for change in stream:
+                        self._publish_change(change)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"latest_vitals change stream failed: {e}; retrying in 5s")
+                await asyncio.sleep(5)
+
+    def _publish_change(self, change: Dict[str, Any]):
+        doc = change.get("fullDocument") or {}
+        user_id = doc.get("user_id")
+        metrics = doc.get("metrics") or {}
+        if not user_id or user_id not in self._subscribers:
+            return
+
+        if change["operationType"] == "update":
+            changed = set()
+            for field in change.get("updateDescription", {}).get("updatedFields", {}):
+                if field == "metrics":
+                    changed.update(metrics)
+                elif field.startswith("metrics."):
+                    changed.add(field.split(".")[1])
+            delta = {t: metrics[t] for t in changed if t in metrics}
+        else:
+            delta = metrics
+
+        if delta:
+            self.publish(user_id, delta)
+
+
+vitals_pubsub = VitalsPubSub()
+
+# ============================================================
+# SSE Helpers
+# ============================================================
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def format_sse(event: str, data: Any) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n".encode()